@@ -1,10 +1,12 @@
 SCRIPTS_DIR = "{scripts_dir}"
 NO_VAL = 4294967294
---util.py exit code
+--partition name -> TPU vmcount, generated by conf.py
+PART_VMCOUNTS = {partition_vmcounts}
+--get_vmcount error codes
 PART_INVALID = -1 --partition does not exists in config.yaml, thus do not exist in slurm
 DIFF_VMCOUNTS_SAME_PART = -2 --in the same partition there are nodesets with different vmcounts
 DIFF_PART_DIFFERENT_VMCOUNTS = -3 --partition is a list of partitions in which at least two of them have different vmcount
-UNKWOWN_ERROR = -4 --util.py did not return a valid response
+UNKWOWN_ERROR = -4 --no partition was given or found
 
 function get_part(job_desc,part_list)
     if job_desc.partition then
@@ -18,23 +20,32 @@ function get_part(job_desc,part_list)
     return nil
 end
 
-function os.capture(cmd, raw)
-    local handle = assert(io.popen(cmd, 'r'))
-    local output = assert(handle:read('*a'))
-    handle:close()
-    return output
-end
-
 function get_vmcount(part)
-    local cmd = SCRIPTS_DIR .. "/util.py -p " .. part
-    local out = os.capture(cmd,true)
-    for line in out:gmatch("(.-)\r?\n") do
-		local tag, val = line:match("([^:]+):([^:]+)")
-		if tag == "VMCOUNT" then
-			return tonumber(val)
-    	end
+	if part == nil then
+		return UNKWOWN_ERROR
+	end
+	local vmcount = nil
+	local different = false
+	for name in part:gmatch("[^,]+") do
+		local count = PART_VMCOUNTS[name]
+		if count == nil then
+			return PART_INVALID
+		end
+		if count == DIFF_VMCOUNTS_SAME_PART then
+			return count
+		end
+		if vmcount ~= nil and vmcount ~= count then
+			different = true
+		end
+		vmcount = count
+	end
+	if vmcount == nil then
+		return UNKWOWN_ERROR
+	end
+	if different then
+		return DIFF_PART_DIFFERENT_VMCOUNTS
 	end
-	return UNKWOWN_ERROR
+	return vmcount
 end
 
 
@@ -63,7 +74,7 @@ function slurm_job_submit(job_desc, part_list, submit_uid)
 	    return slurm.FAILURE
     end
 	if vmcount == UNKWOWN_ERROR then
-	    slurm.log_user("Something went wrong while executing util.py to get the vmcount.")
+	    slurm.log_user("Something went wrong while looking up the vmcount of the partition.")
 	    return slurm.ERROR
     end
     --This is surely a TPU node
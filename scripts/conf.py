@@ -381,6 +381,31 @@ def install_cgroup_conf(lkp=lkp):
     util.chown_slurm(conf_file, mode=0o600)
 
 
+def partition_vmcounts(lkp=lkp):
+    """Map partition names to the vmcount of their TPU nodesets, 0 if the
+    partition has no TPU nodesets and -2 if its TPU nodesets have different
+    vmcounts. These match the values printed by `util.py -p`.
+    """
+    DIFF_VMCOUNTS_SAME_PART = -2
+    nodeset_vmcounts = {
+        name: TPU(nodeset).vmcount for name, nodeset in lkp.cfg.nodeset_tpu.items()
+    }
+    vmcounts = {}
+    for name, part in lkp.cfg.partitions.items():
+        counts = {nodeset_vmcounts[ns] for ns in part.partition_nodeset_tpu}
+        if len(counts) > 1:
+            vmcounts[name] = DIFF_VMCOUNTS_SAME_PART
+        else:
+            vmcounts[name] = counts.pop() if counts else 0
+    return vmcounts
+
+
+def lua_table(d):
+    """format a dict of str -> int as a lua table constructor"""
+    items = ", ".join(f'["{k}"] = {v}' for k, v in sorted(d.items()))
+    return f"{{{items}}}"
+
+
 def install_jobsubmit_lua(lkp=lkp):
     """install job_submit.lua if there are tpu nodes in the cluster"""
     if any(
@@ -390,7 +415,9 @@ def install_jobsubmit_lua(lkp=lkp):
     ):
         conf_options = NSDict(
             {
-                "scripts_dir": cfg.slurm_scripts_dir or dirs.scripts,
+                "scripts_dir": lkp.cfg.slurm_scripts_dir or dirs.scripts,
+                # looked up here so job submission does not need API calls
+                "partition_vmcounts": lua_table(partition_vmcounts(lkp)),
             }
         )
         conf_resp = blob_get("slurm-tpl-job-submit-lua").download_as_text()
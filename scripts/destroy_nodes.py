@@ -21,9 +21,9 @@ from suspend import (
     batch_execute,
     delete_instance_request,
     truncate_iter,
-    wait_for_operations,
 )
 from util import lkp, compute, config_root_logger, parse_self_link
+from util import OperationTracker, operation_error, operation_failed
 
 logger_name = Path(__file__).name
 log = logging.getLogger(logger_name)
@@ -47,7 +47,16 @@ def delete_instances(compute_list):
         failed_nodes = [f"{n}: {e}" for n, (_, e) in failed.items()]
         node_str = "\n".join(str(el) for el in truncate_iter(failed_nodes, 5))
         log.error(f"some nodes failed to delete: {node_str}")
-    wait_for_operations(done.values())
+
+    tracker = OperationTracker()
+    tracker.update(done)
+    results = tracker.wait()
+    errors = [
+        f"{n}: {operation_error(r)}" for n, r in results.items() if operation_failed(r)
+    ]
+    if errors:
+        node_str = "\n".join(str(el) for el in truncate_iter(errors, 5))
+        log.error(f"some nodes failed to delete: {node_str}")
 
 
 def main(args):
@@ -16,7 +16,8 @@
 import argparse
 import logging
 from pathlib import Path
-from suspend import batch_execute, truncate_iter, wait_for_operations
+from suspend import batch_execute, truncate_iter
+from util import wait_for_operations
 from util import lkp, compute, config_root_logger, parse_self_link
 
 logger_name = Path(__file__).name
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Long running daemon for ResumeProgram and SuspendProgram requests.
+
+resume.py and suspend.py hand their nodelist (and resume data) to this daemon
+over a Unix socket, so API clients, connections, templates and plugins are
+kept warm between power save events instead of being set up by every fork.
+If the daemon is not running they handle the request themselves.
+"""
+
+import argparse
+import json
+import logging
+import os
+import socketserver
+import sys
+import threading
+from itertools import chain
+from pathlib import Path
+from time import sleep
+
+import util
+from util import CONFIG_FILE, POWERD_SOCKET, NSDict, cfg, lkp
+from util import to_hostlist, to_hostnames
+
+import resume
+import suspend
+
+filename = Path(__file__).name
+LOGFILE = (Path(cfg.slurm_log_dir if cfg else ".") / filename).with_suffix(".log")
+
+log = logging.getLogger(filename)
+
+# resume.py and suspend.py use module globals, so requests are handled one at
+# a time
+request_lock = threading.Lock()
+# seconds to wait for more resume requests to merge with the first one
+RESUME_COALESCE_WINDOW = 0.5
+
+
+def config_mtime():
+    try:
+        return CONFIG_FILE.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def refresh_lookup():
+    """Drop cached state that may have changed since the last request, so a
+    request is handled like it would be by resume.py or suspend.py. API
+    clients are kept, templates and machine types are read again from their
+    caches on disk, which check for changes.
+    """
+    lkp.clear_instances_cache()
+    lkp.slurm_nodes.cache_clear()
+    lkp.template_info.cache_clear()
+    lkp.machine_type_catalog.cache_clear()
+    resume.base_instance_properties.cache_clear()
+    resume.startup_script.cache_clear()
+
+
+def handle_request(request):
+    """run a resume or suspend request, returning the reply for the client"""
+    program = request.get("program")
+    nodelist = request.get("nodelist")
+    if program not in ("resume", "suspend") or not isinstance(nodelist, str):
+        return {"status": "error", "error": f"invalid request: {request}"}
+
+    refresh_lookup()
+    log.info(f"{program} {nodelist}")
+    try:
+        if program == "resume":
+            resume_data = request.get("resume_data")
+            resume.global_resume_data = (
+                NSDict(resume_data) if resume_data is not None else None
+            )
+            resume.main(nodelist, request.get("force", False))
+        else:
+            suspend.main(nodelist)
+    except Exception as e:
+        log.exception(f"{program} {nodelist} failed")
+        return {"status": "error", "error": str(e)}
+    finally:
+        resume.global_resume_data = None
+    return {"status": "ok"}
+
+
+def merge_resume_requests(requests):
+    """Merge resume requests into one, so nodes from all of them can share
+    bulkInsert calls. Jobs keep their own entries, so per-job placement and
+    labels are unchanged.
+    """
+    if len(requests) == 1:
+        return requests[0]
+    nodes = dict.fromkeys(
+        chain.from_iterable(to_hostnames(r["nodelist"]) for r in requests)
+    )
+    jobs = {}
+    all_nodes_resume = []
+    for request in requests:
+        resume_data = request.get("resume_data") or {}
+        all_nodes_resume.extend(to_hostnames(resume_data.get("all_nodes_resume", "")))
+        for job in resume_data.get("jobs", []):
+            if job["job_id"] in jobs:
+                # the same job resumed by separate calls, combine its nodes
+                merged = jobs[job["job_id"]]
+                merged["nodes_resume"] = to_hostlist(
+                    set(to_hostnames(merged["nodes_resume"]))
+                    | set(to_hostnames(job["nodes_resume"]))
+                )
+            else:
+                jobs[job["job_id"]] = dict(job)
+    resume_data = None
+    if jobs or all_nodes_resume:
+        resume_data = {
+            "all_nodes_resume": to_hostlist(set(all_nodes_resume)),
+            "jobs": list(jobs.values()),
+        }
+    return {
+        "program": "resume",
+        "nodelist": to_hostlist(nodes),
+        "force": any(r.get("force", False) for r in requests),
+        "resume_data": resume_data,
+    }
+
+
+class ResumeBatch:
+    """resume requests waiting to be handled together"""
+
+    def __init__(self):
+        self.requests = []
+        self.reply = None
+        self.done = threading.Event()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError as e:
+            reply = {"status": "error", "error": f"invalid request: {e}"}
+        else:
+            if request.get("program") == "resume":
+                reply = self.server.coalesce(request)
+            else:
+                with request_lock:
+                    reply = self.server.check_config() or handle_request(request)
+        self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        socket_path = Path(socket_path)
+        # remove the socket left by a previous run
+        socket_path.unlink(missing_ok=True)
+        super().__init__(str(socket_path), RequestHandler)
+        os.chmod(socket_path, 0o600)
+        self.config_mtime = config_mtime()
+        self.batch = None
+        self.batch_lock = threading.Lock()
+
+    def check_config(self):
+        """restart reply if config.yaml changed since the daemon started"""
+        if config_mtime() == self.config_mtime:
+            return None
+        # cfg and lkp are imported by name everywhere, so restart to reload
+        # the config. The clients handle their requests themselves.
+        log.info(f"{CONFIG_FILE} changed, restarting")
+        threading.Thread(target=self.shutdown).start()
+        return {"status": "restart"}
+
+    def coalesce(self, request):
+        """Handle a resume request together with the other resume requests
+        that arrive within the coalescing window, or while an earlier batch
+        is still running.
+        """
+        with self.batch_lock:
+            batch = self.batch
+            leader = batch is None
+            if leader:
+                batch = self.batch = ResumeBatch()
+            batch.requests.append(request)
+        if not leader:
+            batch.done.wait()
+            return batch.reply
+
+        sleep(cfg.get("resume_coalesce_window", RESUME_COALESCE_WINDOW))
+        try:
+            with request_lock:
+                with self.batch_lock:
+                    # later requests start a new batch
+                    self.batch = None
+                requests = batch.requests
+                batch.reply = self.check_config()
+                if batch.reply is None:
+                    if len(requests) > 1:
+                        log.info(f"coalesced {len(requests)} resume requests")
+                    batch.reply = handle_request(merge_resume_requests(requests))
+        except Exception as e:
+            log.exception("failed to handle resume requests")
+            batch.reply = {"status": "error", "error": str(e)}
+        finally:
+            batch.done.set()
+        return batch.reply
+
+
+def main(socket_path):
+    server = Server(socket_path)
+    log.info(f"listening on {socket_path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        Path(socket_path).unlink(missing_ok=True)
+
+
+parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+)
+parser.add_argument(
+    "--socket",
+    type=Path,
+    default=POWERD_SOCKET,
+    help="Path of the Unix socket to listen on",
+)
+parser.add_argument(
+    "--debug",
+    "-d",
+    dest="loglevel",
+    action="store_const",
+    const=logging.DEBUG,
+    default=logging.INFO,
+    help="Enable debugging output",
+)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if cfg.enable_debug_logging:
+        args.loglevel = logging.DEBUG
+    util.chown_slurm(LOGFILE, mode=0o600)
+    util.config_root_logger(filename, level=args.loglevel, logfile=LOGFILE)
+    for logger in (resume.log, suspend.log):
+        logger.disabled = False
+    sys.excepthook = util.handle_exception
+
+    main(args.socket)
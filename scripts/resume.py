@@ -22,24 +22,27 @@ import logging
 import os
 import sys
 import yaml
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from itertools import chain
 from pathlib import Path
+from time import time
 
 import util
 from util import (
+    batch_execute,
     chunked,
     dirs,
     ensure_execute,
     execute_with_futures,
     get_insert_operations,
     log_api_request,
-    map_with_futures,
     run,
     separate,
     to_hostlist,
     to_hostnames,
     trim_self_link,
-    wait_for_operation,
+    wait_for_operations_as_completed,
 )
 from util import cfg, lkp, NSDict, TPU
 
@@ -62,9 +65,47 @@ PLACEMENT_MAX_CNT = 150
 BULK_INSERT_LIMIT = 5000
 
 
-def instance_properties(nodeset, model, placement_group, labels=None):
-    template = lkp.node_template(model)
-    template_info = lkp.template_info(template)
+@lru_cache(maxsize=None)
+def startup_script(scripts_dir):
+    return (Path(scripts_dir) / "startup.sh").read_text()
+
+
+def copy_nsdict(props):
+    """shallow copy, the values are shared with props"""
+    copy = NSDict()
+    for key, value in props.items():
+        copy[key] = value
+    return copy
+
+
+def label_disks(disks, labels):
+    """copies of disks with labels added, local ssds are not labeled"""
+    labeled = []
+    for disk in disks:
+        if (
+            "diskType" not in disk.initializeParams
+            or disk.initializeParams.diskType == "local-ssd"
+        ):
+            labeled.append(disk)
+            continue
+        params = NSDict()
+        for key, value in disk.initializeParams.items():
+            params[key] = value
+        params.labels = {**disk.initializeParams.get("labels", {}), **labels}
+        disk = copy_nsdict(disk)
+        disk.initializeParams = params
+        labeled.append(disk)
+    return labeled
+
+
+@lru_cache(maxsize=None)
+def base_instance_properties(nodeset_name):
+    """The instanceProperties shared by all bulkInserts of a nodeset. They are
+    built once and shared, so they must not be modified. instance_properties
+    overlays job labels and placement on a shallow copy.
+    """
+    nodeset = lkp.cfg.nodeset[nodeset_name]
+    template_info = lkp.template_info(nodeset.instance_template)
 
     props = NSDict()
 
@@ -86,9 +127,7 @@ def instance_properties(nodeset, model, placement_group, labels=None):
     slurm_metadata = {
         "slurm_cluster_name": cfg.slurm_cluster_name,
         "slurm_instance_role": "compute",
-        "startup-script": (
-            Path(cfg.slurm_scripts_dir or util.dirs.scripts) / "startup.sh"
-        ).read_text(),
+        "startup-script": startup_script(cfg.slurm_scripts_dir or util.dirs.scripts),
         "VmDnsSetting": "GlobalOnly",
     }
     info_metadata = {
@@ -103,19 +142,27 @@ def instance_properties(nodeset, model, placement_group, labels=None):
     labels = {
         "slurm_cluster_name": cfg.slurm_cluster_name,
         "slurm_instance_role": "compute",
-        **(labels or {}),
     }
     props.labels = {**template_info.labels, **labels}
+    # template_info is cached too, label copies of its disks
+    props.disks = label_disks(template_info.disks, labels)
 
-    for disk in template_info.disks:
-        # do not label local ssd
-        if (
-            "diskType" not in disk.initializeParams
-            or disk.initializeParams.diskType == "local-ssd"
-        ):
-            continue
-        disk.initializeParams.labels.update(labels)
-    props.disks = template_info.disks
+    if nodeset.reservation_name:
+        props.reservationAffinity = {
+            "consumeReservationType": "SPECIFIC_RESERVATION",
+            "key": "compute.googleapis.com/reservation-name",
+            "values": [nodeset.reservation_name],
+        }
+
+    return props
+
+
+def instance_properties(nodeset, placement_group, labels=None):
+    base = base_instance_properties(nodeset.nodeset_name)
+    props = copy_nsdict(base)
+    if labels:
+        props.labels = {**base.labels, **labels}
+        props.disks = label_disks(base.disks, labels)
 
     if placement_group:
         props.scheduling = {
@@ -126,13 +173,6 @@ def instance_properties(nodeset, model, placement_group, labels=None):
             placement_group,
         ]
 
-    if nodeset.reservation_name:
-        props.reservationAffinity = {
-            "consumeReservationType": "SPECIFIC_RESERVATION",
-            "key": "compute.googleapis.com/reservation-name",
-            "values": [nodeset.reservation_name],
-        }
-
     return props
 
 
@@ -143,8 +183,14 @@ def per_instance_properties(node):
     return props
 
 
-def create_instances_request(nodes, partition_name, placement_group, job_id=None):
-    """Call regionInstances.bulkInsert to create instances"""
+# a bulkInsert request of a resume plan
+BulkInsert = collections.namedtuple("BulkInsert", ["region", "nodes", "body"])
+
+
+def bulk_insert_body(nodes, partition_name, placement_group, job_id=None, plugins=True):
+    """regionInstances.bulkInsert region and body to create instances. Without
+    plugins the slurm_gcp_plugins hooks are not run.
+    """
     assert len(nodes) > 0
     if placement_group:
         assert len(nodes) <= min(PLACEMENT_MAX_CNT, BULK_INSERT_LIMIT)
@@ -157,7 +203,6 @@ def create_instances_request(nodes, partition_name, placement_group, job_id=None
     template = lkp.node_template(model)
     region = lkp.node_region(model)
     partition = cfg.partitions[partition_name]
-    log.debug(f"create_instances_request: {model} placement: {placement_group}")
 
     body = NSDict()
     body.count = len(nodes)
@@ -172,9 +217,7 @@ def create_instances_request(nodes, partition_name, placement_group, job_id=None
         else None
     )
     # overwrites properties across all instances
-    body.instanceProperties = instance_properties(
-        nodeset, model, placement_group, labels
-    )
+    body.instanceProperties = instance_properties(nodeset, placement_group, labels)
 
     # key is instance name, value overwrites properties
     body.perInstanceProperties = {k: per_instance_properties(k) for k in nodes}
@@ -193,125 +236,130 @@ def create_instances_request(nodes, partition_name, placement_group, job_id=None
     if zones:
         body.locationPolicy.locations = zones
 
-    if lkp.cfg.enable_slurm_gcp_plugins:
+    if plugins and lkp.cfg.enable_slurm_gcp_plugins:
+        # plugins may modify the body in place, keep them off the shared parts
+        body.instanceProperties = body.instanceProperties.deepcopy()
         slurm_gcp_plugins.pre_instance_bulk_insert(
             lkp=lkp,
             nodes=nodes,
             placement_group=placement_group,
             request_body=body,
         )
+    return BulkInsert(region, nodes, body)
+
 
+def bulk_insert_request(insert):
+    """regionInstances.bulkInsert request for a planned BulkInsert"""
     request = util.compute.regionInstances().bulkInsert(
-        project=cfg.project, region=region, body=body.to_dict()
+        project=cfg.project, region=insert.region, body=insert.body.to_dict()
     )
 
     if log.isEnabledFor(logging.DEBUG):
         log.debug(
-            f"new request: endpoint={request.methodId} nodes={to_hostlist(nodes)}"
+            f"new request: endpoint={request.methodId} nodes={to_hostlist(insert.nodes)}"
         )
     log_api_request(request)
     return request
 
 
+def create_instances_request(nodes, partition_name, placement_group, job_id=None):
+    """Call regionInstances.bulkInsert to create instances"""
+    log.debug(f"create_instances_request: {nodes[0]} placement: {placement_group}")
+    return bulk_insert_request(
+        bulk_insert_body(nodes, partition_name, placement_group, job_id)
+    )
+
+
 def expand_nodelist(nodelist):
     """expand nodes in hostlist to hostnames"""
     if not nodelist:
         return []
 
-    # TODO use a python library instead?
-    nodes = run(f"{lkp.scontrol} show hostnames {nodelist}").stdout.splitlines()
-    return nodes
+    return to_hostnames(nodelist)
+
+
+BulkChunk = collections.namedtuple(
+    "BulkChunk",
+    ["prefix", "job_id", "partition_name", "placement_group", "nodes", "i"],
+)
+BulkChunkTPU = collections.namedtuple(
+    "BulkChunkTPU",
+    ["prefix", "job_id", "partition_name", "nodes", "i"],
+)
+# placement_groups are the placement policies to create, bulk_groups and
+# tpu_groups the nodes of each bulkInsert or TPU group, inserts the bulkInsert
+# requests by the same group names as bulk_groups, policies the request body
+# of each placement policy and leased the pool policies used instead of some
+ResumePlan = collections.namedtuple(
+    "ResumePlan",
+    ["placement_groups", "bulk_groups", "tpu_groups", "inserts", "policies", "leased"],
+)
+# a placement policy of a resume plan
+PlacementGroup = collections.namedtuple("PlacementGroup", ["region", "nodes"])
 
 
 def group_nodes_bulk(nodes, resume_data=None):
-    """group nodes by job_id, placement_group, node_group, and max bulkInsert size"""
+    """Group nodes by job_id, placement_group, node_group, and max bulkInsert
+    size. Returns the groups and the placement policies they need.
+    """
     if resume_data is None:
         # all nodes will be considered jobless
-        jobs = {}
+        jobs = []
     else:
-        jobs = {job.job_id: job for job in resume_data.jobs}
-
-    # expand all job nodelists
-    for job in jobs.values():
-        job.nodelist_alloc = job.nodes_alloc
-        job.nodes_alloc = expand_nodelist(job.nodelist_alloc)
-        job.nodelist_resume = job.nodes_resume
-        job.nodes_resume = expand_nodelist(job.nodelist_resume)
-        job.tpu = util.part_is_tpu(job.partition)
-        if not job.tpu:
-            # create placement groups if nodes for job need it
-            job.placement_groups = create_placement_groups(
-                node_list=job.nodes_alloc,
-                job_id=job.job_id,
-            )
-            # placement group assignment is based on all allocated nodes, but we only want to
-            # handle nodes in nodes_resume in this run.
-            for pg, pg_nodes in job.placement_groups.items():
-                job.placement_groups[pg] = list(
-                    set(pg_nodes).intersection(job.nodes_resume)
-                )
-    # a bit of a hack, but nodes resumed using scontrol instead of through job scheduling do not have a job
-    jobless_nodes = list(
-        set(nodes).difference(
-            chain.from_iterable(job.nodes_resume for job in jobs.values())
+        jobs = resume_data.jobs
+
+    placement_groups = {}
+    # (job_id, partition, tpu, {placement group: nodes})
+    job_groups = []
+    job_nodes = set()
+    for job in jobs:
+        nodes_resume = expand_nodelist(job.nodes_resume)
+        job_nodes.update(nodes_resume)
+        if util.part_is_tpu(job.partition):
+            job_groups.append((job.job_id, job.partition, True, {None: nodes_resume}))
+            continue
+        # placement group assignment is based on all allocated nodes, but we
+        # only want to handle nodes in nodes_resume in this run.
+        groups = placement_group_plan(expand_nodelist(job.nodes_alloc), job.job_id)
+        placement_groups.update(
+            (group, PlacementGroup(lkp.node_region(pg_nodes[0]), pg_nodes))
+            for group, pg_nodes in groups.items()
+            if group is not None
         )
-    )
-    jobless_nodes_tpu = []
-    for jobless_node in jobless_nodes[:]:
-        if lkp.node_is_tpu(jobless_node):
-            jobless_nodes.remove(jobless_node)
-            jobless_nodes_tpu.append(jobless_node)
-
-    jobs["Normal_None"] = NSDict(
-        job_id=None,
-        nodes_resume=jobless_nodes,
-        nodes_alloc=jobless_nodes,
-        placement_groups=create_placement_groups(node_list=jobless_nodes),
-        partition=None,
-        tpu=False,
-    )
-    jobs["TPU_None"] = NSDict(
-        job_id=None,
-        nodes_resume=jobless_nodes_tpu,
-        nodes_alloc=jobless_nodes_tpu,
-        partition=None,
-        tpu=True,
-    )
+        resumed = set(nodes_resume)
+        groups = {
+            group: [node for node in pg_nodes if node in resumed]
+            for group, pg_nodes in groups.items()
+        }
+        job_groups.append((job.job_id, job.partition, False, groups))
 
-    BulkChunk = collections.namedtuple(
-        "BulkChunk",
-        ["prefix", "job_id", "partition_name", "placement_group", "nodes", "i"],
+    # a bit of a hack, but nodes resumed using scontrol instead of through job
+    # scheduling do not have a job
+    jobless_nodes, jobless_nodes_tpu = separate(
+        lkp.node_is_tpu, [node for node in nodes if node not in job_nodes]
     )
-    BulkChunkTPU = collections.namedtuple(
-        "BulkChunkTPU",
-        ["prefix", "job_id", "partition_name", "nodes", "i"],
+    groups = placement_group_plan(jobless_nodes) if jobless_nodes else {}
+    placement_groups.update(
+        (group, PlacementGroup(lkp.node_region(pg_nodes[0]), pg_nodes))
+        for group, pg_nodes in groups.items()
+        if group is not None
     )
+    job_groups.append((None, None, False, groups))
+    job_groups.append((None, None, True, {None: jobless_nodes_tpu}))
+
     grouped_nodes = [
-        BulkChunk(
-            prefix,
-            job_id if job_id != "Normal_None" else None,
-            jobs[job_id].partition,
-            placement_group,
-            chunk_nodes,
-            i,
-        )
-        for job_id, job in jobs.items()
-        if not job.tpu
-        for placement_group, pg_nodes in job.placement_groups.items()
+        BulkChunk(prefix, job_id, partition, placement_group, chunk_nodes, i)
+        for job_id, partition, tpu, groups in job_groups
+        if not tpu
+        for placement_group, pg_nodes in groups.items()
         for prefix, nodes in util.groupby_unsorted(pg_nodes, lkp.node_prefix)
         for i, chunk_nodes in enumerate(chunked(nodes, n=BULK_INSERT_LIMIT))
     ]
     grouped_nodes_tpu = [
-        BulkChunkTPU(
-            prefix,
-            job_id if job_id != "TPU_None" else None,
-            jobs[job_id].partition,
-            chunk_nodes,
-            i,
-        )
-        for job_id, job in jobs.items()
-        if job.tpu
-        for prefix, nodes in util.groupby_unsorted(job.nodes_resume, lkp.node_prefix)
+        BulkChunkTPU(prefix, job_id, partition, chunk_nodes, i)
+        for job_id, partition, tpu, groups in job_groups
+        if tpu
+        for prefix, nodes in util.groupby_unsorted(groups[None], lkp.node_prefix)
         for i, chunk_nodes in enumerate(lkp.chunk_tpu_nodes(list(nodes)))
     ]
 
@@ -329,7 +377,68 @@ def group_nodes_bulk(nodes, resume_data=None):
 
     grouped_nodes = {group_name(chunk): chunk for chunk in grouped_nodes}
     grouped_nodes_tpu = {group_name_tpu(chunk): chunk for chunk in grouped_nodes_tpu}
-    return grouped_nodes, grouped_nodes_tpu
+    return placement_groups, grouped_nodes, grouped_nodes_tpu
+
+
+def plan_resume(nodes, resume_data=None, lease=False, plugins=True):
+    """Plan resuming nodes, without calling Slurm or changing anything in GCP:
+    the placement policies to create and the bulkInsert requests. Only the
+    instance templates are read, which may get them from the API. resume_data
+    is the content of the resume file, it is not modified. With lease, the
+    placement groups the placement policy pool has a policy for use it
+    instead of creating their own. Without plugins the slurm_gcp_plugins
+    hooks, which may call anything, are not run on the request bodies.
+    """
+    placement_groups, grouped_nodes, grouped_tpu_nodes = group_nodes_bulk(
+        nodes, resume_data
+    )
+    policies = {
+        group: placement_policy_body(group, pg.region, plugins)
+        for group, pg in placement_groups.items()
+    }
+    leased = lease_placement_groups(placement_groups, policies) if lease else {}
+    placement_groups = {
+        group: pg for group, pg in placement_groups.items() if group not in leased
+    }
+    inserts = {
+        group: bulk_insert_body(
+            chunk.nodes,
+            chunk.partition_name,
+            leased.get(chunk.placement_group, chunk.placement_group),
+            chunk.job_id,
+            plugins,
+        )
+        for group, chunk in grouped_nodes.items()
+    }
+    return ResumePlan(
+        placement_groups, grouped_nodes, grouped_tpu_nodes, inserts, policies, leased
+    )
+
+
+def plan_to_dict(plan):
+    """ResumePlan as plain data, with nodes as hostlists"""
+    return {
+        "placement_groups": {
+            group: {
+                "region": pg.region,
+                "nodes": to_hostlist(pg.nodes),
+                "body": plan.policies[group],
+            }
+            for group, pg in plan.placement_groups.items()
+        },
+        "leased_placement_groups": dict(plan.leased),
+        "bulk_inserts": {
+            group: {
+                "region": insert.region,
+                "nodes": to_hostlist(insert.nodes),
+                "body": insert.body.to_dict(),
+            }
+            for group, insert in plan.inserts.items()
+        },
+        "tpu_groups": {
+            group: to_hostlist(chunk.nodes) for group, chunk in plan.tpu_groups.items()
+        },
+    }
 
 
 def start_tpu(data):
@@ -371,10 +480,15 @@ def resume_nodes(nodes, resume_data=None):
         return
 
     if resume_data is None and global_resume_data is not None:
-        resume_data = global_resume_data.deepcopy()
+        resume_data = global_resume_data
+
+    # slurm marks the nodes down after ResumeTimeout, no use waiting longer
+    resume_timeout = lkp.cfg.cloud_parameters.get("resume_timeout", 300)
+    deadline = time() + resume_timeout
 
     nodes = sorted(nodes, key=lkp.node_prefix)
-    grouped_nodes, grouped_tpu_nodes = group_nodes_bulk(nodes, resume_data)
+    plan = plan_resume(nodes, resume_data, lease=True)
+    grouped_nodes, grouped_tpu_nodes = plan.bulk_groups, plan.tpu_groups
 
     if log.isEnabledFor(logging.DEBUG):
         # grouped_nodelists is used in later debug logs too
@@ -403,17 +517,7 @@ def resume_nodes(nodes, resume_data=None):
 
         tpu_start_data.append({"tpu": tpu_objs[chunk.prefix], "node": chunk.nodes})
 
-    # make all bulkInsert requests and execute with batch
-    inserts = {
-        group: create_instances_request(
-            chunk.nodes, chunk.partition_name, chunk.placement_group, chunk.job_id
-        )
-        for group, chunk in grouped_nodes.items()
-    }
-
-    bulk_ops = dict(
-        zip(inserts.keys(), map_with_futures(ensure_execute, inserts.values()))
-    )
+    bulk_ops = start_bulk_inserts(plan, deadline)
     log.debug(f"bulk_ops={yaml.safe_dump(bulk_ops)}")
     started = {
         group: op for group, op in bulk_ops.items() if not isinstance(op, Exception)
@@ -435,16 +539,17 @@ def resume_nodes(nodes, resume_data=None):
             log.debug(
                 f"new bulkInsert operation started: group={group} nodes={group_nodes} name={name} operationGroupId={gid}"
             )
-    # wait for all bulkInserts to complete and log any errors
-    bulk_operations = {group: wait_for_operation(op) for group, op in started.items()}
-
-    # Start TPU after regular nodes so that regular nodes are not affected by the slower TPU nodes
-    log.debug(f"tpu_start_data={yaml.safe_dump(tpu_start_data)}")
-    execute_with_futures(start_tpu, tpu_start_data)
-
+    # wait for all bulkInserts to complete and log any errors, handling each
+    # group as soon as its operation is done
     all_successful_inserts = []
 
-    for group, bulk_op in bulk_operations.items():
+    for group, bulk_op in wait_for_operations_as_completed(started, deadline=deadline):
+        if isinstance(bulk_op, Exception):
+            group_nodes = to_hostlist(grouped_nodes[group].nodes)
+            log.error(
+                f"failed to wait for bulkInsert operation: {bulk_op} nodes={group_nodes}"
+            )
+            continue
         group_id = bulk_op["operationGroupId"]
         bulk_op_name = bulk_op["name"]
         if "error" in bulk_op:
@@ -485,6 +590,47 @@ def resume_nodes(nodes, resume_data=None):
             log.info(f"created {len(ready_nodes)} instances: nodes={ready_nodelist}")
             all_successful_inserts.extend(successful_inserts)
 
+    # Start TPU after regular nodes so that regular nodes are not affected by the slower TPU nodes
+    log.debug(f"tpu_start_data={yaml.safe_dump(tpu_start_data)}")
+    execute_with_futures(start_tpu, tpu_start_data)
+
+
+def start_bulk_inserts(plan, deadline=None):
+    """Send the bulkInserts of a plan, returning {group: operation or
+    exception}. Groups without placement, or with a policy leased from the
+    placement policy pool, start right away, the others as soon as their own
+    placement policy is ready, while the rest of the policies are still being
+    created.
+    """
+    ready = []
+    waiting = collections.defaultdict(list)
+    for group, chunk in plan.bulk_groups.items():
+        if chunk.placement_group in plan.placement_groups:
+            waiting[chunk.placement_group].append(group)
+        else:
+            ready.append(group)
+
+    with ThreadPoolExecutor() as exe:
+        futures = {}
+
+        def start(groups):
+            for group in groups:
+                request = bulk_insert_request(plan.inserts[group])
+                futures[group] = exe.submit(ensure_execute, request)
+
+        start(ready)
+        for placement_group in create_placement_groups(
+            plan.placement_groups, plan.policies, deadline=deadline
+        ):
+            start(waiting.pop(placement_group, []))
+        # not expected, but do not leave nodes behind
+        start(chain.from_iterable(waiting.values()))
+
+        return {
+            group: future.exception() or future.result()
+            for group, future in futures.items()
+        }
+
 
 def update_job_comment(nodelist: list, comment: str):
     resume_data = global_resume_data
@@ -499,7 +645,7 @@ def update_job_comment(nodelist: list, comment: str):
     job_list = (
         job
         for job in resume_data.jobs
-        if any(map(lambda each: each in nodelist, to_hostnames(job.nodelist_resume)))
+        if any(map(lambda each: each in nodelist, to_hostnames(job.nodes_resume)))
     )
     for job in job_list:
         run(f"{lkp.scontrol} update jobid={job.job_id} admincomment='{comment}'")
@@ -520,7 +666,7 @@ def hold_job(job_id, reason):
     run(f"{lkp.scontrol} update jobid={job_id} comment='{reason}'")
 
 
-def create_placement_request(pg_name, region):
+def placement_policy_body(pg_name, region, plugins=True):
     config = {
         "name": pg_name,
         "region": region,
@@ -528,86 +674,131 @@ def create_placement_request(pg_name, region):
             "collocation": "COLLOCATED",
         },
     }
-    if lkp.cfg.enable_slurm_gcp_plugins:
+    if plugins and lkp.cfg.enable_slurm_gcp_plugins:
         slurm_gcp_plugins.pre_placement_group_insert(
             lkp=lkp, pg_name=pg_name, region=region, request_body=config
         )
+    return config
+
+
+def create_placement_request(pg_name, region, body=None):
+    if body is None:
+        body = placement_policy_body(pg_name, region)
     request = util.compute.resourcePolicies().insert(
-        project=cfg.project, region=region, body=config
+        project=cfg.project, region=region, body=body
     )
     log_api_request(request)
     return request
 
 
-def create_placement_groups(node_list: list, job_id=0):
+def lease_placement_groups(groups, policies):
+    """Lease policies from the placement policy pool for the placement
+    groups of a plan, {name: PlacementGroup}, with the policy request bodies
+    they would be created with. Returns {name: pool policy} for the groups
+    that do not need their own policy created.
+    """
+    if cfg.get("placement_pool_size", 0) <= 0 or not groups:
+        return {}
+    wanted = {}
+    for group, pg in groups.items():
+        # plugins like max_hops set the maxDistance a job needs
+        max_distance = policies[group]["groupPlacementPolicy"].get("maxDistance")
+        # f"{cluster}-{nodeset}-{job_id}-{i}"
+        job_id = group.rsplit("-", 2)[1]
+        wanted[group] = (pg.region, max_distance, job_id)
+    leased = util.placement_pool.lease(wanted)
+    if leased:
+        log.info(
+            f"leased {len(leased)} placement policies from the pool: {to_hostlist(leased.values())}"
+        )
+    return leased
+
+
+def placement_group_plan(node_list: list, job_id=0):
+    """Placement groups for nodes as {group name: nodes}. Nodes without
+    placement are under None.
+    """
     pgs = {}
-    node_map = lkp.nodeset_map(node_list)
-    for _, nodes in node_map.items():
-        pgs.update(create_nodeset_placement_groups(nodes, job_id=job_id))
+    for _, nodes in lkp.nodeset_map(node_list).items():
+        for group, pg_nodes in nodeset_placement_group_plan(nodes, job_id).items():
+            pgs.setdefault(group, []).extend(pg_nodes)
     return pgs
 
 
-def create_nodeset_placement_groups(node_list: list, job_id=0):
+def nodeset_placement_group_plan(node_list: list, job_id=0):
     model = next(iter(node_list))
     nodeset = lkp.node_nodeset(model)
     if not nodeset.enable_placement:
         return {None: node_list}
     if not valid_placement_nodes(job_id, node_list):
         return {None: node_list}
-    region = lkp.node_region(model)
-
-    groups = {
+    return {
         f"{cfg.slurm_cluster_name}-{nodeset.nodeset_name}-{job_id}-{i}": nodes
         for i, nodes in enumerate(chunked(node_list, n=PLACEMENT_MAX_CNT))
     }
 
+
+def create_placement_groups(groups, policies=None, deadline=None):
+    """Create the placement policies of a plan, {name: PlacementGroup}, with
+    batched inserts of their request bodies in policies, if given. Yields the
+    name of each policy once it can be used, or failed to be created, so the
+    bulkInserts waiting on it can start.
+    """
+    policies = policies or {}
+    if not groups:
+        return
     if log.isEnabledFor(logging.DEBUG):
-        debug_groups = {group: to_hostlist(nodes) for group, nodes in groups.items()}
+        debug_groups = {group: to_hostlist(pg.nodes) for group, pg in groups.items()}
         log.debug(
             f"creating {len(groups)} placement groups: \n{yaml.safe_dump(debug_groups).rstrip()}"
         )
     requests = {
-        group: create_placement_request(group, region)
-        for group, incl_nodes in groups.items()
+        group: create_placement_request(group, pg.region, policies.get(group))
+        for group, pg in groups.items()
     }
-    ops = dict(
-        zip(requests.keys(), map_with_futures(ensure_execute, requests.values()))
-    )
+    submitted, errors = batch_execute(requests)
+
+    def already_exists(exc):
+        details = getattr(exc, "error_details", None)
+        return bool(details) and all(
+            e.get("reason") == "alreadyExists" for e in details
+        )
 
-    def classify_result(item):
-        op = item[1]
-        if not isinstance(op, Exception):
-            return "submitted"
-        if all(e.get("reason") == "alreadyExists" for e in op.error_details):
-            return "redundant"
-        return "failed"
-
-    grouped_ops = dict(util.groupby_unsorted(list(ops.items()), classify_result))
-    submitted, redundant, failed = (
-        dict(grouped_ops.get(key, {})) for key in ("submitted", "redundant", "failed")
+    failed, redundant = separate(
+        lambda item: already_exists(item[1][1]), errors.items()
     )
     if redundant:
         log.warning(
-            "placement policies already exist: {}".format(",".join(redundant.keys()))
+            "placement policies already exist: {}".format(
+                ",".join(group for group, _ in redundant)
+            )
         )
     if failed:
-        reqs = [f"{e}" for _, e in failed.values()]
+        reqs = [f"{e}" for _, (_, e) in failed]
         log.fatal("failed to create placement policies: {}".format("; ".join(reqs)))
-    operations = {group: wait_for_operation(op) for group, op in submitted.items()}
-    for group, op in operations.items():
-        if "error" in op:
-            msg = "; ".join(
-                f"{err['code']}: {err['message'] if 'message' in err else 'no message'}"
-                for err in op["error"]["errors"]
-            )
-            log.error(
-                f"placement group failed to create: '{group}' ({op['name']}): {msg}"
-            )
+    # the bulkInserts of failed policies fail too and down their nodes
+    for group, _ in chain(redundant, failed):
+        yield group
+
+    operations = {}
+    for group, op in wait_for_operations_as_completed(submitted, deadline=deadline):
+        if isinstance(op, Exception):
+            log.error(f"placement group failed to create: '{group}': {op}")
+        else:
+            operations[group] = op
+            if "error" in op:
+                msg = "; ".join(
+                    f"{err['code']}: {err['message'] if 'message' in err else 'no message'}"
+                    for err in op["error"]["errors"]
+                )
+                log.error(
+                    f"placement group failed to create: '{group}' ({op['name']}): {msg}"
+                )
+        yield group
 
     log.info(
         f"created {len(operations)} placement groups ({to_hostlist(operations.keys())})"
     )
-    return groups
 
 
 def valid_placement_nodes(job_id, nodelist):
@@ -629,8 +820,8 @@ def valid_placement_nodes(job_id, nodelist):
     return True
 
 
-def get_resume_file_data():
-    SLURM_RESUME_FILE = os.getenv("SLURM_RESUME_FILE")
+def get_resume_file_data(resume_file=None):
+    SLURM_RESUME_FILE = resume_file or os.getenv("SLURM_RESUME_FILE")
     if SLURM_RESUME_FILE is None:
         log.warning(
             "SLURM_RESUME_FILE was not in environment. Cannot get detailed job, node, partition allocation data."
@@ -671,6 +862,18 @@ def main(nodelist, force=False):
         )
 
 
+def print_plan(nodelist, resume_data=None):
+    """Print the resume plan for nodelist as JSON, without resuming anything.
+    The placement policy pool is not leased from and plugin hooks are not
+    run, so the requests are shown as they are before plugins change them.
+    """
+    cloud_nodes, _ = lkp.filter_nodes(expand_nodelist(nodelist))
+    plan = plan_resume(
+        sorted(cloud_nodes, key=lkp.node_prefix), resume_data, plugins=False
+    )
+    print(json.dumps(plan_to_dict(plan), indent=2))
+
+
 parser = argparse.ArgumentParser(
     description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
 )
@@ -682,6 +885,15 @@ parser.add_argument(
     action="store_true",
     help="Force attempted creation of the nodelist, whether nodes are exclusive or not.",
 )
+parser.add_argument(
+    "--plan-only",
+    action="store_true",
+    help="Print the placement groups and bulkInsert requests as JSON instead of resuming. Only instance templates are read, plugin hooks are not run and the placement policy pool is not used.",
+)
+parser.add_argument(
+    "--resume-file",
+    help="Resume file to use instead of SLURM_RESUME_FILE",
+)
 parser.add_argument(
     "--debug",
     "-d",
@@ -711,5 +923,19 @@ if __name__ == "__main__":
     util.config_root_logger(filename, level=args.loglevel, logfile=LOGFILE)
     sys.excepthook = util.handle_exception
 
-    global_resume_data = get_resume_file_data()
-    main(args.nodelist, args.force)
+    global_resume_data = get_resume_file_data(args.resume_file)
+    if args.plan_only:
+        print_plan(args.nodelist, global_resume_data)
+        sys.exit(0)
+    request = {
+        "program": "resume",
+        "nodelist": args.nodelist,
+        "force": args.force,
+        "resume_data": global_resume_data,
+    }
+    reply = util.powerd_request(request)
+    if reply is None:
+        main(args.nodelist, args.force)
+    elif reply["status"] != "ok":
+        log.error(f"powerd failed to resume {args.nodelist}: {reply.get('error')}")
+        sys.exit(1)
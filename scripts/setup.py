@@ -731,6 +731,11 @@ def setup_controller(args):
     run("systemctl enable slurmrestd", timeout=30)
     run("systemctl restart slurmrestd", timeout=30)
 
+    if cfg.enable_powerd:
+        # resume.py and suspend.py hand their requests to it when it is up
+        run("systemctl enable slurm_powerd", timeout=30)
+        run("systemctl restart slurm_powerd", timeout=30)
+
     # Export at the end to signal that everything is up
     run("systemctl enable nfs-server", timeout=30)
     run("systemctl start nfs-server", timeout=30)
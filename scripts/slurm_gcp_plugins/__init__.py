@@ -2,28 +2,32 @@ import importlib
 import pkgutil
 import logging
 import inspect
-
-# Only perform discovery at init
-discovered_plugins = {
-    name.lstrip("."): importlib.import_module(name=name, package="slurm_gcp_plugins")
-    for finder, name, ispkg in pkgutil.iter_modules(path=__path__, prefix=".")
-    if name.lstrip(".") != "utils"
-}
-
-logging.info(
-    (
-        "slurm_gcp_plugins found:"
-        + ", ".join(
-            [
-                "slurm_gcp_plugins" + plugin
-                for plugin in sorted(discovered_plugins.keys())
-            ]
-        )
-    )
-)
+from functools import lru_cache
 
 
+# Discovery is deferred until a plugin callback is run, so importing this
+# package (and util) stays cheap
+@lru_cache(maxsize=1)
 def get_plugins():
+    discovered_plugins = {
+        name.lstrip("."): importlib.import_module(
+            name=name, package="slurm_gcp_plugins"
+        )
+        for finder, name, ispkg in pkgutil.iter_modules(path=__path__, prefix=".")
+        if name.lstrip(".") != "utils"
+    }
+
+    logging.info(
+        (
+            "slurm_gcp_plugins found:"
+            + ", ".join(
+                [
+                    "slurm_gcp_plugins" + plugin
+                    for plugin in sorted(discovered_plugins.keys())
+                ]
+            )
+        )
+    )
     return discovered_plugins
 
 
@@ -16,6 +16,7 @@ import slurm_gcp_plugins.utils as sgp_utils
 #
 # Where <hps> can be either of 1,2,3 (in increasing order of distance)
 # If no max_hops is provided but the plugins is still enabled the default level is 3
+DEFAULT_MAX_HOPS = 3
 
 
 def pre_placement_group_insert(*pos_args, **keyword_args):
@@ -27,7 +28,7 @@ def pre_placement_group_insert(*pos_args, **keyword_args):
         max_distance = sgp_utils.get_plugin_setting(plugin='max_hops', setting='max_hops',
                                                     job=get_job_from_placement_group_name(keyword_args['pg_name']),
                                                     lkp=keyword_args['lkp'],
-                                                    default=3)
+                                                    default=DEFAULT_MAX_HOPS)
         logging.debug(f'Setting max hop for placement policy to {max_distance}')
         keyword_args['request_body']['groupPlacementPolicy']['collocation='] = 'COLLOCATED'
         keyword_args['request_body']['groupPlacementPolicy']['maxDistance'] = max_distance
@@ -22,8 +22,10 @@ import logging
 import re
 import sys
 from enum import Enum
+from functools import lru_cache
 from itertools import chain
 from pathlib import Path
+from time import time
 import yaml
 
 import util
@@ -41,6 +43,8 @@ from util import (
     to_hostnames,
     with_static,
     Lookup,
+    NodeBase,
+    NodeFlag,
     NSDict,
     TPU,
     chunked,
@@ -57,6 +61,7 @@ from conf import (
     install_gres_conf,
     install_cgroup_conf,
     install_topology_conf,
+    install_jobsubmit_lua,
 )
 
 filename = Path(__file__).name
@@ -87,7 +92,7 @@ def start_instance_op(inst, project=None):
     project = project or lkp.project
     return compute.instances().start(
         project=project,
-        zone=lkp.instance(inst).zone,
+        zone=lkp.instance(inst, profile="sync").zone,
         instance=inst,
     )
 
@@ -137,31 +142,32 @@ def _find_tpu_node_status(nodename, state):
             inst = tpuobj.get_node(tpus_int[0])
         # if len(tpus_int ==0) this case is not relevant as this would be the case always that a TPU group is not running
     if inst is None:
-        if state.base == "DOWN" and "POWERED_DOWN" in state.flags:
+        if (
+            state.base_state is NodeBase.DOWN
+            and state.state_flags & NodeFlag.POWERED_DOWN
+        ):
             return NodeStatus.restore
-        if "POWERING_DOWN" in state.flags:
+        if state.state_flags & NodeFlag.POWERING_DOWN:
             return NodeStatus.restore
-        if "COMPLETING" in state.flags:
+        if state.state_flags & NodeFlag.COMPLETING:
             return NodeStatus.unbacked
-        if state.base != "DOWN" and not (
-            set(("POWER_DOWN", "POWERING_UP", "POWERING_DOWN", "POWERED_DOWN"))
-            & state.flags
+        if state.base_state is not NodeBase.DOWN and not (
+            state.state_flags & NodeFlag.POWER
         ):
             return NodeStatus.unbacked
         if nodename in find_node_status.static_nodeset:
             return NodeStatus.resume
     elif (
         state is not None
-        and "POWERED_DOWN" not in state.flags
-        and "POWERING_DOWN" not in state.flags
+        and not state.state_flags & (NodeFlag.POWERED_DOWN | NodeFlag.POWERING_DOWN)
         and inst.state == TPU.State.STOPPED
     ):
         if tpuobj.preemptible:
             return NodeStatus.preempted
-        if not state.base.startswith("DOWN"):
+        if state.base_state is not NodeBase.DOWN:
             return NodeStatus.terminated
     elif (
-        state is None or "POWERED_DOWN" in state.flags
+        state is None or state.state_flags & NodeFlag.POWERED_DOWN
     ) and inst.state == TPU.State.READY:
         return NodeStatus.orphan
     elif state is None:
@@ -171,67 +177,105 @@ def _find_tpu_node_status(nodename, state):
     return NodeStatus.unchanged
 
 
-def allow_power_down(state):
+# names in SuspendExcStates that differ from the NodeBase and NodeFlag names
+SUSPEND_EXC_STATE_NAMES = {"MAINT": "MAINTENANCE"}
+
+
+@lru_cache(maxsize=1)
+def suspend_exc_states():
+    """SuspendExcStates of the Slurm config as (set of NodeBase, NodeFlag
+    mask), or None if no node may be powered down.
+    """
     config = run(f"{lkp.scontrol} show config").stdout.rstrip()
-    m = re.search(r"SuspendExcStates\s+=\s+(?P<states>[\w\(\)]+)", config)
+    m = re.search(r"SuspendExcStates\s+=\s+(?P<states>[\w\(\),]+)", config)
     if not m:
         log.warning("SuspendExcStates not found in Slurm config")
-        return True
-    states = set(m.group("states").split(","))
-    if "(null)" in states or bool(state & state.flags.union(state.base)):
-        return False
-    return True
+        return frozenset(), NodeFlag(0)
+    states = m.group("states").upper().split(",")
+    if "(NULL)" in states:
+        return None
+    states = [SUSPEND_EXC_STATE_NAMES.get(state, state) for state in states]
+    bases = frozenset(
+        NodeBase[state] for state in states if state in NodeBase.__members__
+    )
+    flags = NodeFlag(0)
+    for state in states:
+        flags |= NodeFlag.__members__.get(state, 0)
+    return bases, flags
 
 
-@with_static(static_nodeset=None)
-def find_node_status(nodename):
-    """Determine node/instance status that requires action"""
-    if find_node_status.static_nodeset is None:
-        find_node_status.static_nodeset = set(util.to_hostnames(lkp.static_nodelist()))
-    state = lkp.slurm_node(nodename)
-    if lkp.node_is_tpu(nodename):
-        return _find_tpu_node_status(nodename, state)
-    inst = lkp.instance(nodename)
-    power_flags = state.flags & frozenset(
-        ("POWER_DOWN", "POWERING_UP", "POWERING_DOWN", "POWERED_DOWN")
-    )
-    if inst is None:
-        if "POWERING_UP" in state.flags:
+def allow_power_down(base_state, state_flags):
+    exc_states = suspend_exc_states()
+    if exc_states is None:
+        return False
+    bases, flags = exc_states
+    return base_state not in bases and not state_flags & flags
+
+
+@lru_cache(maxsize=None)
+def node_status(base_state, state_flags, inst_status, preemptible, static):
+    """Classify a node by its Slurm state and the status of its instance.
+    base_state and inst_status are None if the node is not in Slurm or has no
+    instance. Nodes share a handful of these combinations, so the results are
+    cached and most nodes are a single lookup.
+    """
+    down = base_state is NodeBase.DOWN
+    power_flags = state_flags & NodeFlag.POWER
+    if inst_status is None:
+        if state_flags & NodeFlag.POWERING_UP:
             return NodeStatus.unchanged
-        if state.base == "DOWN" and "POWERED_DOWN" in state.flags:
+        if down and state_flags & NodeFlag.POWERED_DOWN:
             return NodeStatus.restore
-        if "POWERING_DOWN" in state.flags:
+        if state_flags & NodeFlag.POWERING_DOWN:
             return NodeStatus.restore
-        if "COMPLETING" in state.flags:
+        if state_flags & NodeFlag.COMPLETING:
             return NodeStatus.unbacked
-        if state.base != "DOWN" and not power_flags:
+        if not down and not power_flags:
             return NodeStatus.unbacked
-        if state.base == "DOWN" and not power_flags and allow_power_down(state):
+        if down and not power_flags and allow_power_down(base_state, state_flags):
             return NodeStatus.power_down
-        if (
-            "POWERED_DOWN" in state.flags
-            and nodename in find_node_status.static_nodeset
-        ):
+        if state_flags & NodeFlag.POWERED_DOWN and static:
             return NodeStatus.resume
     elif (
-        state is not None
-        and "POWERED_DOWN" not in state.flags
-        and "POWERING_DOWN" not in state.flags
-        and inst.status == "TERMINATED"
+        base_state is not None
+        and not state_flags & (NodeFlag.POWERED_DOWN | NodeFlag.POWERING_DOWN)
+        and inst_status == "TERMINATED"
     ):
-        if inst.scheduling.preemptible:
+        if preemptible:
             return NodeStatus.preempted
-        if not state.base.startswith("DOWN"):
+        if not down:
             return NodeStatus.terminated
-    elif (state is None or "POWERED_DOWN" in state.flags) and inst.status == "RUNNING":
+    elif (
+        base_state is None or state_flags & NodeFlag.POWERED_DOWN
+    ) and inst_status == "RUNNING":
         return NodeStatus.orphan
-    elif state is None:
+    elif base_state is None:
         # if state is None here, the instance exists but it's not in Slurm
         return NodeStatus.unknown
 
     return NodeStatus.unchanged
 
 
+@with_static(static_nodeset=None)
+def find_node_status(nodename):
+    """Determine node/instance status that requires action"""
+    if find_node_status.static_nodeset is None:
+        find_node_status.static_nodeset = lkp.static_nodeset()
+    state = lkp.slurm_node(nodename)
+    if lkp.node_is_tpu(nodename):
+        return _find_tpu_node_status(nodename, state)
+    inst = lkp.instance(nodename, profile="sync")
+    inst_status = inst.status if inst is not None else None
+    return node_status(
+        state.base_state if state is not None else None,
+        state.state_flags if state is not None else NodeFlag(0),
+        inst_status,
+        # only looked at for stopped instances, skip parsing scheduling
+        inst_status == "TERMINATED" and bool(inst.scheduling.preemptible),
+        nodename in find_node_status.static_nodeset,
+    )
+
+
 def do_node_update(status, nodes):
     """update node/instance based on node status"""
     if status == NodeStatus.unchanged:
@@ -279,7 +323,7 @@ def do_node_update(status, nodes):
         first = next(iter(nodes))
         state = lkp.slurm_node(first)
         state = "{}+{}".format(state.base, "+".join(state.flags))
-        inst = lkp.instance(first)
+        inst = lkp.instance(first, profile="sync")
         log.error(f"{first} state: {state}, instance status:{inst.status}")
 
     update = dict.get(
@@ -306,7 +350,8 @@ def delete_placement_groups(placement_groups):
         )
 
     requests = {
-        pg.name: delete_placement_request(pg["name"], util.trim_self_link(pg["region"]))
+        # region is a self link in listed policies
+        pg.name: delete_placement_request(pg["name"], pg["region"].rpartition("/")[2])
         for pg in placement_groups
     }
     done, failed = batch_execute(requests)
@@ -331,6 +376,7 @@ def sync_placement_groups():
     if lkp.instance_role_safe != "controller":
         return
 
+    since = time()
     keep_jobs = {
         str(job["job_id"])
         for job in json.loads(run(f"{lkp.scontrol} show jobs --json").stdout)["jobs"]
@@ -342,28 +388,121 @@ def sync_placement_groups():
     act = compute.resourcePolicies()
     op = act.aggregatedList(project=lkp.project, fields=fields, filter=flt)
     placement_groups = {}
+    pool_policies = {}
     pg_regex = re.compile(
         rf"{lkp.cfg.slurm_cluster_name}-(?P<partition>[^\s\-]+)-(?P<job_id>\d+)-(?P<index>\d+)"
     )
     while op is not None:
         result = ensure_execute(op)
-        # merge placement group info from API and job_id,partition,index parsed from the name
-        pgs = (
-            NSDict({**pg, **pg_regex.match(pg["name"]).groupdict()})
-            for pg in chain.from_iterable(
+        policies = list(
+            chain.from_iterable(
                 item["resourcePolicies"]
                 for item in result.get("items", {}).values()
                 if item
             )
+        )
+        # merge placement group info from API and job_id,partition,index parsed from the name
+        pgs = (
+            NSDict({**pg, **pg_regex.match(pg["name"]).groupdict()})
+            for pg in policies
             if pg_regex.match(pg["name"]) is not None
         )
         placement_groups.update(
             {pg["name"]: pg for pg in pgs if pg.get("job_id") not in keep_jobs}
         )
+        pool_policies.update(
+            (pg["name"], pg.get("status"))
+            for pg in policies
+            if util.PlacementPool.parse_policy_name(pg["name"]) is not None
+        )
         op = act.aggregatedList_next(op, result)
 
     if len(placement_groups) > 0:
         delete_placement_groups(list(placement_groups.values()))
+    sync_placement_pool(pool_policies, keep_jobs, since)
+
+
+def placement_pool_keys():
+    """(region, max_distance) of the policies kept in the placement policy
+    pool: the regions of nodesets with placement, and the max_hops setting if
+    that plugin is enabled. Jobs that ask for other distances get their own
+    policies.
+    """
+    max_distance = None
+    plugins = cfg.enable_slurm_gcp_plugins or {}
+    if "max_hops" in plugins:
+        from slurm_gcp_plugins.max_hops import DEFAULT_MAX_HOPS
+
+        max_distance = DEFAULT_MAX_HOPS
+        if isinstance(plugins.max_hops, dict):
+            max_distance = plugins.max_hops.get("max_hops", max_distance)
+    return {
+        (info.region, max_distance)
+        for info in lkp.nodeset_table().values()
+        if info.nodeset.enable_placement and not info.tpu and info.region
+    }
+
+
+def sync_placement_pool(listed, keep_jobs, since):
+    """Return the pool policies of finished jobs once their instances are
+    gone, and create or delete policies to keep placement_pool_size free ones
+    per region
+    """
+    size = cfg.get("placement_pool_size", 0)
+    if size <= 0 and not listed:
+        return
+    # listed after keep_jobs was read. An earlier or cached listing may miss
+    # the instances of a job that leased a policy and ended since then.
+    lkp.clear_instances_cache()
+    in_use = {
+        util.trim_self_link(policy)
+        for inst in lkp.instances(profile="sync", max_age=0).values()
+        for policy in inst.resourcePolicies or []
+    }
+    create, delete = util.placement_pool.sync(
+        listed, keep_jobs, in_use, placement_pool_keys(), size, since
+    )
+
+    def insert_request(api, region, max_distance, name):
+        body = {
+            "name": name,
+            "region": region,
+            "groupPlacementPolicy": {"collocation": "COLLOCATED"},
+        }
+        if max_distance is not None:
+            body["groupPlacementPolicy"]["maxDistance"] = max_distance
+        return api.resourcePolicies().insert(
+            project=lkp.project, region=region, body=body
+        )
+
+    plain, with_distance = separate(lambda c: c[1] is not None, create)
+    # like the max_hops plugin, maxDistance needs the beta API
+    for api, policies in (
+        (compute, plain),
+        (
+            util.compute_service(version="beta") if with_distance else None,
+            with_distance,
+        ),
+    ):
+        if not policies:
+            continue
+        # the policies are added to the pool once they are READY
+        done, failed = batch_execute(
+            {
+                name: insert_request(api, region, d, name)
+                for region, d, name in policies
+            },
+            compute=api,
+        )
+        if failed:
+            failed_pg = [f"{n}: {e}" for n, (_, e) in failed.items()]
+            log.error(f"some pool placement policies failed to create: {failed_pg}")
+        if done:
+            log.info(f"creating {len(done)} pool placement policies")
+    if delete:
+        delete_placement_groups(
+            [NSDict(name=name, region=region) for region, name in delete]
+        )
 
 
 def sync_slurm():
@@ -371,12 +510,14 @@ def sync_slurm():
         return
 
     compute_instances = [
-        name for name, inst in lkp.instances().items() if inst.role == "compute"
+        name
+        for name, inst in lkp.instances(profile="sync").items()
+        if inst.role == "compute"
     ]
     slurm_nodes = list(
         name
         for name, state in lkp.slurm_nodes().items()
-        if "DYNAMIC_NORM" not in state.flags
+        if not state.state_flags & NodeFlag.DYNAMIC_NORM
     )
     all_nodes = list(
         set(
@@ -444,6 +585,7 @@ def reconfigure_slurm():
             install_gres_conf(lkp)
             install_cgroup_conf(lkp)
             install_topology_conf(lkp)
+            install_jobsubmit_lua(lkp)
             log.info("Restarting slurmctld to make changes take effect.")
             try:
                 run("sudo systemctl restart slurmctld.service", check=False)
@@ -26,8 +26,10 @@ from util import (
     log_api_request,
     batch_execute,
     to_hostlist,
-    wait_for_operations,
     separate,
+    OperationTracker,
+    operation_error,
+    operation_failed,
     execute_with_futures,
 )
 from util import lkp, cfg, compute, TPU
@@ -55,7 +57,7 @@ def delete_instance_request(instance, project=None, zone=None):
     project = project or lkp.project
     request = compute.instances().delete(
         project=project,
-        zone=(zone or lkp.instance(instance).zone),
+        zone=(zone or lkp.instance(instance, profile="suspend").zone),
         instance=instance,
     )
     log_api_request(request)
@@ -91,7 +93,9 @@ def delete_tpu_instances(instances):
 
 def delete_instances(instances):
     """delete instances individually"""
-    invalid, valid = separate(lambda inst: bool(lkp.instance(inst)), instances)
+    invalid, valid = separate(
+        lambda inst: bool(lkp.instance(inst, profile="suspend")), instances
+    )
     if len(invalid) > 0:
         log.debug("instances do not exist: {}".format(",".join(invalid)))
     if len(valid) == 0:
@@ -104,11 +108,17 @@ def delete_instances(instances):
     log.info(f"delete {len(valid)} instances ({valid_hostlist})")
     done, failed = batch_execute(requests)
     if failed:
-        for err, nodes in groupby_unsorted(lambda n: failed[n][1], failed.keys()):
+        for err, nodes in groupby_unsorted(list(failed), lambda n: failed[n][1]):
             log.error(f"instances failed to delete: {err} ({to_hostlist(nodes)})")
-    wait_for_operations(done.values())
-    # TODO do we need to check each operation for success? That is a lot more API calls
-    log.info(f"deleted {len(done)} instances {to_hostlist(done.keys())}")
+
+    # operation status is polled in batches, so checking each one is cheap
+    tracker = OperationTracker()
+    tracker.update(done)
+    results = tracker.wait()
+    deleted, errors = separate(lambda n: operation_failed(results[n]), list(results))
+    for err, nodes in groupby_unsorted(errors, lambda n: operation_error(results[n])):
+        log.error(f"instances failed to delete: {err} ({to_hostlist(nodes)})")
+    log.info(f"deleted {len(deleted)} instances {to_hostlist(deleted)}")
 
 
 def suspend_nodes(nodelist):
@@ -187,4 +197,9 @@ if __name__ == "__main__":
     log = logging.getLogger(Path(__file__).name)
     sys.excepthook = util.handle_exception
 
-    main(args.nodelist)
+    reply = util.powerd_request({"program": "suspend", "nodelist": args.nodelist})
+    if reply is None:
+        main(args.nodelist)
+    elif reply["status"] != "ok":
+        log.error(f"powerd failed to suspend {args.nodelist}: {reply.get('error')}")
+        sys.exit(1)
@@ -0,0 +1,100 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+from pathlib import Path
+
+tests_dir = Path(__file__).parent
+scripts_dir = tests_dir.parent
+if str(scripts_dir) not in sys.path:
+    sys.path.insert(0, str(scripts_dir))
+
+# util loads its config at import, point it at the test config rather than
+# looking for one in the cluster bucket
+os.environ.setdefault("SLURM_CONFIG_YAML", str(tests_dir / "test_config.yaml"))
+
+import httplib2  # noqa: E402
+import pytest  # noqa: E402
+from googleapiclient.errors import HttpError  # noqa: E402
+
+import util  # noqa: E402
+from util import NSDict  # noqa: E402
+
+
+def http_error(status):
+    return HttpError(httplib2.Response({"status": status}), b"")
+
+
+class FakeRequest:
+    def __init__(self, execute):
+        self.execute = execute
+
+
+class FakeBatch:
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        for rid, req in self.requests:
+            try:
+                self.callback(rid, req.execute(), None)
+            except Exception as e:
+                self.callback(rid, None, e)
+
+
+class FakeCompute:
+    """Stand-in for the compute API client. Every resource is the client
+    itself, subclasses add the methods of the resources a test uses.
+    """
+
+    def instances(self):
+        return self
+
+    def instanceTemplates(self):
+        return self
+
+    def machineTypes(self):
+        return self
+
+    def resourcePolicies(self):
+        return self
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(callback)
+
+
+class FakeLookup(util.Lookup):
+    compute = None
+
+
+@pytest.fixture
+def make_lookup(tmp_path):
+    """Make FakeLookups of a config with the given items, using compute and
+    keeping their caches in tmp_path
+    """
+
+    def make_lookup(compute=None, **cfg):
+        lkp = FakeLookup(NSDict({"project": "proj", "slurm_cluster_name": "c", **cfg}))
+        lkp.compute = compute
+        lkp.inventory_dir = tmp_path
+        lkp.template_cache_dir = tmp_path / "template_info"
+        lkp.machine_type_cache_path = tmp_path / "machine_types.cache"
+        return lkp
+
+    return make_lookup
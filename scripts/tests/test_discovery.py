@@ -0,0 +1,104 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from time import time
+
+import googleapiclient.discovery_cache
+import requests
+from google.auth.credentials import AnonymousCredentials
+
+import util
+from util import discovery_document
+
+
+def test_discovery_document_cached(tmp_path):
+    doc = discovery_document("compute", "v1", cache_dir=tmp_path)
+    assert doc["version"] == "v1"
+    cache_file = tmp_path / "compute.v1.discovery.cache"
+    assert json.loads(cache_file.read_text())["document"] == doc
+
+    # served from the cache file from now on
+    cached = json.loads(cache_file.read_text())
+    cached["document"]["revision"] = "pinned"
+    cache_file.write_text(json.dumps(cached))
+    assert discovery_document("compute", "v1", cache_dir=tmp_path)["revision"] == (
+        "pinned"
+    )
+
+
+def test_discovery_document_refreshed_for_new_client(tmp_path):
+    cache_file = tmp_path / "compute.beta.discovery.cache"
+    cache_file.write_text(json.dumps({"client_version": "0.0", "document": {}}))
+    doc = discovery_document("compute", "beta", cache_dir=tmp_path)
+    assert doc["version"] == "beta"
+    assert json.loads(cache_file.read_text())["document"] == doc
+
+
+class FakeResponse:
+    def __init__(self, revision, status=200):
+        self.text = json.dumps({"version": "alpha", "revision": revision})
+        self.status = status
+
+    def raise_for_status(self):
+        if self.status != 200:
+            raise requests.exceptions.HTTPError(f"status {self.status}")
+
+
+def test_discovery_document_fetched_expires(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        googleapiclient.discovery_cache, "get_static_doc", lambda api, version: None
+    )
+    fetched = []
+
+    def get(url, timeout):
+        fetched.append(url)
+        return FakeResponse(str(len(fetched)))
+
+    monkeypatch.setattr(requests, "get", get)
+    assert discovery_document("compute", "alpha", cache_dir=tmp_path)["revision"] == "1"
+    assert discovery_document("compute", "alpha", cache_dir=tmp_path)["revision"] == "1"
+    assert len(fetched) == 1
+
+    cache_file = tmp_path / "compute.alpha.discovery.cache"
+    cached = json.loads(cache_file.read_text())
+    cached["expires"] = time() - 1
+    cache_file.write_text(json.dumps(cached))
+    assert discovery_document("compute", "alpha", cache_dir=tmp_path)["revision"] == "2"
+    assert json.loads(cache_file.read_text())["expires"] > time()
+
+    # the stale document is used if it can not be fetched again
+    cached = json.loads(cache_file.read_text())
+    cached["expires"] = time() - 1
+    cache_file.write_text(json.dumps(cached))
+
+    monkeypatch.setattr(requests, "get", lambda url, timeout: FakeResponse("3", 503))
+    assert discovery_document("compute", "alpha", cache_dir=tmp_path)["revision"] == "2"
+
+
+def test_compute_service_memoized(monkeypatch, tmp_path):
+    monkeypatch.setattr(util, "DISCOVERY_CACHE_DIR", tmp_path)
+    monkeypatch.delenv("GOOGLE_APPLICATION_CREDENTIALS", raising=False)
+    creds = AnonymousCredentials()
+    util._compute_service.cache_clear()
+    try:
+        v1 = util.compute_service(credentials=creds)
+        assert util.compute_service(credentials=creds) is v1
+        assert util.compute_service(credentials=creds, version="beta") is not v1
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            "compute.beta.discovery.cache",
+            "compute.v1.discovery.cache",
+        ]
+    finally:
+        util._compute_service.cache_clear()
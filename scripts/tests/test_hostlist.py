@@ -0,0 +1,104 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+import util
+from util import to_hostlist, to_hostnames
+
+
+# node names -> output of `scontrol show hostlist` for the natural sorted names
+SCONTROL_HOSTLIST = [
+    ("n1", "n1"),
+    ("n1,n2,n3", "n[1-3]"),
+    ("n3,n1,n2", "n[1-3]"),
+    ("n1,n3,n4,n7", "n[1,3-4,7]"),
+    ("n01,n02,n03", "n[01-03]"),
+    ("n8,n9,n10,n11", "n[8-11]"),
+    ("n08,n09,n10", "n[08-10]"),
+    ("n8,n9,n010", "n[8-9,010]"),
+    ("n08,n9", "n[08,9]"),
+    ("n0,n1", "n[0-1]"),
+    ("n1,n1", "n[1,1]"),
+    ("login,n1,n2", "login,n[1-2]"),
+    ("a1,b1", "a1,b1"),
+    ("a1,a2,b1,b3", "a[1-2],b[1,3]"),
+    ("test-debug-0,test-debug-1,test-debug-2", "test-debug-[0-2]"),
+    ("test-a-1,test-a-2,test-b-1", "test-a-[1-2],test-b-1"),
+    ("node1b,node2b", "node1b,node2b"),
+    ("1,2,3", "[1-3]"),
+    ("r1n1,r1n2,r2n1", "r1n[1-2],r2n1"),
+]
+
+# hostlist expression -> output of `scontrol show hostnames`
+SCONTROL_HOSTNAMES = [
+    ("n1", ["n1"]),
+    ("n[1-3]", ["n1", "n2", "n3"]),
+    ("n[3,1-2]", ["n3", "n1", "n2"]),
+    ("n[01-03,7]", ["n01", "n02", "n03", "n7"]),
+    ("n[8-10]", ["n8", "n9", "n10"]),
+    ("n[08-10]", ["n08", "n09", "n10"]),
+    ("login,n[1-2]", ["login", "n1", "n2"]),
+    ("a[1-2],b[1,3]", ["a1", "a2", "b1", "b3"]),
+    ("a[1-2] b1", ["a1", "a2", "b1"]),
+    ("test-debug-[0-2]\n", ["test-debug-0", "test-debug-1", "test-debug-2"]),
+    ("r[1-2]n[1-2]", ["r1n1", "r1n2", "r2n1", "r2n2"]),
+    ("r[1-2]-n[01-02]", ["r1-n01", "r1-n02", "r2-n01", "r2-n02"]),
+    ("", []),
+]
+
+
+@pytest.mark.parametrize("names,expected", SCONTROL_HOSTLIST)
+def test_to_hostlist(names, expected):
+    assert to_hostlist(names.split(",")) == expected
+
+
+@pytest.mark.parametrize("hostlist,expected", SCONTROL_HOSTNAMES)
+def test_to_hostnames(hostlist, expected):
+    assert to_hostnames(hostlist) == expected
+
+
+@pytest.mark.parametrize("names,expected", SCONTROL_HOSTLIST)
+def test_hostlist_roundtrip(names, expected):
+    assert to_hostnames(expected) == sorted(names.split(","), key=util.natural_sort)
+
+
+@pytest.mark.parametrize("hostlist", ["n[1-3", "n[3-1]", "n[a-b]", "n1]"])
+def test_to_hostnames_invalid(hostlist):
+    with pytest.raises(Exception):
+        to_hostnames(hostlist)
+
+
+def test_to_hostnames_list():
+    assert to_hostnames(["n[1-2]", "m1"]) == ["n1", "n2", "m1"]
+
+
+# 100k nodes across several nodesets, with gaps so there are many ranges
+BENCH_NODES = [
+    f"bench-{nodeset}-{i}"
+    for nodeset in ("c2", "n2d", "a2", "h3")
+    for i in range(25_000)
+    if i % 97 != 0
+]
+
+
+def test_bench_to_hostlist(benchmark):
+    hostlist = benchmark(to_hostlist, BENCH_NODES)
+    assert hostlist.startswith("bench-a2-[1-96,98-")
+
+
+def test_bench_to_hostnames(benchmark):
+    hostlist = to_hostlist(BENCH_NODES)
+    hostnames = benchmark(to_hostnames, hostlist)
+    assert len(hostnames) == len(BENCH_NODES)
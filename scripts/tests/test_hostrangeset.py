@@ -0,0 +1,103 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import pytest
+from addict import Dict as NSDict
+
+import util
+from util import HostRangeSet, to_hostnames
+
+
+HOSTLISTS = [
+    "",
+    "n1",
+    "n[1-3]",
+    "n[0-9,20-29]",
+    "n[08-10]",
+    "n[001-003],n[1-3]",
+    "login,n[1-2]",
+    "a[1-2],b[1,3]",
+    "r[1-2]n[1-2]",
+    "r1n[1-2]",
+    "test-debug-[0-2],test-tpu-[0-99999]",
+]
+
+
+@pytest.mark.parametrize("hostlist", HOSTLISTS)
+def test_from_hostlist_matches_expansion(hostlist):
+    names = to_hostnames(hostlist)
+    rs = HostRangeSet.from_hostlist(hostlist)
+    assert rs == HostRangeSet(names)
+    assert len(rs) == len(set(names))
+    assert set(rs) == set(names)
+    assert all(name in rs for name in names)
+    assert HostRangeSet.from_hostlist(str(rs)) == rs
+
+
+@pytest.mark.parametrize("name", ["n", "n4", "n01", "n003", "m1", "n1x", "1", ""])
+def test_contains_negative(name):
+    assert name not in HostRangeSet.from_hostlist("n[1-3],n[001-002],x1")
+
+
+def test_large_range_not_expanded():
+    rs = HostRangeSet.from_ranges("c-n-", [(0, 10**12)])
+    assert len(rs) == 10**12 + 1
+    assert "c-n-999999999999" in rs
+    assert "c-n-1000000000001" not in rs
+    assert str(rs) == "c-n-[0-1000000000000]"
+
+
+def test_set_operations_match_builtin_sets():
+    rnd = random.Random(42)
+    for _ in range(200):
+        a = {f"n{rnd.randrange(40)}" for _ in range(rnd.randrange(30))}
+        b = {f"n{rnd.randrange(40)}" for _ in range(rnd.randrange(30))}
+        a |= {rnd.choice(["login", "n01", "m1"])}
+        ra, rb = HostRangeSet(a), HostRangeSet(b)
+        assert set(ra | rb) == a | b
+        assert set(ra & rb) == a & b
+        assert set(ra - rb) == a - b
+        assert set(rb - ra) == b - a
+
+
+def test_lookup_filter_nodes():
+    lkp = util.Lookup(
+        NSDict(
+            slurm_cluster_name="c",
+            nodeset={
+                "a": {"nodeset_name": "a", "node_count_static": 2},
+                "b": {"nodeset_name": "b", "node_count_dynamic_max": 100000},
+            },
+            nodeset_tpu={
+                "t": {
+                    "nodeset_name": "t",
+                    "node_count_static": 1,
+                    "node_count_dynamic_max": 2,
+                }
+            },
+        )
+    )
+    static, dynamic = lkp.cloud_nodes()
+    assert str(static) == "c-a-[0-1],c-t-0"
+    assert str(dynamic) == "c-b-[0-99999],c-t-[1-2]"
+    assert str(lkp.static_nodeset()) == str(static)
+    assert lkp.static_nodelist() == ["c-a-[0-1]", "c-t-0"]
+
+    cloud, local = lkp.filter_nodes(
+        ["c-a-1", "c-a-2", "c-b-99999", "c-t-2", "c-t-3", "login", "c-a-1"]
+    )
+    assert cloud == ["c-a-1", "c-b-99999", "c-t-2"]
+    assert local == ["c-a-2", "c-t-3", "login"]
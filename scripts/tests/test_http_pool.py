@@ -0,0 +1,164 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import shutil
+import ssl
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httplib2
+import pytest
+
+import util
+from util import HttpPool
+
+
+class FakeHttp:
+    def __init__(self):
+        self.closed = False
+        self.thread = None
+
+    def request(self, *args, **kwargs):
+        self.thread = threading.current_thread()
+        return args
+
+    def close(self):
+        self.closed = True
+
+
+def test_pool_one_connection_per_thread():
+    pool = HttpPool(FakeHttp)
+    assert pool.get() is pool.get()
+
+    def worker(_):
+        http = pool.get()
+        assert pool.get() is http
+        return http
+
+    with ThreadPoolExecutor(4) as exe:
+        https = list(exe.map(worker, range(100)))
+    assert len(set(map(id, https))) <= 4
+    assert pool.request("uri", "GET") == ("uri", "GET")
+
+
+def test_pool_cap():
+    pool = HttpPool(FakeHttp, max_size=2)
+    barrier = threading.Barrier(4)
+
+    def worker(_):
+        http = pool.get()
+        barrier.wait()
+        return http
+
+    with ThreadPoolExecutor(4) as exe:
+        https = list(exe.map(worker, range(4)))
+    assert len(set(map(id, https))) == 4
+    assert len(pool) == 2
+
+
+def test_pool_idle_timeout(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(util, "time", lambda: now[0])
+    pool = HttpPool(FakeHttp, idle_timeout=60)
+    http = pool.get()
+    now[0] += 30
+    assert pool.get() is http
+    now[0] += 61
+    fresh = pool.get()
+    assert fresh is not http
+    assert http.closed
+
+
+def test_pool_drops_finished_threads():
+    pool = HttpPool(FakeHttp, max_size=1)
+    thread = threading.Thread(target=pool.get)
+    thread.start()
+    thread.join()
+    http = pool.get()
+    assert pool.get() is http
+    assert len(pool) == 1
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b'{"kind": "compute#operation", "status": "DONE"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def https_server(tmp_path_factory):
+    """local HTTPS stand-in for the compute API, with a self-signed cert"""
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl is needed to make a test certificate")
+    tmp = tmp_path_factory.mktemp("tls")
+    cert, key = tmp / "cert.pem", tmp / "key.pem"
+    subprocess.run(
+        f"openssl req -x509 -newkey rsa:2048 -nodes -days 1 -subj /CN=localhost "
+        f"-keyout {key} -out {cert}",
+        shell=True,
+        check=True,
+        capture_output=True,
+    )
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert, key)
+    server = ThreadingHTTPServer(("localhost", 0), Handler)
+    server.daemon_threads = True
+    server.socket = ctx.wrap_socket(server.socket, server_side=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"https://localhost:{server.server_address[1]}/compute/v1/operation"
+    server.shutdown()
+    server.server_close()
+
+
+def new_http():
+    return httplib2.Http(disable_ssl_certificate_validation=True)
+
+
+REQUESTS = 50
+
+
+def test_bench_http_fresh(benchmark, https_server):
+    """previous behavior, a new connection and handshake per request"""
+
+    def run():
+        for _ in range(REQUESTS):
+            resp, _ = new_http().request(https_server)
+            assert resp.status == 200
+
+    benchmark(run)
+
+
+def test_bench_http_pool(benchmark, https_server):
+    pool = HttpPool(new_http)
+
+    def run():
+        for _ in range(REQUESTS):
+            resp, _ = pool.request(https_server)
+            assert resp.status == 200
+
+    benchmark(run)
+    pool.close()
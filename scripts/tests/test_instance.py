@@ -0,0 +1,165 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import sys
+
+import pytest
+
+from util import Instance, NSDict, trim_self_link
+
+ZONE = "https://www.googleapis.com/compute/v1/projects/proj/zones/us-central1-a"
+STARTUP_SCRIPT = "#!/bin/bash\n" + "echo startup\n" * 1500
+
+
+def api_instance(name, role="compute", startup_script=STARTUP_SCRIPT):
+    """instance resource as listed with the full field profile"""
+    return {
+        "name": name,
+        "id": str(abs(hash(name))),
+        "status": "RUNNING",
+        "zone": ZONE,
+        "machineType": f"{ZONE}/machineTypes/n2-standard-2",
+        "selfLink": f"{ZONE}/instances/{name}",
+        "creationTimestamp": "2024-01-01T00:00:00.000-00:00",
+        "labels": {"slurm_cluster_name": "c", "slurm_instance_role": role},
+        "scheduling": {"preemptible": False, "provisioningModel": "STANDARD"},
+        "metadata": {
+            "fingerprint": "meta",
+            "items": [
+                {"key": "slurm_instance_role", "value": role},
+                {"key": "slurm_cluster_name", "value": "c"},
+                {"key": "startup-script", "value": startup_script},
+                {"key": "VmDnsSetting", "value": "GlobalOnly"},
+            ],
+        },
+        "disks": [
+            {"boot": True, "deviceName": "persistent-disk-0", "diskSizeGb": "50"}
+        ],
+        "networkInterfaces": [
+            {"network": "default", "networkIP": "10.0.0.2", "name": "nic0"}
+        ],
+        "serviceAccounts": [{"email": "sa@proj.iam", "scopes": ["cloud-platform"]}],
+        "resourceStatus": {"physicalHost": "/abc/def"},
+    }
+
+
+def test_instance_fields():
+    inst = Instance.from_api(api_instance("c-n-0"))
+    assert inst.name == "c-n-0"
+    assert inst.zone == "us-central1-a"
+    assert inst.zoneLink == ZONE
+    assert inst.machineType == "n2-standard-2"
+    assert inst.role == "compute"
+    assert inst.status == "RUNNING"
+    assert inst.scheduling.preemptible is False
+    assert inst["id"] == inst.id
+    assert inst["resourceStatus"]["physicalHost"] == "/abc/def"
+    assert inst["zone"] == "us-central1-a"
+    assert inst.metadata.slurm_cluster_name == "c"
+    # missing fields behave like NSDict
+    assert not inst.guestAccelerators
+    assert "id" in inst and "guestAccelerators" not in inst
+    assert inst.get("status") == "RUNNING"
+    assert inst.get("nope", 1) == 1
+
+    inst.status = "TERMINATED"
+    inst.extra = "x"
+    assert inst.to_dict()["status"] == "TERMINATED"
+    assert inst.extra == "x"
+
+
+def test_instance_metadata():
+    inst = Instance.from_api(api_instance("c-n-0"))
+    assert "startup-script" not in inst.metadata
+    assert inst.metadata.VmDnsSetting == "GlobalOnly"
+    inst = Instance.from_api(api_instance("c-n-0"), large_metadata=True)
+    assert inst.metadata["startup-script"] == STARTUP_SCRIPT
+
+
+def test_instance_role():
+    assert Instance.from_api(api_instance("c-login", role="login")).role == "login"
+    # small profiles have no metadata
+    listed = {k: api_instance("c-n-0")[k] for k in ("name", "zone", "labels")}
+    assert Instance.from_api(listed).role == "compute"
+    listed["labels"] = {}
+    assert Instance.from_api(listed) is None
+
+
+def test_instance_eq():
+    a = Instance.from_api(api_instance("c-n-0"))
+    b = Instance.from_api(api_instance("c-n-0"))
+    assert a == b
+    b.status = "STOPPING"
+    assert a != b
+
+
+def nsdict_record(inst):
+    """the NSDict record Lookup.instances made before Instance"""
+    inst = dict(inst)
+    inst["zoneLink"] = inst["zone"]
+    inst["zone"] = trim_self_link(inst["zone"])
+    inst["machineTypeLink"] = inst["machineType"]
+    inst["machineType"] = trim_self_link(inst["machineType"])
+    metadata = {i["key"]: i["value"] for i in inst["metadata"].get("items", [])}
+    inst["role"] = metadata["slurm_instance_role"]
+    inst["metadata"] = metadata
+    return NSDict(inst)
+
+
+def deep_size(obj):
+    """bytes used by obj and everything it references"""
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif isinstance(obj, Instance):
+            stack.extend(getattr(obj, name) for name in Instance.__slots__)
+    return size
+
+
+def records_size(build, count):
+    """size of count records, built from a freshly loaded inventory snapshot"""
+    snapshot = json.dumps({f"c-n-{i}": api_instance(f"c-n-{i}") for i in range(count)})
+    records = {name: build(inst) for name, inst in json.loads(snapshot).items()}
+    assert len(records) == count
+    return deep_size(records)
+
+
+@pytest.mark.parametrize("count", [20_000, 50_000])
+def test_bench_instance_memory(benchmark, count):
+    def measure():
+        return (
+            records_size(Instance.from_api, count),
+            records_size(nsdict_record, count),
+        )
+
+    compact, nsdict = benchmark.pedantic(measure, rounds=1, iterations=1)
+    benchmark.extra_info["instance_bytes"] = compact // count
+    benchmark.extra_info["nsdict_bytes"] = nsdict // count
+    print(
+        f"{count} instances: Instance {compact / 2**20:.1f} MiB, "
+        f"NSDict {nsdict / 2**20:.1f} MiB"
+    )
+    assert compact * 5 < nsdict
@@ -0,0 +1,373 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import pytest
+
+import slurm_gcp_plugins
+import util
+from conftest import FakeCompute, FakeRequest, http_error
+from util import NSDict
+
+ZONES = "https://www.googleapis.com/compute/v1/projects/proj/zones"
+ZONE = f"{ZONES}/us-central1-a"
+
+
+def instance(name, status="RUNNING", role="compute", zone=ZONE):
+    return {
+        "name": name,
+        "status": status,
+        "zone": zone,
+        "machineType": f"{zone}/machineTypes/n2-standard-2",
+        "creationTimestamp": "2024-01-01T00:00:00.000-00:00",
+        "fingerprint": "abc",
+        "labelFingerprint": "def",
+        "labels": {"slurm_cluster_name": "c", "slurm_instance_role": role},
+        "scheduling": {"preemptible": False},
+        "selfLink": f"{zone}/instances/{name}",
+        "resourceStatus": {"physicalHost": "host"},
+        "metadata": {
+            "fingerprint": "meta",
+            "items": [{"key": "slurm_instance_role", "value": role}],
+        },
+        "disks": [{"boot": True}],
+    }
+
+
+def partial(inst, fields):
+    """partial response with only fields"""
+    result = {}
+    for field in fields.split(","):
+        if field == "metadata/fingerprint":
+            result["metadata"] = {"fingerprint": inst["metadata"]["fingerprint"]}
+        elif field in inst:
+            result[field] = inst[field]
+    return result
+
+
+class FakeInstances(FakeCompute):
+    def __init__(self, instances):
+        self.servers = {inst["name"]: inst for inst in instances}
+        self.lists = []
+        self.gets = []
+        # status of instances.get errors by instance name
+        self.errors = {}
+
+    def aggregatedList(self, project, fields, filter):
+        assert fields.startswith("items.zones.instances(")
+        fields = fields[len("items.zones.instances(") : fields.index(")")]
+        self.lists.append(fields)
+        return FakeRequest(
+            lambda: {
+                "items": {
+                    "zones/us-central1-a": {
+                        "instances": [
+                            partial(inst, fields) for inst in self.servers.values()
+                        ]
+                    }
+                }
+            }
+        )
+
+    def aggregatedList_next(self, op, result):
+        return None
+
+    def list(self, project, zone, fields, filter):
+        assert fields.startswith("items(")
+        fields = fields[len("items(") : fields.index(")")]
+        self.lists.append((zone, fields))
+        found = [
+            partial(inst, fields)
+            for inst in self.servers.values()
+            if inst["zone"] == f"{ZONES}/{zone}"
+        ]
+        # two instances per page
+        pages = [found[i : i + 2] for i in range(0, len(found), 2)] or [[]]
+        return FakeRequest(lambda: {"items": pages[0], "pages": pages[1:]})
+
+    def list_next(self, op, result):
+        pages = result["pages"]
+        if not pages:
+            return None
+        return FakeRequest(lambda: {"items": pages[0], "pages": pages[1:]})
+
+    def get(self, project, zone, instance, fields):
+        def execute():
+            self.gets.append(instance)
+            if instance in self.errors:
+                raise http_error(self.errors[instance])
+            if instance not in self.servers:
+                raise http_error(404)
+            return partial(self.servers[instance], fields)
+
+        return FakeRequest(execute)
+
+
+@pytest.fixture(autouse=True)
+def no_plugins(monkeypatch):
+    monkeypatch.setattr(util, "lkp", NSDict(cfg=NSDict()))
+
+
+def full_lists(compute):
+    return [fields for fields in compute.lists if "disks" in fields]
+
+
+def test_snapshot_shared(make_lookup):
+    compute = FakeInstances([instance("c-n-0"), instance("c-n-1"), instance("c-login")])
+    lkp = make_lookup(compute)
+    instances = lkp.instances()
+    assert set(instances) == {"c-n-0", "c-n-1", "c-login"}
+    assert instances["c-n-0"].zone == "us-central1-a"
+    assert instances["c-n-0"].role == "compute"
+    assert len(full_lists(compute)) == 1
+
+    snapshot = json.loads(lkp.inventory_path("full").read_text())
+    assert snapshot["version"] == util.INVENTORY_VERSION
+    assert set(snapshot["instances"]) == set(instances)
+
+    # another process within max_age makes no API calls
+    compute.lists.clear()
+    other = make_lookup(compute)
+    assert other.instances(max_age=60) == instances
+    assert compute.lists == []
+
+
+def test_snapshot_without_large_metadata(make_lookup):
+    inst = instance("c-n-0")
+    script = {"key": "startup-script", "value": "x" * 20_000}
+    inst["metadata"]["items"].append(script)
+    compute = FakeInstances([inst])
+    lkp = make_lookup(compute)
+    assert "startup-script" not in lkp.instances()["c-n-0"].metadata
+
+    snapshot = json.loads(lkp.inventory_path("full").read_text())
+    metadata = snapshot["instances"]["c-n-0"]["metadata"]
+    assert [i["key"] for i in metadata["items"]] == ["slurm_instance_role"]
+    assert metadata["fingerprint"] == "meta"
+    # the listed instance is not modified
+    assert script in compute.servers["c-n-0"]["metadata"]["items"]
+
+    # a separate snapshot keeps them
+    lkp = make_lookup(compute)
+    assert lkp.instances(large_metadata=True)["c-n-0"].metadata["startup-script"]
+    snapshot = json.loads(lkp.inventory_path("full", large_metadata=True).read_text())
+    assert script in snapshot["instances"]["c-n-0"]["metadata"]["items"]
+
+
+def test_incremental_refresh(make_lookup):
+    compute = FakeInstances([instance(f"c-n-{i}") for i in range(10)])
+    make_lookup(compute).instances()
+    compute.lists.clear()
+
+    compute.servers["c-n-3"]["status"] = "TERMINATED"
+    del compute.servers["c-n-5"]
+    compute.servers["c-n-10"] = instance("c-n-10")
+    # deleted between the list and the get
+    compute.servers["c-n-11"] = instance("c-n-11")
+
+    lkp = make_lookup(compute)
+    real_get = compute.get
+
+    def get(project, zone, instance, fields):
+        compute.servers.pop("c-n-11", None)
+        return real_get(project, zone, instance, fields)
+
+    compute.get = get
+    instances = lkp.instances()
+    assert full_lists(compute) == []
+    assert compute.lists == [",".join(util.INVENTORY_FIELDS)]
+    assert sorted(compute.gets) == ["c-n-10", "c-n-11", "c-n-3"]
+    assert "c-n-5" not in instances
+    assert "c-n-11" not in instances
+    assert instances["c-n-3"].status == "TERMINATED"
+    assert instances["c-n-10"].role == "compute"
+    assert len(instances) == 10
+
+
+@pytest.mark.parametrize("status", [403, 500, 503])
+def test_refresh_get_errors_list_all(make_lookup, status):
+    """only instances that are not found are gone"""
+    compute = FakeInstances([instance(f"c-n-{i}") for i in range(3)])
+    make_lookup(compute).instances()
+    compute.servers["c-n-1"]["status"] = "STOPPING"
+    compute.errors["c-n-1"] = status
+    compute.lists.clear()
+
+    instances = make_lookup(compute).instances()
+    assert compute.gets == ["c-n-1"]
+    assert len(full_lists(compute)) == 1
+    assert instances["c-n-1"].status == "STOPPING"
+    assert len(instances) == 3
+
+
+def test_many_changed_lists_all(make_lookup, monkeypatch):
+    monkeypatch.setattr(util, "INVENTORY_MAX_CHANGED", 2)
+    compute = FakeInstances([instance(f"c-n-{i}") for i in range(10)])
+    make_lookup(compute).instances()
+    for i in range(5):
+        compute.servers[f"c-n-{i}"]["status"] = "STOPPING"
+    compute.lists.clear()
+
+    instances = make_lookup(compute).instances()
+    assert len(full_lists(compute)) == 1
+    assert compute.gets == []
+    assert instances["c-n-0"].status == "STOPPING"
+
+
+def test_snapshot_mismatch(make_lookup):
+    compute = FakeInstances([instance("c-n-0")])
+    lkp = make_lookup(compute)
+    lkp.instances()
+    snapshot = json.loads(lkp.inventory_path("full").read_text())
+    snapshot["version"] = 0
+    lkp.inventory_path("full").write_text(json.dumps(snapshot))
+    compute.lists.clear()
+
+    make_lookup(compute).instances(max_age=60)
+    assert len(full_lists(compute)) == 1
+
+    lkp.inventory_path("full").write_text("{not json")
+    compute.lists.clear()
+    make_lookup(compute).instances(max_age=60)
+    assert len(full_lists(compute)) == 1
+
+
+def test_max_age_config(make_lookup):
+    compute = FakeInstances([instance("c-n-0")])
+    make_lookup(compute).instances()
+    compute.lists.clear()
+    make_lookup(compute, instance_inventory_max_age=60).instances()
+    assert compute.lists == []
+    make_lookup(compute).instances()
+    assert compute.lists == [",".join(util.INVENTORY_FIELDS)]
+
+
+def test_cluster_zones(make_lookup):
+    nodesets = {
+        "a": {"zone_policy_allow": ["us-central1-a", "us-central1-b"]},
+        "b": {"zone_policy_allow": ["us-central1-b", "us-central1-c"]},
+    }
+    lkp = make_lookup(None, nodeset=nodesets)
+    assert lkp.cluster_zones() == ["us-central1-a", "us-central1-b", "us-central1-c"]
+
+    nodesets["c"] = {"zone_policy_allow": []}
+    assert make_lookup(None, nodeset=nodesets).cluster_zones() is None
+    del nodesets["c"]
+    lkp = make_lookup(None, nodeset=nodesets, nodeset_dyn={"d": {}})
+    assert lkp.cluster_zones() is None
+
+
+def test_zone_scoped_list(make_lookup):
+    compute = FakeInstances(
+        [instance(f"c-n-{i}", zone=f"{ZONES}/us-central1-a") for i in range(5)]
+        + [instance(f"c-m-{i}", zone=f"{ZONES}/us-central1-c") for i in range(3)]
+        # outside the nodeset zones, like the controller or a removed zone
+        + [instance("c-x-0", zone=f"{ZONES}/europe-west4-a")]
+    )
+    nodesets = {"n": {"zone_policy_allow": ["us-central1-a", "us-central1-c"]}}
+    # the zones of the instances are not known yet
+    instances = make_lookup(compute, nodeset=nodesets).instances(profile="sync")
+    assert compute.lists == [",".join(sorted(util.INSTANCE_FIELD_PROFILES["sync"]))]
+    assert instances["c-x-0"].zone == "europe-west4-a"
+
+    compute.lists.clear()
+    lkp = make_lookup(compute, nodeset=nodesets)
+    instances = lkp.instances()
+    assert set(instances) == {f"c-n-{i}" for i in range(5)} | {
+        f"c-m-{i}" for i in range(3)
+    } | {"c-x-0"}
+    assert instances["c-m-0"].zone == "us-central1-c"
+    assert {zone for zone, _ in compute.lists} == {
+        "europe-west4-a",
+        "us-central1-a",
+        "us-central1-c",
+    }
+
+    # incremental refresh lists the same zones
+    compute.lists.clear()
+    compute.servers["c-n-0"]["status"] = "TERMINATED"
+    instances = make_lookup(compute, nodeset=nodesets).instances()
+    assert sorted(compute.lists) == [
+        (zone, ",".join(util.INVENTORY_FIELDS))
+        for zone in ("europe-west4-a", "us-central1-a", "us-central1-c")
+    ]
+    assert compute.gets == ["c-n-0"]
+    assert instances["c-n-0"].status == "TERMINATED"
+
+
+def test_instance_zones_expire(make_lookup, monkeypatch):
+    compute = FakeInstances([instance("c-n-0", zone=f"{ZONES}/europe-west4-a")])
+    nodesets = {"n": {"zone_policy_allow": ["us-central1-a"]}}
+    lkp = make_lookup(compute, nodeset=nodesets)
+    lkp.instances(profile="sync")
+    assert lkp.instance_zones("proj", "c") == [
+        "europe-west4-a",
+        "us-central1-a",
+    ]
+    assert lkp.instance_zones("other-project", "c") is None
+
+    # zones may have been added since the last aggregatedList
+    now = util.time()
+    monkeypatch.setattr(util, "time", lambda: now + util.INSTANCE_ZONES_MAX_AGE + 1)
+    assert lkp.instance_zones("proj", "c") is None
+    compute.lists.clear()
+    make_lookup(compute, nodeset=nodesets).instances(profile="sync")
+    assert compute.lists == [",".join(sorted(util.INSTANCE_FIELD_PROFILES["sync"]))]
+
+
+def test_field_profiles(make_lookup, tmp_path):
+    compute = FakeInstances([instance("c-n-0"), instance("c-login", role="login")])
+    lkp = make_lookup(compute)
+    instances = lkp.instances(profile="sync")
+    assert compute.lists == [",".join(sorted(util.INSTANCE_FIELD_PROFILES["sync"]))]
+    assert instances["c-n-0"].role == "compute"
+    assert instances["c-login"].role == "login"
+    assert instances["c-n-0"].zone == "us-central1-a"
+    assert instances["c-n-0"].scheduling.preemptible is False
+    assert "metadata" not in instances["c-n-0"]
+    assert lkp.instance("c-n-0", profile="sync") is instances["c-n-0"]
+
+    # each profile has its own snapshot and cache entry
+    full = lkp.instances()
+    assert "disks" in full["c-n-0"]
+    assert {p.name for p in tmp_path.iterdir()} == {
+        "instances.sync.cache",
+        "instances.full.cache",
+    }
+    assert lkp.instances(profile="sync") is instances
+
+    # small profiles are listed again, not refreshed incrementally
+    compute.lists.clear()
+    make_lookup(compute).instances(profile="sync")
+    assert compute.lists == [",".join(sorted(util.INSTANCE_FIELD_PROFILES["sync"]))]
+    assert compute.gets == []
+
+    with pytest.raises(Exception, match="unknown instance field profile"):
+        lkp.instances(profile="nope")
+
+
+def test_plugin_fields(make_lookup, monkeypatch):
+    def register_instance_information_fields(instance_information_fields, **kwargs):
+        instance_information_fields.append("resourceStatus")
+
+    monkeypatch.setattr(util, "lkp", NSDict(cfg=NSDict(enable_slurm_gcp_plugins=True)))
+    monkeypatch.setattr(
+        slurm_gcp_plugins,
+        "register_instance_information_fields",
+        register_instance_information_fields,
+    )
+    compute = FakeInstances([instance("c-n-0")])
+    instances = make_lookup(compute).instances(profile="suspend")
+    assert instances["c-n-0"].resourceStatus.physicalHost == "host"
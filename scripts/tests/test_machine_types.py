@@ -0,0 +1,139 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from time import time
+
+import pytest
+
+import util
+from conftest import FakeCompute, FakeRequest, http_error
+
+ZONES = "https://www.googleapis.com/compute/v1/projects/proj/zones"
+
+
+def machine(name, zone, cpus=2):
+    return {
+        "name": name,
+        "zone": f"{ZONES}/{zone}",
+        "guestCpus": cpus,
+        "memoryMb": cpus * 4096,
+    }
+
+
+class FakeMachineTypes(FakeCompute):
+    def __init__(self, machines):
+        self.machines = machines
+        self.calls = []
+
+    def get(self, project, zone, machineType, fields):
+        def execute():
+            self.calls.append(("get", zone, machineType))
+            for m in self.machines:
+                if m["name"] == machineType and m["zone"] == f"{ZONES}/{zone}":
+                    return m
+            raise http_error(404)
+
+        return FakeRequest(execute)
+
+    def aggregatedList(self, project, filter, fields):
+        name = filter.split("=")[1]
+        self.calls.append(("aggregatedList", name))
+        found = [m for m in self.machines if m["name"] == name]
+        return FakeRequest(
+            lambda: {
+                "items": {
+                    f"zones/{util.trim_self_link(m['zone'])}": {"machineTypes": [m]}
+                    for m in found
+                }
+            }
+        )
+
+    def aggregatedList_next(self, op, result):
+        return None
+
+
+MACHINES = [
+    machine("n2-standard-2", "europe-west1-b"),
+    machine("n2-standard-2", "us-central1-a"),
+    machine("n2-standard-2", "us-central1-b"),
+    machine("n2-standard-4", "us-central1-b", cpus=4),
+]
+
+
+@pytest.fixture
+def compute():
+    return FakeMachineTypes(MACHINES)
+
+
+def test_cluster_zones_get(make_lookup, compute):
+    nodeset = {"zone_policy_allow": ["us-central1-b", "us-central1-a"]}
+    lkp = make_lookup(compute, nodeset={"n": nodeset})
+    assert lkp.machine_type("n2-standard-4").guestCpus == 4
+    # tried the cluster's zones in order, never listed every zone
+    assert compute.calls == [
+        ("get", "us-central1-a", "n2-standard-4"),
+        ("get", "us-central1-b", "n2-standard-4"),
+    ]
+
+    compute.calls.clear()
+    other = make_lookup(compute, nodeset={"n": nodeset})
+    assert other.machine_type("n2-standard-4") == lkp.machine_type("n2-standard-4")
+    assert compute.calls == []
+
+    with pytest.raises(Exception, match="not found"):
+        lkp.machine_type("n2-standard-8")
+
+
+def test_unknown_zones_list(make_lookup, compute):
+    subnet = "https://www.googleapis.com/compute/v1/projects/proj/regions/us-central1/subnetworks/s"
+    lkp = make_lookup(compute, nodeset_dyn={"d": {"subnetwork": subnet}})
+    info = lkp.machine_type("n2-standard-2")
+    assert info.zone.endswith("us-central1-a")
+    assert compute.calls == [("aggregatedList", "n2-standard-2")]
+
+    catalog = json.loads(lkp.machine_type_cache_path.read_text())
+    # only the cluster's region is kept
+    assert set(catalog["machine_types"]["proj"]["n2-standard-2"]) == {
+        "us-central1-a",
+        "us-central1-b",
+    }
+
+    # a zone already in the catalog needs no get
+    compute.calls.clear()
+    other = make_lookup(compute)
+    assert other.machine_type("n2-standard-2", zone="us-central1-b").guestCpus == 2
+    assert compute.calls == []
+    other.machine_type("n2-standard-2", zone="europe-west1-b")
+    assert compute.calls == [("get", "europe-west1-b", "n2-standard-2")]
+
+
+def test_catalog_ttl(make_lookup, compute):
+    nodeset = {"zone_policy_allow": ["us-central1-a"]}
+    make_lookup(compute, nodeset={"n": nodeset}).machine_type("n2-standard-2")
+    path = make_lookup(compute).machine_type_cache_path
+    catalog = json.loads(path.read_text())
+    entry = catalog["machine_types"]["proj"]["n2-standard-2"]["us-central1-a"]
+    entry["fetched"] = time() - 2 * util.MACHINE_TYPE_CACHE_TTL
+    path.write_text(json.dumps(catalog))
+
+    compute.calls.clear()
+    make_lookup(compute, nodeset={"n": nodeset}).machine_type("n2-standard-2")
+    assert compute.calls == [("get", "us-central1-a", "n2-standard-2")]
+
+
+def test_custom_machine_type(make_lookup, compute):
+    info = make_lookup(compute).machine_type("n2-custom-8-16384")
+    assert (info.guestCpus, info.memoryMb) == (8, 16384)
+    assert compute.calls == []
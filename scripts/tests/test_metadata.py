@@ -0,0 +1,187 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import util
+from util import MetadataClient
+
+
+class FakeMetadataServer(ThreadingHTTPServer):
+    """local stand-in for the metadata server"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), MetadataHandler)
+        self.tree = {
+            "instance": {
+                "attributes": {
+                    "slurm_bucket_path": "gs://bucket/cluster",
+                    "slurm_instance_role": "compute",
+                },
+                "zone": "projects/1/zones/us-central1-a",
+                "preempted": "FALSE",
+            },
+            "project": {"attributes": {"c-slurm-config": "config"}},
+        }
+        self.requests = []
+        self.clients = set()
+        self.changed = threading.Condition()
+
+    @property
+    def root(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/computeMetadata/v1"
+
+    def lookup(self, path):
+        value = self.tree
+        for key in filter(None, path.split("/")):
+            value = value[key]
+        return value
+
+    def set(self, path, value):
+        *parents, key = path.split("/")
+        with self.changed:
+            self.lookup("/".join(parents))[key] = value
+            self.changed.notify_all()
+
+
+def etag(value):
+    return hashlib.md5(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+class MetadataHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body, tag=None):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        if tag:
+            self.send_header("ETag", tag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        path = url.path[len("/computeMetadata/v1/") :]
+        server.requests.append((path, params))
+        server.clients.add(self.client_address)
+        if self.headers.get("Metadata-Flavor") != "Google":
+            return self.reply(403, "missing Metadata-Flavor")
+
+        with server.changed:
+            try:
+                value = server.lookup(path)
+            except KeyError:
+                return self.reply(404, "not found")
+            if params.get("wait_for_change") == "true":
+                # without last_etag, like the real server, wait for the next
+                # change of the current value
+                last_etag = params.get("last_etag", etag(value))
+                server.changed.wait_for(
+                    lambda: etag(server.lookup(path)) != last_etag,
+                    timeout=int(params.get("timeout_sec", 60)),
+                )
+                value = server.lookup(path)
+        if isinstance(value, dict):
+            if params.get("recursive") != "true":
+                return self.reply(200, "\n".join(value))
+            return self.reply(200, json.dumps(value), etag(value))
+        return self.reply(200, value, etag(value))
+
+
+@pytest.fixture
+def server():
+    srv = FakeMetadataServer()
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def client(server, monkeypatch):
+    client = MetadataClient(root=server.root)
+    monkeypatch.setattr(util, "metadata_client", client)
+    util._instance_metadata.cache_clear()
+    yield client
+    util._instance_metadata.cache_clear()
+
+
+def test_attributes_one_request(server, client):
+    assert util.instance_metadata("attributes/slurm_instance_role") == "compute"
+    assert util.instance_metadata("attributes/slurm_bucket_path") == (
+        "gs://bucket/cluster"
+    )
+    assert util.instance_metadata("zone") == "projects/1/zones/us-central1-a"
+    assert util.instance_metadata("zone") == "projects/1/zones/us-central1-a"
+    assert server.requests == [
+        ("instance/attributes/", {"recursive": "true"}),
+        ("instance/zone", {}),
+    ]
+    # the session kept one connection
+    assert len(server.clients) == 1
+
+    with pytest.raises(Exception, match="failed to get_metadata"):
+        util.instance_metadata("attributes/missing")
+    with pytest.raises(Exception, match="failed to get_metadata"):
+        client.get("instance/missing")
+
+
+def test_wait_for_change(server):
+    client = MetadataClient(root=server.root)
+    value, tag = client.wait_for_change("instance/preempted", timeout=10)
+    assert value == "FALSE"
+    # the first call gets the current value without waiting
+    assert server.requests == [("instance/preempted", {})]
+
+    # times out with the same value
+    assert client.wait_for_change("instance/preempted", tag, timeout=1) == (
+        value,
+        tag,
+    )
+
+    timer = threading.Timer(0.2, server.set, ("instance/preempted", "TRUE"))
+    timer.start()
+    value, new_tag = client.wait_for_change("instance/preempted", tag, timeout=10)
+    timer.join()
+    assert value == "TRUE"
+    assert new_tag != tag
+
+
+def test_wait_for_attributes(server):
+    client = MetadataClient(root=server.root)
+    attributes, tag = client.wait_for_change("instance/attributes/")
+    assert client.instance_attribute("slurm_instance_role") == "compute"
+    requests = len(server.requests)
+
+    server.set("instance/attributes/slurm_instance_role", "login")
+    attributes, tag = client.wait_for_change("instance/attributes/", tag)
+    assert attributes["slurm_instance_role"] == "login"
+    # the cached attributes were replaced by the changed ones
+    assert client.instance_attribute("slurm_instance_role") == "login"
+    assert len(server.requests) == requests + 1
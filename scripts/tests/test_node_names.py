@@ -0,0 +1,138 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+
+import pytest
+
+import conftest
+from util import NSDict, parse_node_name
+
+# the regex node names were parsed with before
+NODE_NAME_REGEX = re.compile(
+    r"^(?P<prefix>"
+    r"(?P<cluster>[^\s\-]+)"
+    r"-(?P<nodeset>\S+)"
+    r")"
+    r"-(?P<node>"
+    r"(?P<index>\d+)|"
+    r"(?P<range>\[[\d,-]+\])"
+    r")$"
+)
+
+NODE_NAMES = [
+    "c-n2-0",
+    "c-n2-10",
+    "cluster-debug-007",
+    "c-my-set-3",
+    "c-n2-[0-3]",
+    "c-n2-[0,2-4]",
+    "c-n-[1-2]-[3]",
+    "c--0",
+    "-n-0",
+    "c-n-",
+    "c-n-a1",
+    "c-n-[]",
+    "c-n-[a]",
+    "c-n-0]",
+    "c-n-[0-1",
+    "c n-n-0",
+    "c-n n-0",
+    "c-n-1 ",
+    "c-0",
+    "controller",
+]
+
+
+@pytest.mark.parametrize("name", NODE_NAMES)
+def test_parse_node_name(name):
+    m = NODE_NAME_REGEX.match(name)
+    if m is None:
+        with pytest.raises(Exception, match="is not valid"):
+            parse_node_name(name)
+    else:
+        assert parse_node_name(name)._asdict() == m.groupdict()
+
+
+TPU_SUBNET = (
+    "https://www.googleapis.com/compute/v1/projects/p/regions/us-east1/subnetworks/s"
+)
+SUBNET = (
+    "https://www.googleapis.com/compute/v1/projects/p/regions/us-central1/subnetworks/s"
+)
+
+
+class FakeLookup(conftest.FakeLookup):
+    hostname = "c-n2-4"
+
+
+@pytest.fixture
+def lkp():
+    return FakeLookup(
+        NSDict(
+            slurm_cluster_name="c",
+            nodeset={
+                "n2": {
+                    "nodeset_name": "n2",
+                    "instance_template": "tpl-n2",
+                    "subnetwork": SUBNET,
+                    "node_count_static": 2,
+                },
+            },
+            nodeset_tpu={
+                "v2": {"nodeset_name": "v2", "subnetwork": TPU_SUBNET},
+            },
+        )
+    )
+
+
+def test_node_accessors(lkp):
+    assert lkp.node_prefix("c-n2-1") == "c-n2"
+    assert lkp.node_nodeset_name("c-n2-1") == "n2"
+    assert lkp.node_index("c-n2-1") == 1
+    assert lkp.node_nodeset("c-n2-1").nodeset_name == "n2"
+    assert lkp.node_template("c-n2-1") == "tpl-n2"
+    assert lkp.node_region("c-n2-1") == "us-central1"
+    assert not lkp.node_is_tpu("c-n2-1")
+    assert lkp.node_is_static("c-n2-1")
+    assert not lkp.node_is_static("c-n2-2")
+    # the local host by default
+    assert lkp.node_index() == 4
+
+    assert lkp.node_is_tpu("c-v2-0")
+    assert lkp.node_nodeset("c-v2-0").nodeset_name == "v2"
+    assert lkp.node_region("c-v2-0") == "us-east1"
+
+    assert lkp.node_nodeset("c-gone-0") is None
+    assert not lkp.node_is_tpu("c-gone-0")
+    with pytest.raises(Exception, match="nodeset gone not found"):
+        lkp.node_template("c-gone-0")
+
+
+def test_bench_node_accessors(benchmark, lkp):
+    names = [f"c-{ns}-{i}" for ns in ("n2", "v2") for i in range(50_000)]
+
+    def resolve():
+        return [
+            (
+                lkp.node_prefix(name),
+                lkp.node_nodeset(name),
+                lkp.node_is_tpu(name),
+                lkp.node_region(name),
+            )
+            for name in names
+        ]
+
+    resolved = benchmark(resolve)
+    assert len(resolved) == 100_000
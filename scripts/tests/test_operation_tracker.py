@@ -0,0 +1,163 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+import util
+from util import OperationTracker, operation_error, operation_failed
+
+
+class FakeOperations:
+    def __init__(self, compute, scope):
+        self.compute = compute
+        self.scope = scope
+
+    def get(self, project, operation, **location):
+        assert project == "proj"
+        # back to the self links of the original operation
+        location = {k: f"{k}s/{v}" for k, v in location.items()}
+        return (self.scope, operation, location)
+
+
+class FakeBatch:
+    def __init__(self, compute, callback):
+        self.compute = compute
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.compute.batches += 1
+        for rid, (scope, name, location) in self.requests:
+            self.compute.gets.append(scope)
+            if name in self.compute.missing:
+                self.callback(rid, None, Exception(f"{name} not found"))
+                continue
+            self.compute.polls_left[name] -= 1
+            op = {**operation(name, **location), "operationType": "delete"}
+            if self.compute.polls_left[name] <= 0:
+                op["status"] = "DONE"
+                if name in self.compute.errors:
+                    op["error"] = {"errors": [{"code": "ERR", "message": "failed"}]}
+            self.callback(rid, op, None)
+
+
+class FakeCompute:
+    """compute operations that are done after a number of get calls"""
+
+    def __init__(self, polls_left, errors=(), missing=()):
+        self.polls_left = dict(polls_left)
+        self.errors = set(errors)
+        self.missing = set(missing)
+        self.batches = 0
+        self.gets = []
+
+    def zoneOperations(self):
+        return FakeOperations(self, "zone")
+
+    def regionOperations(self):
+        return FakeOperations(self, "region")
+
+    def globalOperations(self):
+        return FakeOperations(self, "global")
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+
+
+def operation(name, **location):
+    return {
+        "name": name,
+        "status": "RUNNING",
+        "selfLink": f"https://www.googleapis.com/compute/v1/projects/proj/operations/{name}",
+        **location,
+    }
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(util, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_tracker_batches_polls(sleeps):
+    compute = FakeCompute({f"op{i}": 1 + i % 3 for i in range(5000)})
+    tracker = OperationTracker(compute=compute)
+    tracker.update({f"n{i}": operation(f"op{i}", zone="zones/z") for i in range(5000)})
+    results = tracker.wait()
+
+    assert tracker.polls == 3
+    # each poll only gets the operations still pending
+    assert len(compute.gets) == 5000 + 3333 + 1666
+    assert compute.batches <= 3 * 5
+    assert len(results) == 5000
+    assert all(r["status"] == "DONE" for r in results.values())
+    assert results["n7"]["name"] == "op7"
+
+
+def test_tracker_scopes_and_outcomes(sleeps):
+    compute = FakeCompute({"a": 1, "b": 2, "c": 1}, errors={"b"}, missing={"c"})
+    tracker = OperationTracker(compute=compute)
+    tracker.add("a", operation("a", zone="zones/z"))
+    tracker.add("b", operation("b", region="regions/r"))
+    tracker.add("c", operation("c"))
+    tracker.add("d", {**operation("d"), "status": "DONE"})
+    results = tracker.wait()
+
+    assert set(compute.gets) == {"zone", "region", "global"}
+    assert not operation_failed(results["a"])
+    assert operation_failed(results["b"])
+    assert operation_error(results["b"]) == "ERR: failed"
+    assert isinstance(results["c"], Exception)
+    assert operation_error(results["c"]) == "c not found"
+    # already done operations are never polled
+    assert results["d"]["status"] == "DONE"
+    assert compute.gets.count("global") == 1
+
+
+def test_tracker_adaptive_interval(sleeps):
+    compute = FakeCompute({"slow": 6, "fast": 2})
+    tracker = OperationTracker(compute=compute, min_interval=1, max_interval=3)
+    tracker.update({"slow": operation("slow"), "fast": operation("fast")})
+    tracker.wait()
+    # backs off while nothing finishes, resets when an operation is done
+    assert sleeps == [2, 1, 2, 3, 3]
+
+
+def test_tracker_deadline(sleeps, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(util, "time", lambda: now[0])
+    monkeypatch.setattr(util, "sleep", lambda s: now.__setitem__(0, now[0] + s))
+    compute = FakeCompute({"stuck": 100, "done": 1})
+    tracker = OperationTracker(compute=compute)
+    tracker.update({"stuck": operation("stuck"), "done": operation("done")})
+    results = tracker.wait(deadline=1010)
+
+    assert now[0] == 1010
+    assert results["done"]["status"] == "DONE"
+    assert isinstance(results["stuck"], TimeoutError)
+    assert not tracker.pending
+
+
+def test_wait_for_operations(sleeps, monkeypatch):
+    compute = FakeCompute({"a": 2, "b": 1})
+    ops = util.wait_for_operations([operation("a"), operation("b")], compute=compute)
+    assert [op["name"] for op in ops] == ["a", "b"]
+
+    compute = FakeCompute({"a": 1}, missing={"b"})
+    with pytest.raises(Exception, match="b not found"):
+        util.wait_for_operations([operation("a"), operation("b")], compute=compute)
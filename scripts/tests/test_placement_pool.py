@@ -0,0 +1,148 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import pytest
+
+from util import PlacementPool
+
+REGION = "us-central1"
+KEY = (REGION, None)
+
+
+@pytest.fixture
+def pool(tmp_path):
+    return PlacementPool(tmp_path / "placement_pool.json")
+
+
+def ready(*names):
+    return {name: "READY" for name in names}
+
+
+@pytest.mark.parametrize(
+    "name,parsed",
+    [
+        ("test-pool-us-central1-d0-0", ("us-central1", None, 0)),
+        ("test-pool-europe-west4-d3-12", ("europe-west4", 3, 12)),
+        ("test-c2-42-0", None),
+        ("other-pool-us-central1-d0-0", None),
+        ("test-pool-us-central1-0", None),
+    ],
+)
+def test_parse_policy_name(name, parsed):
+    assert PlacementPool.parse_policy_name(name) == parsed
+
+
+def test_policy_name_roundtrip():
+    name = PlacementPool.policy_name("europe-west4", 2, 7)
+    assert name == "test-pool-europe-west4-d2-7"
+    assert PlacementPool.parse_policy_name(name) == ("europe-west4", 2, 7)
+
+
+def test_sync_tops_up(pool):
+    create, delete = pool.sync({}, set(), set(), {KEY, ("europe-west4", 3)}, 2, 0)
+    assert sorted(create) == [
+        ("europe-west4", 3, "test-pool-europe-west4-d3-0"),
+        ("europe-west4", 3, "test-pool-europe-west4-d3-1"),
+        (REGION, None, "test-pool-us-central1-d0-0"),
+        (REGION, None, "test-pool-us-central1-d0-1"),
+    ]
+    assert delete == []
+
+    # policies being created count towards the pool, but are not leased
+    listed = {name: "CREATING" for _, _, name in create}
+    assert pool.sync(listed, set(), set(), {KEY}, 2, 0) == ([], [])
+    assert pool.lease({"g": (REGION, None, 1)}) == {}
+
+
+def test_lease(pool):
+    names = [PlacementPool.policy_name(REGION, None, i) for i in range(2)]
+    pool.sync(ready(*names), set(), set(), {KEY}, 2, 0)
+
+    leased = pool.lease(
+        {
+            "g1": (REGION, None, 1),
+            "g2": (REGION, 3, 1),
+            "g3": (REGION, None, 2),
+            "g4": (REGION, None, 3),
+        }
+    )
+    # no policies with maxDistance, and only two without
+    assert set(leased) == {"g1", "g3"}
+    assert sorted(leased.values()) == names
+    with pool.policies() as policies:
+        assert {p["job_id"] for p in policies.values()} == {"1", "2"}
+
+    # the leased policies are replaced
+    create, _ = pool.sync(ready(*names), {"1", "2"}, set(), {KEY}, 2, 1e12)
+    assert [name for _, _, name in create] == [
+        "test-pool-us-central1-d0-2",
+        "test-pool-us-central1-d0-3",
+    ]
+
+
+def test_return_lease(pool):
+    name = PlacementPool.policy_name(REGION, None, 0)
+    pool.sync(ready(name), set(), set(), {KEY}, 1, 0)
+    leased = pool.lease({"g": (REGION, None, 5)})
+    assert leased == {"g": name}
+
+    def job_id():
+        return json.loads(pool.path.read_text())[name]["job_id"]
+
+    # leased after the jobs were read, the job may not be in keep_jobs yet
+    pool.sync(ready(name), set(), set(), {KEY}, 0, 0)
+    assert job_id() == "5"
+    # the job is still running
+    pool.sync(ready(name), {"5"}, set(), {KEY}, 0, 1e12)
+    assert job_id() == "5"
+    # the job is done but its instances still use the policy
+    pool.sync(ready(name), set(), {name}, {KEY}, 0, 1e12)
+    assert job_id() == "5"
+
+    create, delete = pool.sync(ready(name), set(), set(), {KEY}, 1, 1e12)
+    assert job_id() is None
+    assert (create, delete) == ([], [])
+
+
+def test_sync_shrinks(pool):
+    names = [PlacementPool.policy_name(REGION, None, i) for i in range(3)]
+    pool.sync(ready(*names), set(), set(), {KEY}, 3, 0)
+    pool.lease({"g": (REGION, None, 1)})
+
+    create, delete = pool.sync(ready(*names), {"1"}, set(), {KEY}, 1, 1e12)
+    assert create == []
+    assert len(delete) == 1
+    with pool.policies() as policies:
+        assert len(policies) == 2
+        assert (REGION, delete[0][1]) == delete[0]
+        assert delete[0][1] not in policies
+
+    # regions no longer in use, or the pool disabled
+    names.remove(delete[0][1])
+    create, delete = pool.sync(ready(*names), {"1"}, set(), set(), 1, 1e12)
+    assert create == []
+    assert len(delete) == 1
+    with pool.policies() as policies:
+        assert [p["job_id"] for p in policies.values()] == ["1"]
+
+
+def test_sync_drops_missing(pool):
+    names = [PlacementPool.policy_name(REGION, None, i) for i in range(2)]
+    pool.sync(ready(*names), set(), set(), {KEY}, 2, 0)
+    # deleted outside of slurmsync
+    create, _ = pool.sync(ready(names[1]), set(), set(), {KEY}, 2, 0)
+    assert create == [(REGION, None, names[0])]
+    assert pool.lease({"g": (REGION, None, 1)}) == {"g": names[1]}
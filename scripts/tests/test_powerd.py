@@ -0,0 +1,198 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import threading
+from pathlib import Path
+from time import sleep
+
+import pytest
+
+import powerd
+import util
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(powerd, "refresh_lookup", lambda: None)
+    monkeypatch.setattr(
+        powerd.resume,
+        "main",
+        lambda nodelist, force: calls.append(
+            ("resume", nodelist, powerd.resume.global_resume_data)
+        ),
+    )
+    monkeypatch.setattr(
+        powerd.suspend, "main", lambda nodelist: calls.append(("suspend", nodelist))
+    )
+    socket_path = tmp_path / "powerd.sock"
+    srv = powerd.Server(socket_path)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield socket_path, srv, calls
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_no_daemon(tmp_path):
+    assert util.powerd_request({"program": "suspend"}, tmp_path / "none") is None
+
+
+def test_requests(server):
+    socket_path, _, calls = server
+    resume_data = {"jobs": [{"job_id": 1, "nodes_alloc": "n-0"}]}
+    reply = util.powerd_request(
+        {"program": "resume", "nodelist": "n-[0-1]", "resume_data": resume_data},
+        socket_path,
+    )
+    assert reply == {"status": "ok"}
+    reply = util.powerd_request({"program": "suspend", "nodelist": "n-0"}, socket_path)
+    assert reply == {"status": "ok"}
+    assert calls == [("resume", "n-[0-1]", resume_data), ("suspend", "n-0")]
+    assert powerd.resume.global_resume_data is None
+
+    reply = util.powerd_request({"program": "rm"}, socket_path)
+    assert reply["status"] == "error"
+
+
+def test_error(server, monkeypatch):
+    socket_path, _, _ = server
+
+    def fail(nodelist):
+        raise Exception("boom")
+
+    monkeypatch.setattr(powerd.suspend, "main", fail)
+    reply = util.powerd_request({"program": "suspend", "nodelist": "n-0"}, socket_path)
+    assert reply == {"status": "error", "error": "boom"}
+
+
+def test_config_change_restarts(server):
+    socket_path, srv, calls = server
+    srv.config_mtime = -1
+    reply = util.powerd_request({"program": "suspend", "nodelist": "n-0"}, socket_path)
+    assert reply is None
+    assert calls == []
+    assert Path(socket_path).exists()
+
+
+@pytest.mark.parametrize("reply", [b"", b"not json\n", None])
+def test_no_fallback_after_send(tmp_path, reply):
+    """once the request is sent, failures are errors, not run in-process"""
+    socket_path = tmp_path / "powerd.sock"
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(socket_path))
+    listener.listen()
+
+    def serve():
+        conn, _ = listener.accept()
+        with conn:
+            conn.makefile("rb").readline()
+            if reply is None:
+                # never reply
+                sleep(1)
+            else:
+                conn.sendall(reply)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    try:
+        reply = util.powerd_request(
+            {"program": "suspend", "nodelist": "n-0"}, socket_path, timeout=0.2
+        )
+    finally:
+        thread.join()
+        listener.close()
+    assert reply["status"] == "error"
+
+
+def test_merge_resume_requests():
+    requests = [
+        {
+            "program": "resume",
+            "nodelist": "c-a-[0-1]",
+            "resume_data": {
+                "all_nodes_resume": "c-a-[0-1]",
+                "jobs": [{"job_id": 1, "nodes_resume": "c-a-[0-1]"}],
+            },
+        },
+        {"program": "resume", "nodelist": "c-a-2"},
+        {
+            "program": "resume",
+            "nodelist": "c-a-[3-4],c-b-0",
+            "force": True,
+            "resume_data": {
+                "all_nodes_resume": "c-a-[3-4],c-b-0",
+                "jobs": [
+                    {"job_id": 1, "nodes_resume": "c-a-3"},
+                    {"job_id": 2, "nodes_resume": "c-a-4,c-b-0"},
+                ],
+            },
+        },
+    ]
+    merged = powerd.merge_resume_requests(requests)
+    assert merged == {
+        "program": "resume",
+        "nodelist": "c-a-[0-4],c-b-0",
+        "force": True,
+        "resume_data": {
+            "all_nodes_resume": "c-a-[0-1,3-4],c-b-0",
+            "jobs": [
+                {"job_id": 1, "nodes_resume": "c-a-[0-1,3]"},
+                {"job_id": 2, "nodes_resume": "c-a-4,c-b-0"},
+            ],
+        },
+    }
+    # inputs are not modified
+    assert requests[0]["resume_data"]["jobs"][0]["nodes_resume"] == "c-a-[0-1]"
+
+
+def test_resume_requests_coalesced(server, monkeypatch):
+    socket_path, _, calls = server
+    monkeypatch.setitem(powerd.cfg, "resume_coalesce_window", 0.2)
+    replies = []
+
+    def client(i):
+        replies.append(
+            util.powerd_request(
+                {"program": "resume", "nodelist": f"n-{i}"}, socket_path
+            )
+        )
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert replies == [{"status": "ok"}] * 5
+    assert calls == [("resume", "n-[0-4]", None)]
+
+
+def test_request_timeout(monkeypatch):
+    monkeypatch.setattr(
+        util, "lkp", util.NSDict(cfg={"cloud_parameters": {"resume_timeout": 1800}})
+    )
+    # longer than a resume waiting for the one before it
+    assert util.powerd_request_timeout() > 2 * 1800
+    monkeypatch.setattr(util, "lkp", util.NSDict(cfg={}))
+    assert util.powerd_request_timeout() == 900
+
+
+def test_refresh_lookup(tmp_path):
+    script = tmp_path / "startup.sh"
+    script.write_text("old")
+    assert powerd.resume.startup_script(tmp_path) == "old"
+    script.write_text("new")
+    powerd.refresh_lookup()
+    assert powerd.resume.startup_script(tmp_path) == "new"
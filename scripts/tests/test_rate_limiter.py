@@ -0,0 +1,148 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import multiprocessing
+
+import pytest
+
+import util
+from util import RateLimiter, rate_limit_key
+
+API = "https://compute.googleapis.com/compute/v1/projects/proj"
+
+
+class FakeRequest:
+    def __init__(self, path, method="GET"):
+        self.uri = f"{API}/{path}?alt=json"
+        self.method = method
+
+
+@pytest.mark.parametrize(
+    "path,method,key",
+    [
+        ("zones/us-central1-a/instances/n1", "GET", ("read", "us-central1")),
+        ("zones/us-central1-a/instances/n1", "DELETE", ("mutate", "us-central1")),
+        ("regions/europe-west4/resourcePolicies", "POST", ("mutate", "europe-west4")),
+        ("zones/us-east1-b/operations/op1", "GET", ("operations", "us-east1")),
+        ("zones/us-east1-b/operations/op1/wait", "POST", ("operations", "us-east1")),
+        ("global/operations/op1", "GET", ("operations", "global")),
+        ("global/images/family/img", "GET", ("read", "global")),
+    ],
+)
+def test_rate_limit_key(path, method, key):
+    assert rate_limit_key(FakeRequest(path, method)) == key
+
+
+def test_rate_limit_key_not_http():
+    assert rate_limit_key(object()) is None
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """fake time, advanced by sleep"""
+    now = [1000.0]
+    sleeps = []
+
+    def sleep(secs):
+        sleeps.append(secs)
+        now[0] += secs
+
+    monkeypatch.setattr(util, "time", lambda: now[0])
+    monkeypatch.setattr(util, "sleep", sleep)
+    return now, sleeps
+
+
+def test_acquire_burst_then_rate(tmp_path, clock):
+    now, sleeps = clock
+    limiter = RateLimiter(tmp_path, rates={"read": 10}, burst=20)
+    key = ("read", "us-central1")
+    limiter.acquire(key, 20)
+    assert sleeps == []
+    limiter.acquire(key, 5)
+    assert sleeps == [pytest.approx(0.5)]
+    # refilled while sleeping
+    now[0] += 1
+    limiter.acquire(key, 10)
+    assert len(sleeps) == 1
+
+
+def test_buckets_are_separate(tmp_path, clock):
+    _, sleeps = clock
+    limiter = RateLimiter(tmp_path, rates={"read": 10, "mutate": 10}, burst=10)
+    limiter.acquire(("read", "us-central1"), 10)
+    limiter.acquire(("read", "us-east1"), 10)
+    limiter.acquire(("mutate", "us-central1"), 10)
+    assert sleeps == []
+    assert {p.name for p in tmp_path.iterdir()} == {
+        "read.us-central1",
+        "read.us-east1",
+        "mutate.us-central1",
+    }
+
+
+def test_throttle_and_recover(tmp_path, clock):
+    now, sleeps = clock
+    limiter = RateLimiter(tmp_path, rates={"mutate": 20}, burst=100)
+    key = ("mutate", "global")
+    limiter.acquire(key)
+    limiter.throttle(key)
+    # a burst of rate limited responses only counts once
+    limiter.throttle(key)
+    with limiter.bucket(key) as state:
+        assert state["rate"] == 10
+        assert state["tokens"] <= 0
+    limiter.acquire(key, 10)
+    assert sleeps[-1] == pytest.approx(1)
+
+    now[0] += 10
+    limiter.throttle(key)
+    with limiter.bucket(key) as state:
+        # recovered 20 * 0.02 * 11s = 4.4 before halving
+        assert state["rate"] == pytest.approx((10 + 4.4) / 2)
+
+    now[0] += 1000
+    with limiter.bucket(key) as state:
+        assert state["rate"] == 20
+        assert state["tokens"] == 100
+
+
+def test_unusable_directory(tmp_path, clock):
+    _, sleeps = clock
+    limiter = RateLimiter(tmp_path / "missing" / "ratelimit", burst=1)
+    for _ in range(3):
+        limiter.acquire(("read", "global"))
+    limiter.throttle(("read", "global"))
+    assert sleeps == []
+
+
+def take_tokens(directory, count):
+    limiter = RateLimiter(directory, rates={"read": 1}, burst=1000)
+    for _ in range(count):
+        limiter.acquire(("read", "global"))
+
+
+def test_shared_between_processes(tmp_path):
+    procs = [
+        multiprocessing.Process(target=take_tokens, args=(tmp_path, 100))
+        for _ in range(4)
+    ]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+        assert proc.exitcode == 0
+    state = json.loads((tmp_path / "read.global").read_text())
+    # no updates lost to concurrent writes
+    assert state["tokens"] == pytest.approx(600, abs=5)
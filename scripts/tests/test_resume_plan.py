@@ -0,0 +1,367 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+import resume
+import util
+from util import NSDict, to_hostlist
+
+SUBNET = (
+    "https://www.googleapis.com/compute/v1/projects/p/regions/us-central1/subnetworks/s"
+)
+
+
+def nodeset(name, enable_placement=False, count=10_000):
+    return {
+        "nodeset_name": name,
+        "instance_template": f"tpl-{name}",
+        "subnetwork": SUBNET,
+        "enable_placement": enable_placement,
+        "node_count_static": 0,
+        "node_count_dynamic_max": count,
+        "zone_policy_allow": ["us-central1-a"],
+    }
+
+
+CONFIG = {
+    "slurm_cluster_name": "c",
+    "project": "p",
+    "slurm_scripts_dir": str(Path(resume.__file__).parent),
+    "partitions": {
+        "debug": {
+            "partition_nodeset": ["n2", "c2"],
+            "partition_nodeset_tpu": [],
+            "enable_job_exclusive": True,
+        },
+    },
+    "nodeset": {"n2": nodeset("n2"), "c2": nodeset("c2", enable_placement=True)},
+}
+
+
+def template_info(template_link, project=None):
+    return NSDict(
+        machineType="c2-standard-60",
+        metadata={"items": [{"key": "enable-oslogin", "value": "TRUE"}]},
+        labels={"template": template_link},
+        disks=[
+            {"boot": True, "initializeParams": {"diskType": "pd-ssd"}},
+            {"initializeParams": {"diskType": "local-ssd"}},
+        ],
+    )
+
+
+@pytest.fixture
+def lkp(make_lookup, monkeypatch):
+    lkp = make_lookup(**CONFIG)
+    cfg = lkp.cfg
+    monkeypatch.setattr(lkp, "template_info", template_info)
+    for module in (resume, util):
+        monkeypatch.setattr(module, "lkp", lkp)
+        monkeypatch.setattr(module, "cfg", cfg)
+    resume.base_instance_properties.cache_clear()
+    yield lkp
+    resume.base_instance_properties.cache_clear()
+
+
+def job(job_id, nodes_alloc, nodes_resume=None):
+    return {
+        "job_id": job_id,
+        "partition": "debug",
+        "nodes_alloc": nodes_alloc,
+        "nodes_resume": nodes_resume or nodes_alloc,
+    }
+
+
+def test_jobless_nodesets(lkp):
+    nodes = ["c-c2-0", "c-c2-1", "c-n2-0", "c-n2-1"]
+    plan = resume.plan_resume(nodes)
+    # placement for c2, none for n2
+    assert set(plan.placement_groups) == {"c-c2-0-0"}
+    assert plan.placement_groups["c-c2-0-0"] == ("us-central1", ["c-c2-0", "c-c2-1"])
+    assert {group: chunk.nodes for group, chunk in plan.bulk_groups.items()} == {
+        "c-c2:jobNone:c-c2-0-0:0": ["c-c2-0", "c-c2-1"],
+        "c-n2:0": ["c-n2-0", "c-n2-1"],
+    }
+    insert = plan.inserts["c-c2:jobNone:c-c2-0-0:0"]
+    assert insert.region == "us-central1"
+    assert insert.body.count == 2
+    assert insert.body.instanceProperties.resourcePolicies == ["c-c2-0-0"]
+    assert not plan.inserts["c-n2:0"].body.instanceProperties.resourcePolicies
+
+
+def test_job_plan(lkp):
+    resume_data = NSDict(
+        jobs=[
+            job(1, "c-c2-[0-3]", "c-c2-[2-3]"),
+            job(2, "c-n2-[0-1]"),
+        ]
+    )
+    before = resume_data.deepcopy()
+    nodes = ["c-c2-2", "c-c2-3", "c-n2-0", "c-n2-1", "c-n2-5"]
+    plan = resume.plan_resume(nodes, resume_data)
+    assert resume_data == before
+
+    # the placement group covers all allocated nodes, only resumed ones are
+    # inserted
+    assert plan.placement_groups["c-c2-1-0"].nodes == [f"c-c2-{i}" for i in range(4)]
+    assert {group: chunk.nodes for group, chunk in plan.bulk_groups.items()} == {
+        "c-c2:job1:c-c2-1-0:0": ["c-c2-2", "c-c2-3"],
+        "c-n2:job2:0": ["c-n2-0", "c-n2-1"],
+        "c-n2:0": ["c-n2-5"],
+    }
+    props = plan.inserts["c-n2:job2:0"].body.instanceProperties
+    assert props.labels["slurm_job_id"] == 2
+    assert props.labels["template"] == "tpl-n2"
+    assert props.disks[0].initializeParams.labels["slurm_job_id"] == 2
+    assert "labels" not in props.disks[1].initializeParams
+    # job labels are not shared between requests
+    props = plan.inserts["c-c2:job1:c-c2-1-0:0"].body.instanceProperties
+    assert props.labels["slurm_job_id"] == 1
+    assert props.disks[0].initializeParams.labels["slurm_job_id"] == 1
+    base = resume.base_instance_properties("c2")
+    assert "slurm_job_id" not in base.labels
+    assert "slurm_job_id" not in base.disks[0].initializeParams.labels
+    assert not base.resourcePolicies
+
+    data = resume.plan_to_dict(plan)
+    assert json.loads(json.dumps(data)) == data
+    assert data["bulk_inserts"]["c-c2:job1:c-c2-1-0:0"]["nodes"] == "c-c2-[2-3]"
+
+
+def test_print_plan(lkp, capsys):
+    resume.print_plan("c-n2-[0-2],local-0")
+    plan = json.loads(capsys.readouterr().out)
+    assert plan["bulk_inserts"]["c-n2:0"]["nodes"] == "c-n2-[0-2]"
+    assert plan["placement_groups"] == {}
+
+
+class NoCompute:
+    def __getattr__(self, name):
+        raise AssertionError(f"compute.{name} called")
+
+
+def test_print_plan_no_changes(lkp, capsys, monkeypatch, tmp_path):
+    monkeypatch.setattr(util, "compute", NoCompute())
+    pool = util.PlacementPool(tmp_path / "placement_pool.json")
+    pool_policy = util.PlacementPool.policy_name("us-central1", None, 0)
+    pool.sync({pool_policy: "READY"}, set(), set(), {("us-central1", None)}, 1, 0)
+    before = pool.path.read_text()
+    monkeypatch.setattr(util, "placement_pool", pool)
+    lkp.cfg["placement_pool_size"] = 1
+
+    def hook(**kwargs):
+        raise AssertionError("plugin hook called")
+
+    lkp.cfg["enable_slurm_gcp_plugins"] = {"test": {}}
+    for name in ("pre_placement_group_insert", "pre_instance_bulk_insert"):
+        monkeypatch.setattr(resume.slurm_gcp_plugins, name, hook)
+
+    resume.print_plan("c-c2-[0-1]", NSDict(jobs=[job(1, "c-c2-[0-1]")]))
+    plan = json.loads(capsys.readouterr().out)
+    assert set(plan["placement_groups"]) == {"c-c2-1-0"}
+    assert plan["leased_placement_groups"] == {}
+    assert pool.path.read_text() == before
+
+
+def bench_resume_data(nodes=10_000, jobs=1_000):
+    """resume data of jobs with nodes / jobs nodes each, spread over both
+    nodesets
+    """
+    per_job = nodes // jobs
+    return NSDict(
+        jobs=[
+            job(
+                i,
+                to_hostlist(
+                    f"c-{'c2' if i % 2 else 'n2'}-{n}"
+                    for n in range(i * per_job, (i + 1) * per_job)
+                ),
+            )
+            for i in range(jobs)
+        ]
+    )
+
+
+def test_bench_plan_resume(benchmark, lkp):
+    resume_data = bench_resume_data()
+    nodes = util.to_hostnames([job.nodes_resume for job in resume_data.jobs])
+
+    plan = benchmark.pedantic(
+        resume.plan_resume, (nodes, resume_data), rounds=3, iterations=1
+    )
+    assert len(plan.bulk_groups) == 1_000
+    assert sum(len(chunk.nodes) for chunk in plan.bulk_groups.values()) == 10_000
+    assert len(plan.placement_groups) == 500
+
+    tracemalloc.start()
+    resume.plan_resume(nodes, resume_data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    benchmark.extra_info["peak_alloc_mib"] = round(peak / 2**20, 1)
+    print(f"plan_resume peak allocations {peak / 2**20:.1f} MiB")
+
+
+def test_bulk_inserts_pipelined(lkp, monkeypatch):
+    resume_data = NSDict(
+        jobs=[job(1, "c-c2-[0-1]"), job(2, "c-c2-[2-3]"), job(3, "c-n2-[0-1]")]
+    )
+    nodes = util.to_hostnames([job.nodes_resume for job in resume_data.jobs])
+    plan = resume.plan_resume(nodes, resume_data)
+    events = []
+
+    monkeypatch.setattr(
+        resume, "create_placement_request", lambda name, region, body=None: name
+    )
+    monkeypatch.setattr(
+        resume,
+        "batch_execute",
+        lambda requests: ({name: {"name": name} for name in requests}, {}),
+    )
+
+    def wait_for_operations(ops, deadline=None):
+        # job 2's policy is done first
+        for name in sorted(ops, reverse=True):
+            events.append(f"ready {name}")
+            yield name, ops[name]
+
+    def bulk_insert_request(insert):
+        nodelist = to_hostlist(insert.nodes)
+        events.append(f"insert {nodelist}")
+        return nodelist
+
+    monkeypatch.setattr(resume, "wait_for_operations_as_completed", wait_for_operations)
+    monkeypatch.setattr(resume, "bulk_insert_request", bulk_insert_request)
+    monkeypatch.setattr(resume, "ensure_execute", lambda nodelist: {"name": nodelist})
+
+    ops = resume.start_bulk_inserts(plan)
+    assert ops == {
+        group: {"name": to_hostlist(insert.nodes)}
+        for group, insert in plan.inserts.items()
+    }
+    # inserts without placement start first, the others once their own
+    # policy is ready
+    assert events == [
+        "insert c-n2-[0-1]",
+        "ready c-c2-2-0",
+        "insert c-c2-[2-3]",
+        "ready c-c2-1-0",
+        "insert c-c2-[0-1]",
+    ]
+
+
+def test_bulk_inserts_pool_lease(lkp, monkeypatch, tmp_path):
+    resume_data = NSDict(jobs=[job(1, "c-c2-[0-1]"), job(2, "c-c2-[2-3]")])
+    nodes = util.to_hostnames([job.nodes_resume for job in resume_data.jobs])
+
+    pool = util.PlacementPool(tmp_path / "placement_pool.json")
+    pool_policy = util.PlacementPool.policy_name("us-central1", None, 0)
+    pool.sync({pool_policy: "READY"}, set(), set(), {("us-central1", None)}, 1, 0)
+    monkeypatch.setattr(util, "placement_pool", pool)
+    lkp.cfg["placement_pool_size"] = 1
+
+    # each plugin hook runs once per policy or bulkInsert
+    hooks = []
+    lkp.cfg["enable_slurm_gcp_plugins"] = {"test": {}}
+    monkeypatch.setattr(
+        resume.slurm_gcp_plugins,
+        "pre_placement_group_insert",
+        lambda pg_name, **kwargs: hooks.append(("policy", pg_name)),
+    )
+    monkeypatch.setattr(
+        resume.slurm_gcp_plugins,
+        "pre_instance_bulk_insert",
+        lambda placement_group, **kwargs: hooks.append(("insert", placement_group)),
+    )
+
+    plan = resume.plan_resume(nodes, resume_data, lease=True)
+    assert plan.leased == {"c-c2-1-0": pool_policy}
+    assert set(plan.placement_groups) == {"c-c2-2-0"}
+
+    created = []
+
+    def create_placement_groups(groups, policies=None, deadline=None):
+        created.extend((group, policies[group]["name"]) for group in groups)
+        yield from groups
+
+    monkeypatch.setattr(resume, "create_placement_groups", create_placement_groups)
+    monkeypatch.setattr(
+        resume, "bulk_insert_request", lambda insert: insert.body.to_dict()
+    )
+    monkeypatch.setattr(resume, "ensure_execute", lambda body: body)
+
+    ops = resume.start_bulk_inserts(plan)
+    policies = {
+        group: body["instanceProperties"]["resourcePolicies"]
+        for group, body in ops.items()
+    }
+    # job 1 got the pool policy, job 2 its own
+    assert policies == {
+        "c-c2:job1:c-c2-1-0:0": [pool_policy],
+        "c-c2:job2:c-c2-2-0:0": ["c-c2-2-0"],
+    }
+    assert created == [("c-c2-2-0", "c-c2-2-0")]
+    assert sorted(hooks) == [
+        ("insert", "c-c2-2-0"),
+        ("insert", pool_policy),
+        ("policy", "c-c2-1-0"),
+        ("policy", "c-c2-2-0"),
+    ]
+    with pool.policies() as policies:
+        assert policies[pool_policy]["job_id"] == "1"
+
+    # without lease, as for --plan-only, the pool is not used
+    assert not resume.plan_resume(nodes, resume_data).leased
+
+
+class FakeHttpError(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.error_details = [{"reason": reason}]
+
+
+def test_placement_groups_errors(lkp, monkeypatch):
+    groups = {
+        name: resume.PlacementGroup("us-central1", [f"c-c2-{i}"])
+        for i, name in enumerate(["exists", "failed", "created"])
+    }
+    monkeypatch.setattr(
+        resume, "create_placement_request", lambda name, region, body=None: name
+    )
+    monkeypatch.setattr(
+        resume,
+        "batch_execute",
+        lambda requests: (
+            {"created": {"name": "created"}},
+            {
+                "exists": ("exists", FakeHttpError("alreadyExists")),
+                "failed": ("failed", FakeHttpError("quotaExceeded")),
+            },
+        ),
+    )
+    monkeypatch.setattr(
+        resume,
+        "wait_for_operations_as_completed",
+        lambda ops, deadline=None: iter(ops.items()),
+    )
+    # all are handed on, inserts into failed policies down their nodes
+    assert list(resume.create_placement_groups(groups)) == [
+        "exists",
+        "failed",
+        "created",
+    ]
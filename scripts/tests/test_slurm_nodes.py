@@ -0,0 +1,162 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+from datetime import datetime
+
+import pytest
+
+import util
+from util import NodeBase, NodeFlag, NSDict, parse_slurm_nodes
+
+# `scontrol show nodes --oneliner` lines
+CLOUD_NODE = (
+    "NodeName=c-n2-{i} Arch=x86_64 CoresPerSocket=1 CPUAlloc=0 CPUEfctv=2 "
+    "CPUTot=2 CPULoad=N/A AvailableFeatures=c-n2,cloud ActiveFeatures=c-n2,cloud "
+    "Gres=(null) NodeAddr=10.0.0.{i} NodeHostName=c-n2-{i} Version=23.11.4 "
+    "OS=Linux 5.10.0-28-cloud-amd64 #1 SMP Debian 5.10.209-2 (2024-01-31) "
+    "RealMemory=7552 AllocMem=0 FreeMem=N/A Sockets=2 Boards=1 "
+    "State=IDLE+CLOUD+POWERED_DOWN ThreadsPerCore=1 TmpDisk=0 Weight=1 "
+    "Owner=N/A MCS_label=N/A Partitions=debug BootTime=None "
+    "SlurmdStartTime=None LastBusyTime=2024-03-01T10:20:30 "
+    "ResumeAfterTime=None CfgTRES=cpu=2,mem=7552M,billing=2 AllocTRES= "
+    "CapWatts=n/a CurrentWatts=0 AveWatts=0 ExtSensorsJoules=n/s "
+    "ExtSensorsWatts=0 ExtSensorsTemp=n/s "
+    "Reason=Instance stopped/deleted [slurm@2024-03-01T10:21:00] Comment=x"
+)
+LOCAL_NODE = (
+    "NodeName=local-0 CoresPerSocket=1 CPUAlloc=0 State=DOWN+NOT_RESPONDING "
+    "NodeAddr=local-0 NodeHostName=local-0 AvailableFeatures=(null) "
+    "LastBusyTime=Unknown"
+)
+DYNAMIC_NODE = (
+    "NodeName=dyn-0 State=MIXED+DYNAMIC_NORM LastBusyTime=None "
+    "AvailableFeatures=dyn NodeAddr=dyn-0.example.com NodeHostName=dyn-0"
+)
+
+
+def test_parse_cloud_node():
+    (node,) = parse_slurm_nodes([CLOUD_NODE.format(i=1) + "\n"])
+    assert node.name == "c-n2-1"
+    assert node.base == "IDLE"
+    assert node.flags == {"CLOUD", "POWERED_DOWN"}
+    assert node.base_state is NodeBase.IDLE
+    assert node.state_flags == NodeFlag.CLOUD | NodeFlag.POWERED_DOWN
+    assert node.reason == "Instance stopped/deleted [slurm@2024-03-01T10:21:00]"
+    assert node.features == ("c-n2", "cloud")
+    assert node.address == "10.0.0.1"
+    assert node.hostname == "c-n2-1"
+    assert node.last_busy == datetime(2024, 3, 1, 10, 20, 30)
+
+
+def test_parse_field_order():
+    fields = CLOUD_NODE.format(i=1).split(" ")
+    reordered = " ".join(fields[:1] + list(reversed(fields[1:])))
+    (node,) = parse_slurm_nodes([reordered])
+    (expected,) = parse_slurm_nodes([CLOUD_NODE.format(i=1)])
+    # the reason is split up by reversing the words, the rest is the same
+    assert node._replace(reason=None) == expected._replace(reason=None)
+
+
+def test_parse_missing_fields():
+    local, dynamic = parse_slurm_nodes([LOCAL_NODE, "", DYNAMIC_NODE])
+    assert local.base == "DOWN"
+    assert local.flags == {"NOT_RESPONDING"}
+    assert local.features == ()
+    assert local.reason is None
+    assert local.last_busy is None
+    assert dynamic.flags == {"DYNAMIC_NORM"}
+    assert dynamic.features == ("dyn",)
+    assert dynamic.address == "dyn-0.example.com"
+
+    (node,) = parse_slurm_nodes(["NodeName=bare"])
+    assert node.base == "UNKNOWN"
+    assert node.flags == frozenset()
+    assert node.hostname is None
+
+
+def test_parse_node_state():
+    base, flags, base_state, state_flags = util.parse_node_state(
+        "DOWN+CLOUD+POWERING_DOWN+NEW_FLAG"
+    )
+    assert base == "DOWN"
+    assert flags == {"CLOUD", "POWERING_DOWN", "NEW_FLAG"}
+    assert base_state is NodeBase.DOWN
+    # unknown flags are left out of the bitmask
+    assert state_flags == NodeFlag.CLOUD | NodeFlag.POWERING_DOWN
+    assert state_flags & NodeFlag.POWER
+    assert util.parse_node_state("SOMETHING_NEW")[2] is NodeBase.UNKNOWN
+
+
+@pytest.fixture
+def scontrol(tmp_path):
+    """fake scontrol printing the lines of tmp_path/nodes"""
+    nodes = tmp_path / "nodes"
+    script = tmp_path / "scontrol"
+    script.write_text(
+        f"""#!/bin/sh
+[ "$*" = "show nodes --oneliner" ] || exit 2
+cat {nodes}
+"""
+    )
+    script.chmod(0o755)
+    return nodes
+
+
+def test_lookup_slurm_nodes(scontrol, tmp_path, monkeypatch):
+    scontrol.write_text(
+        "\n".join([CLOUD_NODE.format(i=0), LOCAL_NODE, DYNAMIC_NODE]) + "\n"
+    )
+    monkeypatch.setattr(util, "cfg", NSDict(slurm_bin_dir=str(tmp_path)))
+    lkp = util.Lookup(NSDict(slurm_bin_dir=str(tmp_path)))
+    nodes = lkp.slurm_nodes()
+    assert set(nodes) == {"c-n2-0", "dyn-0"}
+    assert lkp.slurm_node("c-n2-0").flags == {"CLOUD", "POWERED_DOWN"}
+    assert lkp.slurm_node("local-0") is None
+
+
+def test_lookup_slurm_nodes_error(tmp_path, monkeypatch):
+    script = tmp_path / "scontrol"
+    script.write_text("#!/bin/sh\necho 'slurm_load_node error' >&2\nexit 1\n")
+    script.chmod(0o755)
+    monkeypatch.setattr(util, "cfg", NSDict(slurm_bin_dir=str(tmp_path)))
+    lkp = util.Lookup(NSDict(slurm_bin_dir=str(tmp_path)))
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        lkp.slurm_nodes()
+    assert "slurm_load_node" in e.value.stderr
+
+
+def test_lookup_slurm_nodes_large_stderr(tmp_path, monkeypatch):
+    script = tmp_path / "scontrol"
+    # more than a pipe buffer of warnings before the nodes
+    script.write_text(
+        f"""#!/bin/sh
+head -c 1000000 /dev/zero | tr '\\0' w >&2
+echo '{CLOUD_NODE.format(i=0)}'
+exit 1
+"""
+    )
+    script.chmod(0o755)
+    lkp = util.Lookup(NSDict(slurm_bin_dir=str(tmp_path)))
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        lkp.slurm_nodes()
+    assert len(e.value.stderr) == 1_000_000
+
+
+def test_bench_parse_slurm_nodes(benchmark):
+    lines = [CLOUD_NODE.format(i=i) + "\n" for i in range(100_000)]
+    nodes = benchmark.pedantic(
+        lambda: {node.name: node for node in parse_slurm_nodes(lines)}, rounds=3
+    )
+    assert len(nodes) == 100_000
@@ -0,0 +1,220 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import subprocess
+from time import time
+
+import pytest
+
+import slurmsync
+import util
+from conftest import FakeCompute
+from slurm_gcp_plugins import max_hops
+from slurmsync import NodeStatus, allow_power_down, node_status
+from util import NodeBase, NodeFlag, parse_node_state
+
+
+@pytest.fixture
+def suspend_exc_states(monkeypatch):
+    """set SuspendExcStates of the fake `scontrol show config`"""
+
+    def set_states(states):
+        config = f"SuspendExcStates        = {states}\n" if states else ""
+        monkeypatch.setattr(
+            slurmsync,
+            "run",
+            lambda cmd: subprocess.CompletedProcess(cmd, 0, stdout=config),
+        )
+        slurmsync.suspend_exc_states.cache_clear()
+        node_status.cache_clear()
+
+    set_states("DOWN,MAINT")
+    yield set_states
+    slurmsync.suspend_exc_states.cache_clear()
+    node_status.cache_clear()
+
+
+def status(state, inst_status=None, preemptible=False, static=False):
+    if state is None:
+        return node_status(None, NodeFlag(0), inst_status, preemptible, static)
+    _, _, base_state, state_flags = parse_node_state(state)
+    return node_status(base_state, state_flags, inst_status, preemptible, static)
+
+
+@pytest.mark.parametrize(
+    "state,inst_status,preemptible,static,expected",
+    [
+        ("IDLE+CLOUD+POWERING_UP", None, False, False, NodeStatus.unchanged),
+        ("DOWN+CLOUD+POWERED_DOWN", None, False, False, NodeStatus.restore),
+        ("IDLE+CLOUD+POWERING_DOWN", None, False, False, NodeStatus.restore),
+        ("IDLE+CLOUD+COMPLETING", None, False, False, NodeStatus.unbacked),
+        ("ALLOCATED+CLOUD", None, False, False, NodeStatus.unbacked),
+        ("IDLE+CLOUD+POWERED_DOWN", None, False, False, NodeStatus.unchanged),
+        ("IDLE+CLOUD+POWERED_DOWN", None, False, True, NodeStatus.resume),
+        ("IDLE+CLOUD", "TERMINATED", True, False, NodeStatus.preempted),
+        ("IDLE+CLOUD", "TERMINATED", False, False, NodeStatus.terminated),
+        ("DOWN+CLOUD", "TERMINATED", False, False, NodeStatus.unchanged),
+        ("IDLE+CLOUD+POWERED_DOWN", "TERMINATED", True, False, NodeStatus.unchanged),
+        ("IDLE+CLOUD+POWERED_DOWN", "RUNNING", False, False, NodeStatus.orphan),
+        (None, "RUNNING", False, False, NodeStatus.orphan),
+        (None, "STAGING", False, False, NodeStatus.unknown),
+        ("MIXED+CLOUD", "RUNNING", False, False, NodeStatus.unchanged),
+    ],
+)
+def test_node_status(
+    suspend_exc_states, state, inst_status, preemptible, static, expected
+):
+    assert status(state, inst_status, preemptible, static) == expected
+
+
+def test_node_status_power_down(suspend_exc_states):
+    # DOWN is excluded from power down
+    assert status("DOWN+CLOUD") == NodeStatus.unchanged
+    suspend_exc_states("MAINT")
+    assert status("DOWN+CLOUD") == NodeStatus.power_down
+    assert status("DOWN+CLOUD+MAINTENANCE") == NodeStatus.unchanged
+    suspend_exc_states(None)
+    assert status("DOWN+CLOUD") == NodeStatus.power_down
+    suspend_exc_states("(null)")
+    assert status("DOWN+CLOUD") == NodeStatus.unchanged
+
+
+def test_allow_power_down(suspend_exc_states):
+    suspend_exc_states("drain,maint")
+    assert allow_power_down(NodeBase.DOWN, NodeFlag.CLOUD)
+    assert not allow_power_down(NodeBase.DOWN, NodeFlag.CLOUD | NodeFlag.DRAIN)
+    assert not allow_power_down(NodeBase.IDLE, NodeFlag.MAINTENANCE)
+
+
+# states of a large cluster: most nodes idle and powered down, some busy
+BENCH_STATES = [
+    ("IDLE+CLOUD+POWERED_DOWN", None),
+    ("IDLE+CLOUD+POWERED_DOWN", None),
+    ("IDLE+CLOUD+POWERED_DOWN", None),
+    ("ALLOCATED+CLOUD", "RUNNING"),
+    ("MIXED+CLOUD", "RUNNING"),
+    ("IDLE+CLOUD", "RUNNING"),
+    ("IDLE+CLOUD+POWERING_UP", None),
+    ("IDLE+CLOUD+POWERING_UP", "STAGING"),
+    ("IDLE+CLOUD+POWERING_DOWN", "STOPPING"),
+    ("DOWN+CLOUD+POWERED_DOWN", None),
+    ("DOWN+CLOUD", "TERMINATED"),
+    ("ALLOCATED+CLOUD+COMPLETING", "RUNNING"),
+]
+
+
+def test_bench_node_status(benchmark, suspend_exc_states):
+    rng = random.Random(0)
+    nodes = []
+    for _ in range(100_000):
+        state, inst_status = rng.choice(BENCH_STATES)
+        _, _, base_state, state_flags = parse_node_state(state)
+        nodes.append((base_state, state_flags, inst_status, False, False))
+
+    statuses = benchmark(lambda: [node_status(*node) for node in nodes])
+    assert len(statuses) == 100_000
+    assert NodeStatus.power_down not in statuses
+
+
+class FakePolicies(FakeCompute):
+    def insert(self, **kwargs):
+        return kwargs
+
+
+def test_pool_in_use_listed_after_jobs(make_lookup, tmp_path, monkeypatch):
+    """a lease is not returned while a cached listing, made before the jobs
+    were read, misses the instances in its policy
+    """
+    lkp = make_lookup(
+        project="p",
+        slurm_cluster_name="test",
+        instance_inventory_max_age=600,
+        placement_pool_size=1,
+    )
+    cfg = lkp.cfg
+    servers = []
+    monkeypatch.setattr(
+        lkp,
+        "_list_instances",
+        lambda project, slurm_cluster_name, fields: {
+            inst["name"]: dict(inst) for inst in servers
+        },
+    )
+    pool = util.PlacementPool(tmp_path / "placement_pool.json")
+    for module in (slurmsync, util):
+        monkeypatch.setattr(module, "lkp", lkp)
+        monkeypatch.setattr(module, "cfg", cfg)
+    monkeypatch.setattr(util, "placement_pool", pool)
+    monkeypatch.setattr(
+        slurmsync, "placement_pool_keys", lambda: {("us-central1", None)}
+    )
+    # policies created to top up the pool
+    monkeypatch.setattr(slurmsync, "compute", FakePolicies())
+    monkeypatch.setattr(
+        slurmsync,
+        "batch_execute",
+        lambda requests, compute=None: (dict(requests), {}),
+    )
+
+    name = util.PlacementPool.policy_name("us-central1", None, 0)
+    listed = {name: "READY"}
+    pool.sync(listed, set(), set(), {("us-central1", None)}, 1, 0)
+
+    # sync_slurm lists the instances before the job's instances exist
+    assert lkp.instances(profile="sync") == {}
+    assert pool.lease({"g": ("us-central1", None, 7)}) == {"g": name}
+    zone = "https://www.googleapis.com/compute/v1/projects/p/zones/us-central1-a"
+    servers.append(
+        {
+            "name": "test-c2-0",
+            "zone": zone,
+            "status": "RUNNING",
+            "labels": {"slurm_instance_role": "compute"},
+            "resourcePolicies": [
+                f"https://www.googleapis.com/compute/v1/projects/p/regions/us-central1/resourcePolicies/{name}"
+            ],
+        }
+    )
+
+    # the job ended, but its instance is still in the policy
+    slurmsync.sync_placement_pool(listed, set(), time() + 1)
+    with pool.policies() as policies:
+        assert policies[name]["job_id"] == "7"
+
+    servers.clear()
+    slurmsync.sync_placement_pool(listed, set(), time() + 1)
+    with pool.policies() as policies:
+        assert policies[name]["job_id"] is None
+
+
+@pytest.mark.parametrize(
+    "plugins,max_distance",
+    [
+        ({}, None),
+        ({"max_hops": {}}, max_hops.DEFAULT_MAX_HOPS),
+        ({"max_hops": {"max_hops": 1}}, 1),
+    ],
+)
+def test_placement_pool_keys(make_lookup, monkeypatch, plugins, max_distance):
+    subnet = "https://www.googleapis.com/compute/v1/projects/p/regions/us-central1/subnetworks/s"
+    nodeset = {"nodeset_name": "c2", "subnetwork": subnet, "enable_placement": True}
+    lkp = make_lookup(
+        nodeset={"c2": nodeset, "n2": {**nodeset, "enable_placement": False}},
+        enable_slurm_gcp_plugins=plugins,
+    )
+    monkeypatch.setattr(slurmsync, "lkp", lkp)
+    monkeypatch.setattr(slurmsync, "cfg", lkp.cfg)
+    # the pool has the distance the plugin asks for
+    assert slurmsync.placement_pool_keys() == {("us-central1", max_distance)}
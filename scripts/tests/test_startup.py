@@ -0,0 +1,77 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+
+from conftest import scripts_dir
+
+# cold start budget in seconds from interpreter start to the scripts' main
+STARTUP_BUDGET = float(os.getenv("SLURM_GCP_STARTUP_BUDGET", 0.25))
+RUNS = 5
+
+# these are only needed once an API call is made
+DEFERRED_MODULES = [
+    "googleapiclient",
+    "google.auth",
+    "google.cloud.tpu_v2",
+    "google.api_core",
+    "requests",
+]
+
+# time each phase of startup in a fresh interpreter
+STARTUP_SCRIPT = f"""
+import json, sys, time
+t0 = time.perf_counter()
+import yaml, addict
+t1 = time.perf_counter()
+import util
+t2 = time.perf_counter()
+import resume, suspend, slurmsync
+t3 = time.perf_counter()
+print(json.dumps({{
+    "phases": {{"deps": t1 - t0, "util": t2 - t1, "scripts": t3 - t2}},
+    "total": t3 - t0,
+    "loaded": [m for m in {DEFERRED_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure_startup():
+    proc = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],
+        cwd=scripts_dir,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(proc.stdout.splitlines()[-1])
+
+
+def test_startup_defers_client_libraries():
+    assert measure_startup()["loaded"] == []
+
+
+def test_startup_budget():
+    # first run warms the bytecode cache, take the best of the rest
+    measure_startup()
+    runs = [measure_startup() for _ in range(RUNS)]
+    best = min(runs, key=lambda r: r["total"])
+    phases = ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in best["phases"].items())
+    print(f"startup {best['total'] * 1000:.1f}ms: {phases}")
+    assert (
+        best["total"] < STARTUP_BUDGET
+    ), f"startup took {best['total']:.3f}s > {STARTUP_BUDGET}s ({phases})"
@@ -0,0 +1,134 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+from time import time
+
+import pytest
+
+import util
+from conftest import FakeCompute, FakeRequest
+from util import NSDict
+
+LINK = (
+    "https://www.googleapis.com/compute/v1/projects/proj/global/instanceTemplates/tpl"
+)
+
+
+class FakeTemplates(FakeCompute):
+    def __init__(self):
+        self.template = self.make_template("1")
+        self.gets = []
+
+    @staticmethod
+    def make_template(id):
+        return {
+            "id": id,
+            "creationTimestamp": f"2024-01-0{id}T00:00:00.000-00:00",
+            "name": "tpl",
+            "properties": {
+                "machineType": "n2-standard-2",
+                "labels": {"template": id},
+                "guestAccelerators": [],
+            },
+        }
+
+    def get(self, project, instanceTemplate, fields=None):
+        def execute():
+            assert instanceTemplate == "tpl"
+            self.gets.append(fields)
+            if fields:
+                return {k: self.template[k] for k in fields.split(",")}
+            return self.template
+
+        return FakeRequest(execute)
+
+
+@pytest.fixture
+def compute(monkeypatch):
+    monkeypatch.setattr(
+        util.Lookup,
+        "machine_type",
+        lambda self, machine_type, project=None, zone=None: NSDict(
+            guestCpus=2, memoryMb=8192
+        ),
+    )
+    return FakeTemplates()
+
+
+def age(path, seconds):
+    """make the last version check of a cache entry seconds old"""
+    checked = time() - seconds
+    os.utime(path, (checked, checked))
+
+
+def test_template_cached(make_lookup, compute):
+    template = make_lookup(compute).template_info(LINK)
+    assert template.name == "tpl"
+    assert template.link == LINK
+    assert template.labels == {"template": "1"}
+    assert template.gpu_count == 0
+    assert compute.gets == [None]
+
+    path = make_lookup(compute).template_cache_path(LINK)
+    assert path.name == "tpl.cache"
+    entry = json.loads(path.read_text())
+    assert entry["version"] == ["1", "2024-01-01T00:00:00.000-00:00"]
+
+    # another process within the check interval makes no API calls
+    compute.gets.clear()
+    assert make_lookup(compute).template_info(LINK) == template
+    assert compute.gets == []
+
+
+def test_template_unchanged(make_lookup, compute):
+    make_lookup(compute).template_info(LINK)
+    path = make_lookup(compute).template_cache_path(LINK)
+    age(path, 600)
+
+    compute.gets.clear()
+    assert make_lookup(compute).template_info(LINK).labels == {"template": "1"}
+    assert compute.gets == ["id,creationTimestamp"]
+    # the check is good for another interval
+    compute.gets.clear()
+    make_lookup(compute).template_info(LINK)
+    assert compute.gets == []
+
+
+def test_template_replaced(make_lookup, compute):
+    make_lookup(compute).template_info(LINK)
+    # replaced by a template with the same name
+    compute.template = compute.make_template("2")
+
+    # not noticed until the check interval passed
+    assert make_lookup(compute).template_info(LINK).labels == {"template": "1"}
+    assert make_lookup(compute, template_cache_check_interval=0).template_info(
+        LINK
+    ).labels == {"template": "2"}
+    assert make_lookup(compute).template_info(LINK).labels == {"template": "2"}
+
+
+def test_template_cache_invalid(make_lookup, compute):
+    lkp = make_lookup(compute)
+    lkp.template_cache_dir.mkdir()
+    lkp.template_cache_path(LINK).write_text("{not json")
+    assert lkp.template_info(LINK).labels == {"template": "1"}
+    assert compute.gets == [None]
+
+    compute.gets.clear()
+    lkp.clear_template_info_cache()
+    assert list(lkp.template_cache_dir.iterdir()) == []
+    lkp.template_info(LINK)
+    assert compute.gets == [None]
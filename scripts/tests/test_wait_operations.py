@@ -0,0 +1,79 @@
+# Copyright (C) SchedMD LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+from time import sleep, time
+
+import util
+
+
+def fake_wait(delays, release=None):
+    """wait_for_operation replacement that sleeps for the operation's delay"""
+
+    def wait_for_operation(operation, project=None, compute=None, deadline=None):
+        delay = delays[operation["name"]]
+        if delay is None:
+            release.wait()
+        else:
+            sleep(delay)
+        if isinstance(operation.get("raise"), Exception):
+            raise operation["raise"]
+        return {**operation, "status": "DONE"}
+
+    return wait_for_operation
+
+
+def test_operations_yielded_as_completed(monkeypatch):
+    delays = {"slow": 0.3, "fast": 0.0, "mid": 0.1}
+    monkeypatch.setattr(util, "wait_for_operation", fake_wait(delays))
+    operations = {name: {"name": name} for name in delays}
+
+    start = time()
+    results = list(util.wait_for_operations_as_completed(operations))
+    assert time() - start < 0.6
+    assert [key for key, _ in results] == ["fast", "mid", "slow"]
+    assert all(op["status"] == "DONE" for _, op in results)
+
+
+def test_operation_exception_yielded(monkeypatch):
+    monkeypatch.setattr(util, "wait_for_operation", fake_wait({"a": 0, "b": 0}))
+    error = RuntimeError("boom")
+    operations = {"a": {"name": "a", "raise": error}, "b": {"name": "b"}}
+
+    results = dict(util.wait_for_operations_as_completed(operations))
+    assert results["a"] is error
+    assert results["b"]["status"] == "DONE"
+
+
+def test_operations_deadline(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(
+        util, "wait_for_operation", fake_wait({"done": 0, "stuck": None}, release)
+    )
+    operations = {"done": {"name": "done"}, "stuck": {"name": "stuck"}}
+
+    try:
+        start = time()
+        results = dict(
+            util.wait_for_operations_as_completed(operations, deadline=time() + 0.2)
+        )
+        assert time() - start < 1
+    finally:
+        release.set()
+    assert results["done"]["status"] == "DONE"
+    assert isinstance(results["stuck"], TimeoutError)
+
+
+def test_no_operations():
+    assert list(util.wait_for_operations_as_completed({})) == []
@@ -16,6 +16,8 @@
 
 import argparse
 import collections
+import concurrent.futures
+import fcntl
 import importlib.util
 import inspect
 import json
@@ -24,16 +26,19 @@ import logging.config
 import math
 import os
 import re
-import shelve
 import shlex
 import shutil
 import socket
 import subprocess
 import sys
 import tempfile
+import threading
+from bisect import bisect_right
 from collections import defaultdict, namedtuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from contextlib import contextmanager
+from datetime import datetime
+from enum import Enum, IntFlag
 from functools import lru_cache, reduce, partialmethod
 from itertools import chain, compress, islice
 from pathlib import Path
@@ -65,23 +70,15 @@ if missing_imports:
     print("Aborting due to missing Python modules")
     exit(1)
 
-import google.auth  # noqa: E402
-from google.oauth2 import service_account  # noqa: E402
-import googleapiclient.discovery  # noqa: E402
-import google_auth_httplib2  # noqa: E402
-from googleapiclient.http import set_user_agent  # noqa: E402
-import httplib2  # noqa: E402
-
-if can_tpu:
-    from google.cloud import tpu_v2 as tpu  # noqa: E402
-import google.api_core.exceptions as gExceptions  # noqa: E402
-
-from requests import get as get_url  # noqa: E402
-from requests.exceptions import RequestException  # noqa: E402
-
 import yaml  # noqa: E402
 from addict import Dict as NSDict  # noqa: E402
 
+# libyaml is much faster at loading config.yaml, if available
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# The google client libraries are slow to import, so they are imported where
+# they are used. This keeps startup of short-lived scripts fast.
+
 optional_modules = [
     ("google.cloud.secretmanager", "google-cloud-secret-manager"),
 ]
@@ -96,17 +93,101 @@ if ENV_CONFIG_YAML:
 else:
     CONFIG_FILE = Path(__file__).with_name("config.yaml")
 API_REQ_LIMIT = 2000
+# instance fields fetched by Lookup.instances, by caller. Callers that only
+# need an instance's zone and status use a small profile, so listing is
+# faster. Plugins add fields to every profile.
+INSTANCE_FIELD_PROFILES = {
+    # suspend: deleting instances
+    "suspend": ["labels", "name", "selfLink", "status", "zone"],
+    # slurmsync: node status, start and delete requests
+    "sync": [
+        "labels",
+        "name",
+        "resourcePolicies",
+        "scheduling",
+        "selfLink",
+        "status",
+        "zone",
+    ],
+    "full": [
+        "advancedMachineFeatures",
+        "cpuPlatform",
+        "creationTimestamp",
+        "disks",
+        "disks",
+        "fingerprint",
+        "guestAccelerators",
+        "hostname",
+        "id",
+        "kind",
+        "labelFingerprint",
+        "labels",
+        "lastStartTimestamp",
+        "lastStopTimestamp",
+        "lastSuspendedTimestamp",
+        "machineType",
+        "metadata",
+        "name",
+        "networkInterfaces",
+        "resourceStatus",
+        "scheduling",
+        "selfLink",
+        "serviceAccounts",
+        "shieldedInstanceConfig",
+        "shieldedInstanceIntegrityPolicy",
+        "sourceMachineImage",
+        "status",
+        "statusMessage",
+        "tags",
+        "zone",
+        # "deletionProtection",
+        # "startRestricted",
+    ],
+}
+# metadata values larger than this are dropped from Instance records, see
+# Instance.from_api. startup-script alone is tens of KB per instance.
+INSTANCE_METADATA_MAX_SIZE = 1024
+# profiles refreshed by fetching only changed instances, the others are
+# cheaper to list again
+INVENTORY_INCREMENTAL_PROFILES = {"full"}
+# instance inventory snapshot format, see Lookup.instances
+INVENTORY_VERSION = 1
+# fields listed to find instances that changed since the snapshot
+INVENTORY_FIELDS = [
+    "creationTimestamp",
+    "fingerprint",
+    "labelFingerprint",
+    "lastStartTimestamp",
+    "lastStopTimestamp",
+    "lastSuspendedTimestamp",
+    "metadata/fingerprint",
+    "name",
+    "status",
+    "zone",
+]
+# list all instances again rather than get this many changed ones
+INVENTORY_MAX_CHANGED = 500
+# seconds between aggregatedLists that find the zones of all the cluster's
+# instances, see Lookup.instance_zones
+INSTANCE_ZONES_MAX_AGE = 3600
+# default Compute API requests per second and burst size of each rate limit
+# bucket, overridden per method group by cfg.api_rate_limits
+RATE_LIMIT_RATE = API_REQ_LIMIT / 100
+RATE_LIMIT_BURST = API_REQ_LIMIT
+# a throttled bucket recovers this fraction of its rate every second
+RATE_LIMIT_RECOVERY = 0.02
+RATE_LIMIT_MIN_RATE = 1
+# seconds between polls of pending operations, see OperationTracker
+OPERATION_POLL_MIN = 1
+OPERATION_POLL_MAX = 30
 URI_REGEX = r"[a-z]([-a-z0-9]*[a-z0-9])?"
 
-def_creds, auth_project = google.auth.default()
 Path.mkdirp = partialmethod(Path.mkdir, parents=True, exist_ok=True)
 
 scripts_dir = next(
     p for p in (Path(__file__).parent, Path("/slurm/scripts")) if p.is_dir()
 )
 
-# readily available compute api handle
-compute = None
 # slurm-gcp config object, could be empty if not available
 cfg = NSDict()
 # caching Lookup object
@@ -145,6 +226,25 @@ slurmdirs = NSDict(
 )
 
 
+# resume/suspend daemon socket, see powerd.py
+POWERD_SOCKET = slurmdirs.state / "powerd.sock"
+# seconds to wait for powerd beyond resume_timeout, see powerd_request_timeout
+POWERD_REQUEST_SLACK = 300
+# token buckets shared by all processes, see RateLimiter
+RATE_LIMIT_DIR = slurmdirs.state / "ratelimit"
+# placement policies created ahead of resume, see PlacementPool
+PLACEMENT_POOL_FILE = slurmdirs.state / "placement_pool.json"
+# bump when the cached template info changes format
+TEMPLATE_CACHE_VERSION = 1
+# seconds a cached template is used before checking it was not replaced
+TEMPLATE_CACHE_CHECK_INTERVAL = 300
+# bump when the machine type catalog changes format
+MACHINE_TYPE_CACHE_VERSION = 1
+# seconds a machine type is kept in the catalog
+MACHINE_TYPE_CACHE_TTL = 24 * 60 * 60
+MACHINE_TYPE_FIELDS = "name,zone,guestCpus,memoryMb,accelerators"
+
+
 yaml.SafeDumper.yaml_representers[
     None
 ] = lambda self, data: yaml.representer.SafeRepresenter.represent_str(self, str(data))
@@ -309,39 +409,256 @@ def blob_list(prefix="", delimiter=None, project=None):
     return [blob for blob in blobs]
 
 
+class LazyHandle:
+    """Proxy for an object that is expensive to create, such as an API client
+    or a module. The factory is called on first attribute access.
+    """
+
+    __slots__ = ("_factory", "_obj", "_lock")
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._obj = None
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        if self._obj is None:
+            with self._lock:
+                if self._obj is None:
+                    self._obj = self._factory()
+        return self._obj
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+
+def lazy_import(name):
+    """module handle that is imported on first use"""
+    return LazyHandle(lambda: importlib.import_module(name))
+
+
+tpu = lazy_import("google.cloud.tpu_v2")
+gExceptions = lazy_import("google.api_core.exceptions")
+
+
+@lru_cache(maxsize=1)
+def default_credentials():
+    """Application default credentials and project, looked up once"""
+    import google.auth
+
+    return google.auth.default()
+
+
+def __getattr__(name):
+    # def_creds and auth_project used to be resolved at import time
+    if name == "def_creds":
+        return default_credentials()[0]
+    if name == "auth_project":
+        return default_credentials()[1]
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+HTTP_POOL_SIZE = 32
+HTTP_IDLE_TIMEOUT = 60
+
+
+class HttpPool:
+    """Stand-in for an httplib2.Http that gives each thread its own keep-alive
+    connection, so requests made from a thread reuse its TLS connection.
+    httplib2.Http is not thread-safe, so connections are never shared between
+    threads. At most max_size connections are kept, threads beyond that get a
+    fresh connection per request. A connection idle for longer than
+    idle_timeout is closed and replaced, as the server has likely dropped it.
+    """
+
+    def __init__(
+        self, factory, max_size=HTTP_POOL_SIZE, idle_timeout=HTTP_IDLE_TIMEOUT
+    ):
+        self._factory = factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        # thread -> (http, last used)
+        self._pool = {}
+
+    def _prune(self, now):
+        """drop connections of finished threads and idle connections"""
+        for thread, (http, last_used) in list(self._pool.items()):
+            if not thread.is_alive() or now - last_used > self.idle_timeout:
+                del self._pool[thread]
+                http.close()
+
+    def get(self):
+        """get the calling thread's connection"""
+        thread = threading.current_thread()
+        now = time()
+        with self._lock:
+            http, last_used = self._pool.pop(thread, (None, None))
+            if http is not None and now - last_used > self.idle_timeout:
+                http.close()
+                http = None
+            if http is None and len(self._pool) >= self.max_size:
+                self._prune(now)
+            if len(self._pool) < self.max_size:
+                if http is None:
+                    http = self._factory()
+                self._pool[thread] = (http, now)
+                return http
+        return self._factory()
+
+    def request(self, *args, **kwargs):
+        return self.get().request(*args, **kwargs)
+
+    def close(self):
+        with self._lock:
+            for http, _ in self._pool.values():
+                http.close()
+            self._pool.clear()
+
+    def __len__(self):
+        return len(self._pool)
+
+    def __getattr__(self, name):
+        # e.g. credentials, used by batch requests
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+
+def write_atomic(path, content, mode=0o644):
+    """Write content to a temporary file and rename it to path, so concurrent
+    readers never see a partial file. The default mode makes the file
+    readable by both root and slurm, whichever writes it first.
+    """
+    path = Path(path)
+    tmp = None
+    try:
+        with tempfile.NamedTemporaryFile(
+            mode="w", dir=path.parent, prefix=f".{path.name}.", delete=False
+        ) as tmp:
+            tmp.write(content)
+        os.chmod(tmp.name, mode)
+        os.replace(tmp.name, path)
+    except BaseException:
+        if tmp is not None:
+            Path(tmp.name).unlink(missing_ok=True)
+        raise
+
+
+DISCOVERY_URL = "https://{api}.googleapis.com/$discovery/rest?version={apiVersion}"
+DISCOVERY_CACHE_DIR = Path(__file__).parent
+# seconds a discovery document fetched from the network is cached
+DISCOVERY_CACHE_TTL = 24 * 60 * 60
+
+
+def discovery_document(api, version, cache_dir=None):
+    """Get the discovery document for an API version, cached on local disk.
+    The cached document is pinned to the installed google-api-python-client
+    version, upgrading the client library refreshes it. Documents the client
+    library does not ship are fetched from the network and fetched again
+    after DISCOVERY_CACHE_TTL, the stale one is used if that fails.
+    """
+    from googleapiclient.discovery_cache import get_static_doc
+    from googleapiclient.version import __version__ as client_version
+
+    cache_dir = Path(cache_dir or DISCOVERY_CACHE_DIR)
+    cache_file = cache_dir / f"{api}.{version}.discovery.cache"
+    stale = None
+    try:
+        cached = json.loads(cache_file.read_text())
+        if cached["client_version"] == client_version:
+            # None for the documents shipped with the client library
+            expires = cached.get("expires", 0)
+            if expires is None or expires > time():
+                return cached["document"]
+            stale = cached["document"]
+        else:
+            log.debug(f"discarding {cache_file} from client {cached['client_version']}")
+    except (OSError, ValueError, KeyError):
+        pass
+
+    content = get_static_doc(api, version)
+    expires = None
+    if content is None:
+        from requests import get as get_url
+        from requests.exceptions import RequestException
+
+        url = DISCOVERY_URL.format(api=api, apiVersion=version)
+        log.debug(f"fetching discovery document from {url}")
+        try:
+            resp = get_url(url, timeout=60)
+            resp.raise_for_status()
+        except RequestException as e:
+            if stale is None:
+                raise
+            log.warning(f"failed to refresh {cache_file}, using it anyway: {e}")
+            return stale
+        content = resp.text
+        expires = time() + DISCOVERY_CACHE_TTL
+    document = json.loads(content)
+
+    cached = {
+        "client_version": client_version,
+        "expires": expires,
+        "document": document,
+    }
+    try:
+        write_atomic(cache_file, json.dumps(cached))
+    except OSError as e:
+        log.debug(f"failed to cache discovery document in {cache_file}: {e}")
+    return document
+
+
 def compute_service(credentials=None, user_agent=USER_AGENT, version="v1"):
     """Make thread-safe compute service handle
     creates a new Http for each request
+    The handle is memoized per version and credentials.
     """
-    try:
-        key_path = os.environ["GOOGLE_APPLICATION_CREDENTIALS"]
-    except KeyError:
-        key_path = None
+    key_path = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
+    return _compute_service(credentials, user_agent, version, key_path)
+
+
+@lru_cache(maxsize=None)
+def _compute_service(credentials, user_agent, version, key_path):
+    import googleapiclient.discovery
+    import googleapiclient.http
+    import google_auth_httplib2
+    import httplib2
+
     if key_path is not None:
+        from google.oauth2 import service_account
+
         credentials = service_account.Credentials.from_service_account_file(
             key_path, scopes=["https://www.googleapis.com/auth/cloud-platform"]
         )
     elif credentials is None:
-        credentials = def_creds
+        credentials = default_credentials()[0]
 
-    def build_request(http, *args, **kwargs):
+    def new_http():
         new_http = httplib2.Http()
         if user_agent is not None:
-            new_http = set_user_agent(new_http, user_agent)
+            new_http = googleapiclient.http.set_user_agent(new_http, user_agent)
         if credentials is not None:
             new_http = google_auth_httplib2.AuthorizedHttp(credentials, http=new_http)
-        return googleapiclient.http.HttpRequest(new_http, *args, **kwargs)
+        return new_http
+
+    # shared by all requests from this service, including ensure_execute
+    # retries, batches and operation waits
+    http_pool = HttpPool(new_http)
+
+    def build_request(http, *args, **kwargs):
+        return googleapiclient.http.HttpRequest(http_pool, *args, **kwargs)
 
     log.debug(f"Using version={version} of Google Compute Engine API")
-    return googleapiclient.discovery.build(
-        "compute",
-        version,
+    return googleapiclient.discovery.build_from_document(
+        discovery_document("compute", version),
         requestBuilder=build_request,
         credentials=credentials,
     )
 
 
-compute = compute_service()
+# readily available compute api handle, built on first use
+compute = LazyHandle(compute_service)
 
 
 def load_config_data(config):
@@ -399,7 +716,7 @@ def new_config(config):
 def fetch_config_yaml():
     """Fetch config.yaml from bucket"""
     config_yaml = blob_get("config.yaml").download_as_text()
-    cfg = new_config(yaml.safe_load(config_yaml))
+    cfg = new_config(yaml.load(config_yaml, Loader=YamlLoader))
     return cfg
 
 
@@ -417,7 +734,7 @@ def load_config_file(path):
     """load config from file"""
     content = None
     try:
-        content = yaml.safe_load(Path(path).read_text())
+        content = yaml.load(Path(path).read_text(), Loader=YamlLoader)
     except FileNotFoundError:
         log.warning(f"config file not found: {path}")
         return NSDict()
@@ -562,6 +879,51 @@ def spawn(cmd, quiet=False, shell=False, **kwargs):
     return subprocess.Popen(args, shell=shell, **kwargs)
 
 
+def powerd_request_timeout():
+    """Seconds to wait for powerd to handle a request. A request can wait for
+    the resume being handled before it, and then its own, each of which takes
+    up to resume_timeout.
+    """
+    resume_timeout = lkp.cfg.cloud_parameters.get("resume_timeout", 300)
+    return 2 * resume_timeout + POWERD_REQUEST_SLACK
+
+
+def powerd_request(request, socket_path=None, timeout=None):
+    """Hand a resume/suspend request to powerd.py and wait for it to be handled.
+    Returns the daemon's reply, or None if the daemon is not running or asked
+    to restart, in which case the caller should handle the request itself.
+    Once the request is sent the daemon may have started on it, so any other
+    failure is returned as an error reply instead.
+    """
+    socket_path = socket_path or POWERD_SOCKET
+    timeout = timeout or powerd_request_timeout()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(str(socket_path))
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        except OSError as e:
+            log.warning(f"failed to connect to powerd, handling it in-process: {e}")
+            return None
+        try:
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            sock.shutdown(socket.SHUT_WR)
+            with sock.makefile("rb") as f:
+                reply = f.readline()
+        except OSError as e:
+            return {"status": "error", "error": f"powerd request failed: {e}"}
+    try:
+        reply = json.loads(reply)
+    except ValueError:
+        return {"status": "error", "error": f"invalid reply from powerd: {reply}"}
+    if not isinstance(reply, dict):
+        return {"status": "error", "error": f"invalid reply from powerd: {reply}"}
+    if reply.get("status") == "restart":
+        return None
+    return reply
+
+
 def chown_slurm(path, mode=None):
     if path.exists():
         if mode:
@@ -710,31 +1072,131 @@ def backoff_delay(start, timeout=None, ratio=None, count: int = 0):
 
 
 ROOT_URL = "http://metadata.google.internal/computeMetadata/v1"
+# seconds to wait for the metadata server to answer a request
+METADATA_TIMEOUT = 10
+# seconds the metadata server holds a wait_for_change request by default
+METADATA_WAIT_TIMEOUT = 300
+
+
+class MetadataClient:
+    """Client for the metadata server. Requests go through one requests
+    Session, so they share a keep-alive connection. Instance attributes are
+    fetched as a single recursive tree and cached, instead of one request per
+    attribute.
+    """
+
+    HEADERS = {"Metadata-Flavor": "Google"}
+
+    def __init__(self, root=ROOT_URL, timeout=METADATA_TIMEOUT):
+        self.root = root
+        self.timeout = timeout
+        self._session = None
+        self._lock = threading.Lock()
+        self._attributes = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            from requests import Session
+
+            session = Session()
+            session.headers.update(self.HEADERS)
+            self._session = session
+        return self._session
+
+    def request(self, path, timeout=None, **params):
+        """GET path relative to the root, returning the response"""
+        return self.fetch(f"{self.root}/{path}", timeout=timeout, **params)
+
+    def fetch(self, url, timeout=None, **params):
+        from requests.exceptions import RequestException
+
+        try:
+            resp = self.session.get(url, params=params, timeout=timeout or self.timeout)
+            resp.raise_for_status()
+            return resp
+        except RequestException:
+            log.debug(f"metadata not found ({url})")
+            raise Exception(f"failed to get_metadata from {url}")
+
+    def get(self, path):
+        return self.request(path).text
+
+    def get_tree(self, path):
+        """a directory and everything below it as a dict"""
+        return self.request(f"{path.rstrip('/')}/", recursive="true").json()
+
+    def instance_attributes(self):
+        """all instance attributes, fetched once"""
+        with self._lock:
+            if self._attributes is None:
+                self._attributes = self.get_tree("instance/attributes")
+            return self._attributes
+
+    def instance_attribute(self, key):
+        attributes = self.instance_attributes()
+        if key not in attributes:
+            url = f"{self.root}/instance/attributes/{key}"
+            log.debug(f"metadata not found ({url})")
+            raise Exception(f"failed to get_metadata from {url}")
+        return attributes[key]
+
+    def wait_for_change(self, path, etag=None, timeout=METADATA_WAIT_TIMEOUT):
+        """Block until the value at path differs from the one with etag, or
+        until timeout seconds passed. Returns the value and its etag, pass the
+        etag to the next call to wait for the next change. Without an etag the
+        current value is returned right away. Directories are returned as a
+        dict.
+        """
+        params = {}
+        recursive = path.endswith("/")
+        if recursive:
+            params["recursive"] = "true"
+        if etag is None:
+            # wait_for_change without last_etag would block until the next
+            # change, get the current value and etag instead
+            resp = self.request(path, **params)
+        else:
+            params.update(
+                wait_for_change="true", last_etag=etag, timeout_sec=int(timeout)
+            )
+            # the server answers when timeout_sec is up, give it some slack
+            resp = self.request(path, timeout=timeout + self.timeout, **params)
+        value = resp.json() if recursive else resp.text
+        if recursive and path.rstrip("/") == "instance/attributes":
+            with self._lock:
+                self._attributes = value
+        return value, resp.headers.get("ETag")
+
+    def clear_cache(self):
+        with self._lock:
+            self._attributes = None
+
+
+metadata_client = MetadataClient()
 
 
 def get_metadata(path, root=ROOT_URL):
     """Get metadata relative to metadata/computeMetadata/v1"""
-    HEADERS = {"Metadata-Flavor": "Google"}
-    url = f"{root}/{path}"
-    try:
-        resp = get_url(url, headers=HEADERS)
-        resp.raise_for_status()
-        return resp.text
-    except RequestException:
-        log.debug(f"metadata not found ({url})")
-        raise Exception(f"failed to get_metadata from {url}")
+    return metadata_client.fetch(f"{root}/{path}").text
 
 
-@lru_cache(maxsize=None)
 def instance_metadata(path):
-    """Get instance metadata"""
-    return get_metadata(path, root=f"{ROOT_URL}/instance")
+    """Get instance metadata, attributes come from the cached attribute tree"""
+    if path.startswith("attributes/"):
+        return metadata_client.instance_attribute(path[len("attributes/") :])
+    return _instance_metadata(path)
+
+
+@lru_cache(maxsize=None)
+def _instance_metadata(path):
+    return metadata_client.get(f"instance/{path}")
 
 
 @lru_cache(maxsize=None)
 def project_metadata(key):
     """Get project metadata project/attributes/<slurm_cluster_name>-<path>"""
-    return get_metadata(key, root=f"{ROOT_URL}/project/attributes")
+    return metadata_client.get(f"project/attributes/{key}")
 
 
 def bucket_blob_download(bucket_name, blob_name):
@@ -751,26 +1213,379 @@ def bucket_blob_download(bucket_name, blob_name):
     return contents
 
 
+NATURAL_SORT_REGEX = re.compile(r"(\d+)")
+
+
 def natural_sort(text):
     def atoi(text):
         return int(text) if text.isdigit() else text
 
-    return [atoi(w) for w in re.split(r"(\d+)", text)]
+    return [atoi(w) for w in NATURAL_SORT_REGEX.split(text)]
+
+
+# hostlist handling follows Slurm's src/common/hostlist.c so that the output
+# of to_hostlist and to_hostnames matches `scontrol show hostlist` and
+# `scontrol show hostnames` without forking scontrol.
+HOSTLIST_DELIMS = frozenset(", \t\n")
+DIGITS = "0123456789"
+
+
+def _zero_padded(num, width):
+    """number of zeros used to pad num to width"""
+    return max(width - len(str(num)), 0)
+
+
+def _width_equiv(n, wn, m, wm):
+    """Return the combined width if the widths of n and m are equivalent,
+    None otherwise. eg. 9 and 10 can be joined in [9-10] but not 09 and 10.
+    """
+    if wn == wm:
+        return wn
+    npad, nmpad = _zero_padded(n, wn), _zero_padded(n, wm)
+    mpad, mnpad = _zero_padded(m, wm), _zero_padded(m, wn)
+    if npad != nmpad and mpad != mnpad:
+        return None
+    if npad != nmpad:
+        return wn
+    return wm
+
+
+def _hostranges(hostnames):
+    """Group hostnames into ranges of [prefix, lo, hi, width]. Hosts without a
+    numeric suffix have a width of None and are never combined.
+    """
+    ranges = []
+    tail = None
+    for name in hostnames:
+        prefix = name.rstrip(DIGITS)
+        suffix = name[len(prefix) :]
+        if not suffix:
+            tail = None
+            ranges.append([name, 0, 0, None])
+            continue
+        num, width = int(suffix), len(suffix)
+        if tail is not None and tail[0] == prefix and tail[2] == num - 1:
+            combined = _width_equiv(tail[1], tail[3], num, width)
+            if combined is not None:
+                tail[2], tail[3] = num, combined
+                continue
+        tail = [prefix, num, num, width]
+        ranges.append(tail)
+    return ranges
+
+
+def _hostrange_str(lo, hi, width):
+    if hi > lo:
+        return f"{lo:0{width}d}-{hi:0{width}d}"
+    return f"{lo:0{width}d}"
+
+
+def compress_hostnames(hostnames):
+    """Make a hostlist expression from an ordered sequence of hostnames, in
+    the same way as `scontrol show hostlist`
+    """
+    ranges = _hostranges(hostnames)
+    parts = []
+    i, count = 0, len(ranges)
+    while i < count:
+        prefix, lo, hi, width = ranges[i]
+        if width is None:
+            parts.append(prefix)
+            i += 1
+            continue
+        # consecutive ranges with the same prefix share one set of brackets
+        j = i + 1
+        while j < count and ranges[j][3] is not None and ranges[j][0] == prefix:
+            j += 1
+        nums = ",".join(_hostrange_str(*r[1:]) for r in ranges[i:j])
+        if j - i > 1 or hi > lo:
+            parts.append(f"{prefix}[{nums}]")
+        else:
+            parts.append(f"{prefix}{nums}")
+        i = j
+    return ",".join(parts)
+
+
+def _hostlist_tokens(hostlist):
+    """split hostlist expression on delimiters outside of brackets"""
+    depth = 0
+    start = 0
+    for i, c in enumerate(hostlist):
+        if c == "[":
+            depth += 1
+        elif c == "]":
+            depth -= 1
+        elif depth == 0 and c in HOSTLIST_DELIMS:
+            if i > start:
+                yield hostlist[start:i]
+            start = i + 1
+    if depth != 0:
+        raise Exception(f"unbalanced brackets in hostlist expression: '{hostlist}'")
+    if start < len(hostlist):
+        yield hostlist[start:]
+
+
+def _hostlist_ranges(ranges, token):
+    """parse the inside of a bracket, yielding (lo, hi, width) for each range"""
+    for rng in ranges.split(","):
+        lo, sep, hi = (s.strip() for s in rng.partition("-"))
+        if not lo.isdigit() or (sep and not hi.isdigit()):
+            raise Exception(f"invalid range '{rng}' in hostlist expression: '{token}'")
+        width = len(lo)
+        lo = int(lo)
+        hi = int(hi) if sep else lo
+        if hi < lo:
+            raise Exception(f"invalid range '{rng}' in hostlist expression: '{token}'")
+        yield lo, hi, width
+
+
+def _expand_hostlist_token(token):
+    """expand a single hostlist token, recursing into brackets in the suffix"""
+    start = token.find("[")
+    if start < 0:
+        return [token]
+    end = token.find("]", start)
+    if end < 0:
+        raise Exception(f"invalid hostlist expression: '{token}'")
+    prefix, ranges, suffix = token[:start], token[start + 1 : end], token[end + 1 :]
+    suffixes = _expand_hostlist_token(suffix) if suffix else [""]
+
+    hostnames = []
+    for lo, hi, width in _hostlist_ranges(ranges, token):
+        hostnames.extend(
+            f"{prefix}{num:0{width}d}{rest}"
+            for num in range(lo, hi + 1)
+            for rest in suffixes
+        )
+    return hostnames
+
+
+def expand_hostlist(hostlist):
+    """Expand a hostlist expression into hostnames, in the same way as
+    `scontrol show hostnames`
+    """
+    return list(
+        chain.from_iterable(map(_expand_hostlist_token, _hostlist_tokens(hostlist)))
+    )
 
 
 def to_hostlist(nodenames):
     """make hostlist from list of node names"""
-    # use tmp file because list could be large
-    tmp_file = tempfile.NamedTemporaryFile(mode="w+t", delete=False)
-    tmp_file.writelines("\n".join(sorted(nodenames, key=natural_sort)))
-    tmp_file.close()
-
-    hostlist = run(f"{lkp.scontrol} show hostlist {tmp_file.name}").stdout.rstrip()
-    log_hostlists.debug(f"hostlist({len(nodenames)}): {hostlist}".format(hostlist))
-    os.remove(tmp_file.name)
+    nodenames = sorted(nodenames, key=natural_sort)
+    hostlist = compress_hostnames(nodenames)
+    log_hostlists.debug(f"hostlist({len(nodenames)}): {hostlist}")
     return hostlist
 
 
+def _merge_intervals(intervals):
+    """merge sorted (lo, hi) intervals that overlap or are adjacent"""
+    merged = []
+    for lo, hi in intervals:
+        if merged and lo <= merged[-1][1] + 1:
+            if hi > merged[-1][1]:
+                merged[-1] = (merged[-1][0], hi)
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def _intersect_intervals(a, b):
+    """intersection of two sorted, merged interval lists"""
+    res = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        lo = max(a[i][0], b[j][0])
+        hi = min(a[i][1], b[j][1])
+        if lo <= hi:
+            res.append((lo, hi))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return res
+
+
+def _subtract_intervals(a, b):
+    """difference a - b of two sorted, merged interval lists"""
+    res = []
+    j = 0
+    for lo, hi in a:
+        while j < len(b) and b[j][1] < lo:
+            j += 1
+        k = j
+        while k < len(b) and b[k][0] <= hi:
+            if b[k][0] > lo:
+                res.append((lo, b[k][0] - 1))
+            lo = max(lo, b[k][1] + 1)
+            k += 1
+        if lo <= hi:
+            res.append((lo, hi))
+    return res
+
+
+class HostRangeSet:
+    """Immutable set of hostnames stored as prefix -> sorted integer intervals.
+
+    Names that end in an unpadded number (e.g. 'c-n1-12') are kept as ranges
+    per prefix ('c-n1-', 12), so membership and set operations cost
+    O(ranges) rather than O(hosts). Any other name (no numeric suffix or a
+    zero-padded one) is kept as a plain string.
+    """
+
+    __slots__ = ("_ranges", "_names")
+
+    def __init__(self, hostnames=()):
+        ranges = defaultdict(list)
+        names = set()
+        for name in hostnames:
+            prefix = name.rstrip(DIGITS)
+            num = name[len(prefix) :]
+            if num and (num[0] != "0" or num == "0"):
+                num = int(num)
+                ranges[prefix].append((num, num))
+            else:
+                names.add(name)
+        self._ranges = {p: _merge_intervals(sorted(r)) for p, r in ranges.items()}
+        self._names = frozenset(names)
+
+    @classmethod
+    def _from_parts(cls, ranges, names):
+        obj = cls.__new__(cls)
+        obj._ranges = {p: r for p, r in ranges.items() if r}
+        obj._names = frozenset(names)
+        return obj
+
+    @classmethod
+    def from_ranges(cls, prefix, ranges):
+        """make set from a prefix and (lo, hi) inclusive intervals"""
+        if prefix.rstrip(DIGITS) != prefix:
+            raise Exception(f"hostrange prefix must not end in a digit: '{prefix}'")
+        ranges = sorted((lo, hi) for lo, hi in ranges if lo <= hi)
+        return cls._from_parts({prefix: _merge_intervals(ranges)}, ())
+
+    @classmethod
+    def from_hostlist(cls, hostlist):
+        """Parse a hostlist expression without expanding simple bracketed
+        ranges, e.g. 'c-n1-[0-99999]' is stored as a single interval.
+        """
+        if not isinstance(hostlist, str):
+            hostlist = ",".join(hostlist)
+        ranges = defaultdict(list)
+        names = []
+        for token in _hostlist_tokens(hostlist):
+            start = token.find("[")
+            prefix = token[:start]
+            if (
+                start < 0
+                or token.find("]") != len(token) - 1
+                or prefix.rstrip(DIGITS) != prefix
+            ):
+                names.extend(_expand_hostlist_token(token))
+                continue
+            for lo, hi, width in _hostlist_ranges(token[start + 1 : -1], token):
+                # only zero-padded numbers need to be kept as names
+                pad_hi = min(hi, 10 ** (width - 1) - 1) if width > 1 else lo - 1
+                names.extend(
+                    f"{prefix}{num:0{width}d}" for num in range(lo, pad_hi + 1)
+                )
+                if pad_hi < hi:
+                    ranges[prefix].append((max(lo, pad_hi + 1), hi))
+        other = cls(names)
+        for prefix, rng in other._ranges.items():
+            ranges[prefix].extend(rng)
+        return cls._from_parts(
+            {p: _merge_intervals(sorted(r)) for p, r in ranges.items()},
+            other._names,
+        )
+
+    def __contains__(self, name):
+        if name in self._names:
+            return True
+        prefix = name.rstrip(DIGITS)
+        num = name[len(prefix) :]
+        ranges = self._ranges.get(prefix)
+        if not ranges or not num or (num[0] == "0" and num != "0"):
+            return False
+        num = int(num)
+        i = bisect_right(ranges, (num, math.inf)) - 1
+        return i >= 0 and ranges[i][0] <= num <= ranges[i][1]
+
+    def __len__(self):
+        return len(self._names) + sum(
+            hi - lo + 1 for ranges in self._ranges.values() for lo, hi in ranges
+        )
+
+    def __bool__(self):
+        return bool(self._names or self._ranges)
+
+    def __iter__(self):
+        for prefix in sorted(self._ranges, key=natural_sort):
+            for lo, hi in self._ranges[prefix]:
+                for num in range(lo, hi + 1):
+                    yield f"{prefix}{num}"
+        yield from sorted(self._names, key=natural_sort)
+
+    def __eq__(self, other):
+        if not isinstance(other, HostRangeSet):
+            return NotImplemented
+        return self._ranges == other._ranges and self._names == other._names
+
+    def __hash__(self):
+        return hash(
+            (frozenset((p, tuple(r)) for p, r in self._ranges.items()), self._names)
+        )
+
+    def _coerce(self, other):
+        return other if isinstance(other, HostRangeSet) else HostRangeSet(other)
+
+    def union(self, other):
+        other = self._coerce(other)
+        ranges = dict(self._ranges)
+        for prefix, rng in other._ranges.items():
+            ranges[prefix] = _merge_intervals(sorted(ranges.get(prefix, []) + rng))
+        return self._from_parts(ranges, self._names | other._names)
+
+    def intersection(self, other):
+        other = self._coerce(other)
+        ranges = {
+            prefix: _intersect_intervals(rng, other._ranges[prefix])
+            for prefix, rng in self._ranges.items()
+            if prefix in other._ranges
+        }
+        return self._from_parts(ranges, self._names & other._names)
+
+    def difference(self, other):
+        other = self._coerce(other)
+        ranges = {
+            prefix: _subtract_intervals(rng, other._ranges.get(prefix, []))
+            for prefix, rng in self._ranges.items()
+        }
+        return self._from_parts(ranges, self._names - other._names)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+    def to_hostlist(self):
+        """hostlist expression for the set, without expanding ranges"""
+        parts = []
+        for prefix in sorted(self._ranges, key=natural_sort):
+            ranges = self._ranges[prefix]
+            if len(ranges) == 1 and ranges[0][0] == ranges[0][1]:
+                parts.append(f"{prefix}{ranges[0][0]}")
+                continue
+            nums = ",".join(f"{lo}" if lo == hi else f"{lo}-{hi}" for lo, hi in ranges)
+            parts.append(f"{prefix}[{nums}]")
+        if self._names:
+            parts.append(to_hostlist(self._names))
+        return ",".join(parts)
+
+    __str__ = to_hostlist
+
+    def __repr__(self):
+        return f"{type(self).__name__}('{self.to_hostlist()}')"
+
+
 def part_is_tpu(part):
     """check if partition with name part contains a nodeset of type tpu"""
     return len(lkp.cfg.partitions[part].partition_nodeset_tpu) > 0
@@ -795,28 +1610,312 @@ def to_hostnames(nodelist):
         hostlist = nodelist
     else:
         hostlist = ",".join(nodelist)
-    hostnames = run(f"{lkp.scontrol} show hostnames {hostlist}").stdout.splitlines()
+    hostnames = expand_hostlist(hostlist)
     log_hostlists.debug(f"hostnames({len(hostnames)}) from {hostlist}")
     return hostnames
 
 
+def rate_limit_key(request):
+    """(method group, region) rate limit bucket for a compute request, or None
+    if the request is not rate limited
+    """
+    uri = getattr(request, "uri", None)
+    if uri is None:
+        return None
+    path = uri.split("?", 1)[0]
+    if "/operations/" in path:
+        group = "operations"
+    elif request.method == "GET":
+        group = "read"
+    else:
+        group = "mutate"
+    match = re.search(r"/(zones|regions)/([^/]+)", path)
+    if match is None:
+        region = "global"
+    elif match[1] == "zones":
+        region = match[2].rsplit("-", 1)[0]
+    else:
+        region = match[2]
+    return group, region
+
+
+class RateLimiter:
+    """Token buckets for API requests, shared by all processes on the host.
+    Each bucket is a small json file in directory, locked with flock while it
+    is updated. A bucket refills at its rate up to burst tokens. A rate
+    limited response halves the rate, which then recovers to the configured
+    rate. If the bucket files cannot be used, requests are not limited.
+    """
+
+    def __init__(self, directory, rates=None, burst=RATE_LIMIT_BURST):
+        self.directory = Path(directory)
+        self.rates = rates
+        self.burst = burst
+
+    def base_rate(self, group):
+        rates = self.rates
+        if rates is None:
+            rates = (cfg.get("api_rate_limits") if cfg else None) or {}
+        return rates.get(group, RATE_LIMIT_RATE)
+
+    def _open(self, path):
+        try:
+            return os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            pass
+        self.directory.mkdir(exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.geteuid() == 0:
+            # resume and suspend run as slurm
+            for p in (self.directory, path):
+                try:
+                    shutil.chown(p, user="slurm", group="slurm")
+                except (LookupError, PermissionError):
+                    pass
+        return fd
+
+    @contextmanager
+    def bucket(self, key):
+        """lock the bucket and yield its refilled state, saved on exit"""
+        group, region = key
+        fd = self._open(self.directory / f"{group}.{region}")
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            now = time()
+            base = self.base_rate(group)
+            try:
+                state = json.loads(os.read(fd, 4096))
+            except ValueError:
+                state = {"tokens": self.burst, "rate": base, "stamp": now}
+            elapsed = max(now - state["stamp"], 0)
+            state["rate"] = min(
+                base, state["rate"] + base * RATE_LIMIT_RECOVERY * elapsed
+            )
+            state["tokens"] = min(self.burst, state["tokens"] + state["rate"] * elapsed)
+            state["stamp"] = now
+            yield state
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, json.dumps(state).encode())
+        finally:
+            # closing releases the lock
+            os.close(fd)
+
+    def acquire(self, key, tokens=1):
+        """Take tokens from the bucket for key, sleeping until they would
+        have been refilled. Tokens are taken right away so concurrent callers
+        queue behind each other.
+        """
+        if key is None:
+            return
+        try:
+            with self.bucket(key) as state:
+                state["tokens"] -= tokens
+                wait = max(-state["tokens"] / state["rate"], 0)
+        except OSError as e:
+            log.debug(f"not rate limiting {key}: {e}")
+            return
+        if wait > 0:
+            log.debug(f"rate limit {key}: waiting {wait:.2f}s for {tokens} requests")
+            sleep(wait)
+
+    def acquire_requests(self, requests):
+        """acquire tokens for requests, grouped by bucket"""
+        counts = collections.Counter(rate_limit_key(req) for req in requests)
+        for key, count in counts.items():
+            self.acquire(key, count)
+
+    def throttle(self, key):
+        """halve the rate of a bucket that got a rate limited response"""
+        if key is None:
+            return
+        try:
+            with self.bucket(key) as state:
+                # responses to a burst are often all rate limited, only
+                # count them once
+                if state["stamp"] - state.get("throttled", 0) < 1:
+                    return
+                state["throttled"] = state["stamp"]
+                state["rate"] = max(state["rate"] / 2, RATE_LIMIT_MIN_RATE)
+                state["tokens"] = min(state["tokens"], 0)
+                log.info(f"rate limit {key}: reduced to {state['rate']:.1f}/s")
+        except OSError as e:
+            log.debug(f"not rate limiting {key}: {e}")
+
+
+rate_limiter = RateLimiter(RATE_LIMIT_DIR)
+
+
+class PlacementPool:
+    """COLLOCATED placement policies created by slurmsync before they are
+    needed, so resume can lease one instead of waiting for a new policy. The
+    pool is a json file, locked with flock while it is updated, of
+    {name: {"region", "max_distance", "job_id", "leased"}}. Free policies have
+    no job_id. slurmsync returns a lease once the job is gone and no instance
+    uses the policy anymore.
+    """
+
+    def __init__(self, path=PLACEMENT_POOL_FILE):
+        self.path = Path(path)
+
+    @staticmethod
+    def policy_name(region, max_distance, index):
+        return f"{cfg.slurm_cluster_name}-pool-{region}-d{max_distance or 0}-{index}"
+
+    @staticmethod
+    def parse_policy_name(name):
+        """(region, max_distance, index) of a pool policy name, or None"""
+        prefix = f"{cfg.slurm_cluster_name}-pool-"
+        if not name.startswith(prefix):
+            return None
+        region, _, rest = name[len(prefix) :].rpartition("-d")
+        distance, _, index = rest.partition("-")
+        if not (region and distance.isdigit() and index.isdigit()):
+            return None
+        return region, int(distance) or None, int(index)
+
+    @contextmanager
+    def policies(self):
+        """lock the pool and yield its policies, saved on exit"""
+        if os.geteuid() == 0 and not self.path.exists():
+            # resume runs as slurm
+            chown_slurm(self.path, mode=0o644)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                policies = json.loads(os.read(fd, os.fstat(fd).st_size))
+            except ValueError:
+                policies = {}
+            yield policies
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, json.dumps(policies).encode())
+        finally:
+            # closing releases the lock
+            os.close(fd)
+
+    def lease(self, wanted):
+        """Lease a free policy for each of wanted, {group: (region,
+        max_distance, job_id)}. Returns {group: policy name} for the groups
+        the pool had a policy for.
+        """
+        leased = {}
+        try:
+            with self.policies() as policies:
+                free = groupby_unsorted(
+                    [name for name, p in policies.items() if p["job_id"] is None],
+                    lambda name: (
+                        policies[name]["region"],
+                        policies[name]["max_distance"],
+                    ),
+                )
+                # lowest index first
+                free = {
+                    key: sorted(names, key=natural_sort, reverse=True)
+                    for key, names in free
+                }
+                now = time()
+                for group, (region, max_distance, job_id) in wanted.items():
+                    names = free.get((region, max_distance))
+                    if not names:
+                        continue
+                    name = names.pop()
+                    policies[name].update(job_id=str(job_id), leased=now)
+                    leased[group] = name
+        except OSError as e:
+            log.warning(f"placement policy pool not available: {e}")
+            return {}
+        return leased
+
+    def sync(self, listed, keep_jobs, in_use, wanted, size, since):
+        """Update the pool from the pool policies listed in GCP, {name:
+        status}. Leases are returned when their job is not in keep_jobs and
+        no instance is in_use of the policy, unless they were leased after
+        since, when keep_jobs was read. Each of wanted, (region,
+        max_distance), is kept at size free policies, counting policies still
+        being created. Returns the policies to create, [(region,
+        max_distance, name)], and to delete, [(region, name)], which are
+        already out of the pool.
+        """
+        create = []
+        delete = []
+        with self.policies() as policies:
+            for name in list(policies):
+                if name not in listed:
+                    del policies[name]
+            for name, status in listed.items():
+                if name in policies or status != "READY":
+                    continue
+                region, max_distance, _ = self.parse_policy_name(name)
+                policies[name] = {
+                    "region": region,
+                    "max_distance": max_distance,
+                    "job_id": None,
+                    "leased": None,
+                }
+            for name, policy in policies.items():
+                if (
+                    policy["job_id"] is not None
+                    and policy["job_id"] not in keep_jobs
+                    and name not in in_use
+                    and policy["leased"] < since
+                ):
+                    log.debug(f"placement policy {name} returned to the pool")
+                    policy.update(job_id=None, leased=None)
+
+            # free or still being created, by (region, max_distance)
+            available = collections.defaultdict(list)
+            indices = collections.defaultdict(set)
+            for name in listed:
+                region, max_distance, index = self.parse_policy_name(name)
+                indices[(region, max_distance)].add(index)
+                if name not in policies or policies[name]["job_id"] is None:
+                    available[(region, max_distance)].append(name)
+            for key in set(available) | set(wanted):
+                names = sorted(available[key], key=natural_sort)
+                target = size if key in wanted else 0
+                for name in names[target:]:
+                    if name in policies:
+                        del policies[name]
+                        delete.append((key[0], name))
+                index = 0
+                for _ in range(target - len(names)):
+                    while index in indices[key]:
+                        index += 1
+                    indices[key].add(index)
+                    create.append((*key, self.policy_name(*key, index)))
+        return create, delete
+
+
+placement_pool = PlacementPool()
+
+
 def retry_exception(exc):
     """return true for exceptions that should always be retried"""
     retry_errors = (
         "Rate Limit Exceeded",
+        "rateLimitExceeded",
         "Quota Exceeded",
     )
+    if getattr(getattr(exc, "resp", None), "status", None) == 429:
+        return True
     return any(e in str(exc) for e in retry_errors)
 
 
 def ensure_execute(request):
     """Handle rate limits and socket time outs"""
 
+    from googleapiclient.errors import HttpError
+
+    key = rate_limit_key(request)
     for retry, wait in enumerate(backoff_delay(0.5, timeout=10 * 60, count=20)):
+        rate_limiter.acquire(key)
         try:
             return request.execute()
-        except googleapiclient.errors.HttpError as e:
+        except HttpError as e:
             if retry_exception(e):
+                rate_limiter.throttle(key)
                 log.error(f"retry:{retry} '{e}'")
                 sleep(wait)
                 continue
@@ -842,15 +1941,13 @@ def batch_execute(requests, compute=compute, retry_cb=None):
         requests = {str(k): v for k, v in enumerate(requests)}  # rid generated here
     done = {}
     failed = {}
-    timestamps = []
-    rate_limited = False
 
     def batch_callback(rid, resp, exc):
-        nonlocal rate_limited
         if exc is not None:
             log.error(f"compute request exception {rid}: {exc}")
             if retry_exception(exc):
-                rate_limited = True
+                # retried in the next loop, at the reduced rate
+                rate_limiter.throttle(rate_limit_key(requests[rid]))
             else:
                 req = requests.pop(rid)
                 failed[rid] = (req, exc)
@@ -861,25 +1958,19 @@ def batch_execute(requests, compute=compute, retry_cb=None):
                 done[rid] = resp
 
     def batch_request(reqs):
+        rate_limiter.acquire_requests(req for _, req in reqs)
         batch = compute.new_batch_http_request(callback=batch_callback)
         for rid, req in reqs:
             batch.add(req, request_id=rid)
         return batch
 
     while requests:
-        if timestamps:
-            timestamps = [stamp for stamp in timestamps if stamp > time()]
-        if rate_limited and timestamps:
-            stamp = next(iter(timestamps))
-            sleep(max(stamp - time(), 0))
-            rate_limited = False
         # up to API_REQ_LIMIT (2000) requests
         # in chunks of up to BATCH_LIMIT (1000)
         batches = [
             batch_request(chunk)
             for chunk in chunked(islice(requests.items(), API_REQ_LIMIT), BATCH_LIMIT)
         ]
-        timestamps.append(time() + 100)
         with ThreadPoolExecutor() as exe:
             futures = []
             for batch in batches:
@@ -893,36 +1984,43 @@ def batch_execute(requests, compute=compute, retry_cb=None):
     return done, failed
 
 
-def wait_request(operation, project=None, compute=compute):
-    """makes the appropriate wait request for a given operation"""
+def operation_request(operation, method, project=None, compute=compute):
+    """makes the appropriate get or wait request for a given operation"""
     if project is None:
         project = lkp.project
     if "zone" in operation:
-        req = compute.zoneOperations().wait(
+        req = getattr(compute.zoneOperations(), method)(
             project=project,
             zone=trim_self_link(operation["zone"]),
             operation=operation["name"],
         )
     elif "region" in operation:
-        req = compute.regionOperations().wait(
+        req = getattr(compute.regionOperations(), method)(
             project=project,
             region=trim_self_link(operation["region"]),
             operation=operation["name"],
         )
     else:
-        req = compute.globalOperations().wait(
+        req = getattr(compute.globalOperations(), method)(
             project=project, operation=operation["name"]
         )
     return req
 
 
-def wait_for_operation(operation, project=None, compute=compute):
-    """wait for given operation"""
+def wait_request(operation, project=None, compute=compute):
+    """makes the appropriate wait request for a given operation"""
+    return operation_request(operation, "wait", project=project, compute=compute)
+
+
+def wait_for_operation(operation, project=None, compute=compute, deadline=None):
+    """wait for given operation, until deadline (seconds since epoch) if given"""
     if project is None:
         project = parse_self_link(operation["selfLink"]).project
     wait_req = wait_request(operation, project=project, compute=compute)
 
     while True:
+        if deadline is not None and time() > deadline:
+            raise TimeoutError(f"operation not done by deadline: {operation['name']}")
         result = ensure_execute(wait_req)
         if result["status"] == "DONE":
             log_errors = " with errors" if "error" in result else ""
@@ -932,20 +2030,174 @@ def wait_for_operation(operation, project=None, compute=compute):
             return result
 
 
-def wait_for_operations(operations, project=None, compute=compute):
-    return [
-        wait_for_operation(op, project=project, compute=compute) for op in operations
-    ]
+def wait_for_operations_as_completed(
+    operations, deadline=None, project=None, compute=compute
+):
+    """Wait for a dict of operations concurrently, yielding (key, result) as
+    each one completes, so results can be handled while others are pending.
+    result is the completed operation, or the exception raised while waiting
+    for it. Operations not done by the deadline (seconds since epoch) are
+    yielded with a TimeoutError.
+    """
+    if not operations:
+        return
+    exe = ThreadPoolExecutor()
+    futures = {
+        exe.submit(
+            wait_for_operation, op, project=project, compute=compute, deadline=deadline
+        ): key
+        for key, op in operations.items()
+    }
+    pending = dict(futures)
+    timeout = max(deadline - time(), 0) if deadline is not None else None
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            del pending[future]
+            yield futures[future], future.exception() or future.result()
+    except concurrent.futures.TimeoutError:
+        for future, key in pending.items():
+            if future.done():
+                yield key, future.exception() or future.result()
+            else:
+                op = operations[key]["name"]
+                yield key, TimeoutError(f"operation not done by deadline: {op}")
+    finally:
+        # waits still in flight stop at the deadline
+        for future in pending:
+            future.cancel()
+        exe.shutdown(wait=False)
+
+
+class OperationTracker:
+    """Wait for many zone, region and global operations by polling their
+    status with batched get requests, instead of a wait call per operation.
+    The poll interval starts at min_interval and grows by backoff while no
+    operation finishes, up to max_interval.
+
+    tracker = OperationTracker()
+    tracker.add("node-1", op)
+    for key, result in tracker.wait().items(): ...
+    """
+
+    def __init__(
+        self,
+        project=None,
+        compute=compute,
+        min_interval=OPERATION_POLL_MIN,
+        max_interval=OPERATION_POLL_MAX,
+        backoff=2,
+    ):
+        self.project = project
+        self.compute = compute
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        # key -> operation not yet done
+        self.pending = {}
+        # key -> done operation, or the exception raised polling it
+        self.results = {}
+        self.polls = 0
+
+    def add(self, key, operation):
+        if operation.get("status") == "DONE":
+            self.results[key] = operation
+        else:
+            self.pending[key] = operation
+
+    def update(self, operations):
+        """add a dict of key -> operation"""
+        for key, operation in operations.items():
+            self.add(key, operation)
 
+    def get_request(self, operation):
+        project = self.project or parse_self_link(operation["selfLink"]).project
+        return operation_request(
+            operation, "get", project=project, compute=self.compute
+        )
 
-def wait_for_operations_async(operations, project=None, compute=compute):
-    """wait for all operations"""
+    def poll(self):
+        """Get the status of all pending operations in batch requests.
+        Returns the number of operations that are now done.
+        """
+        if not self.pending:
+            return 0
+        keys = list(self.pending)
+        requests = {
+            str(i): self.get_request(self.pending[key]) for i, key in enumerate(keys)
+        }
+        done, failed = batch_execute(requests, compute=self.compute)
+        self.polls += 1
+        finished = 0
+        for rid, result in done.items():
+            key = keys[int(rid)]
+            if result["status"] != "DONE":
+                self.pending[key] = result
+                continue
+            del self.pending[key]
+            self.results[key] = result
+            finished += 1
+            log_errors = " with errors" if "error" in result else ""
+            log.debug(
+                f"operation complete{log_errors}: type={result['operationType']}, name={result['name']}"
+            )
+        for rid, (_, exc) in failed.items():
+            key = keys[int(rid)]
+            del self.pending[key]
+            self.results[key] = exc
+            finished += 1
+        return finished
+
+    def wait(self, deadline=None):
+        """Poll until all operations are done, or until deadline (seconds
+        since epoch). Returns dict of key -> done operation or exception;
+        operations not done by the deadline get a TimeoutError.
+        """
+        interval = self.min_interval
+        while self.pending:
+            if self.poll():
+                interval = self.min_interval
+            else:
+                interval = min(interval * self.backoff, self.max_interval)
+            if not self.pending:
+                break
+            if deadline is not None:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    break
+                interval = min(interval, remaining)
+            sleep(interval)
+        for key, operation in self.pending.items():
+            self.results[key] = TimeoutError(
+                f"operation not done by deadline: {operation['name']}"
+            )
+        self.pending.clear()
+        return self.results
 
-    def operation_retry(resp):
-        return resp["status"] != "DONE"
 
-    requests = [wait_request(op, project=project, compute=compute) for op in operations]
-    return batch_execute(requests, retry_cb=operation_retry)
+def operation_failed(result):
+    """true if result, from OperationTracker.wait, is a failed operation"""
+    return isinstance(result, Exception) or "error" in result
+
+
+def operation_error(result):
+    """error message of a failed operation result"""
+    if isinstance(result, Exception):
+        return str(result)
+    return "; ".join(
+        f"{err['code']}: {err.get('message', 'no message')}"
+        for err in result["error"]["errors"]
+    )
+
+
+def wait_for_operations(operations, project=None, compute=compute):
+    """wait for all operations, returning the done operations in order"""
+    tracker = OperationTracker(project=project, compute=compute)
+    tracker.update(dict(enumerate(operations)))
+    results = tracker.wait()
+    for result in results.values():
+        if isinstance(result, Exception):
+            raise result
+    return [results[i] for i in range(len(results))]
 
 
 def get_filtered_operations(
@@ -1084,16 +2336,21 @@ class Dumper(yaml.SafeDumper):
 class TPU:
     """Class for handling the TPU-vm nodes"""
 
-    if can_tpu:
-        State = tpu.types.cloud_tpu.Node.State
-        TPUS_PER_VM = 4
-        __expected_states = {
-            "create": State.READY,
-            "start": State.READY,
-            "stop": State.STOPPED,
+    # resolved on first use so the TPU library is only imported when needed
+    State = LazyHandle(lambda: tpu.types.cloud_tpu.Node.State)
+    TPUS_PER_VM = 4
+
+    @cached_property
+    def __expected_states(self):
+        return {
+            "create": self.State.READY,
+            "start": self.State.READY,
+            "stop": self.State.STOPPED,
         }
 
-        __tpu_version_mapping = {
+    @cached_property
+    def __tpu_version_mapping(self):
+        return {
             "V2": tpu.AcceleratorConfig().Type.V2,
             "V3": tpu.AcceleratorConfig().Type.V3,
             "V4": tpu.AcceleratorConfig().Type.V4,
@@ -1318,9 +2575,8 @@ class TPU:
                 # exist as real TPU nodes, so the other ones are expected to not be found, check the hostname of the node that has
                 # not been found, and if it ends in 0, it means that is the master node and it should have been found, and in consequence
                 # log an error
-                nodehostname = yaml.safe_load(
-                    run(f"{lkp.scontrol} --yaml show node {nodename}").stdout.rstrip()
-                )["nodes"][0]["hostname"]
+                node = lkp.slurm_node(nodename)
+                nodehostname = node.hostname if node and node.hostname else nodename
                 if nodehostname.split("-")[-1] == "0":
                     log.error(f"TPU master node {nodename} not found")
                 else:
@@ -1329,24 +2585,309 @@ class TPU:
             return True
 
 
-class Lookup:
-    """Wrapper class for cached data access"""
+class Instance:
+    """Compact record of an instance from Lookup.instances. The commonly
+    used fields are attributes, the other fields are kept as a json string
+    and parsed into NSDicts on first use. Fields are read by attribute or by
+    key, and missing fields are empty NSDicts, like the NSDict it replaces.
+    """
 
-    regex = (
-        r"^(?P<prefix>"
-        r"(?P<cluster>[^\s\-]+)"
-        r"-(?P<nodeset>\S+)"
-        r")"
-        r"-(?P<node>"
-        r"(?P<index>\d+)|"
-        r"(?P<range>\[[\d,-]+\])"
-        r")$"
+    __slots__ = (
+        "name",
+        "zone",
+        "zoneLink",
+        "status",
+        "role",
+        "machineType",
+        "machineTypeLink",
+        "selfLink",
+        "_raw",
+        "_fields",
     )
-    node_desc_regex = re.compile(regex)
+    # attributes that are not fields
+    _private = ("_raw", "_fields")
+
+    def __init__(self, raw="{}", **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields.pop(name, None))
+        # fields not in slots are kept in raw
+        self._raw = json.dumps(fields) if fields else raw
+        self._fields = None
+
+    @classmethod
+    def from_api(cls, inst, large_metadata=False):
+        """Instance from instance resource fields, or None if it has no
+        slurm_instance_role. Metadata values larger than
+        INSTANCE_METADATA_MAX_SIZE, like startup-script, are dropped unless
+        large_metadata is set.
+        """
+        inst = dict(inst)
+        inst["zoneLink"] = inst["zone"]
+        inst["zone"] = trim_self_link(inst["zone"])
+        if "machineType" in inst:
+            inst["machineTypeLink"] = inst["machineType"]
+            inst["machineType"] = trim_self_link(inst["machineType"])
+        # metadata is fetched as a dict of dicts like:
+        # {'key': key, 'value': value}, kinda silly
+        metadata = {
+            i["key"]: i["value"]
+            for i in inst.get("metadata", {}).get("items", [])
+            if large_metadata or len(i.get("value", "")) <= INSTANCE_METADATA_MAX_SIZE
+        }
+        # the role is in both metadata and labels, small profiles only have
+        # the labels
+        role = metadata.get(
+            "slurm_instance_role",
+            inst.get("labels", {}).get("slurm_instance_role"),
+        )
+        if role is None:
+            return None
+        inst["role"] = role
+        if "metadata" in inst:
+            inst["metadata"] = metadata
+        return cls(**inst)
+
+    def _extra(self):
+        if self._fields is None:
+            self._fields = NSDict(json.loads(self._raw))
+            self._raw = None
+        return self._fields
+
+    def __getattr__(self, name):
+        # only called for names that are not slots
+        if name.startswith("__") or name in self._private:
+            raise AttributeError(name)
+        return self._extra()[name]
+
+    def __setattr__(self, name, value):
+        if name in self.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            self._extra()[name] = value
+
+    def __getitem__(self, name):
+        if name in self.__slots__ and name not in self._private:
+            return getattr(self, name)
+        return self._extra()[name]
+
+    def __contains__(self, name):
+        return name in self.to_dict()
+
+    def get(self, name, default=None):
+        return self.to_dict().get(name, default)
+
+    def to_dict(self):
+        fields = {
+            name: getattr(self, name)
+            for name in self.__slots__
+            if name not in self._private and getattr(self, name) is not None
+        }
+        fields.update(self._extra().to_dict())
+        return fields
+
+    def __eq__(self, other):
+        if not isinstance(other, Instance):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"Instance({self.name}, zone={self.zone}, status={self.status})"
+
+
+def inventory_version(inst):
+    """values of an instance that change when it needs to be fetched again"""
+    return tuple(
+        inst.get("metadata", {}).get("fingerprint")
+        if field == "metadata/fingerprint"
+        else inst.get(field)
+        for field in INVENTORY_FIELDS
+    )
+
+
+def drop_large_metadata(inst):
+    """instance resource without the metadata values larger than
+    INSTANCE_METADATA_MAX_SIZE, like startup-script
+    """
+    items = inst.get("metadata", {}).get("items")
+    if not items or all(
+        len(i.get("value", "")) <= INSTANCE_METADATA_MAX_SIZE for i in items
+    ):
+        return inst
+    inst = dict(inst)
+    inst["metadata"] = {
+        **inst["metadata"],
+        "items": [
+            i for i in items if len(i.get("value", "")) <= INSTANCE_METADATA_MAX_SIZE
+        ],
+    }
+    return inst
+
+
+class NodeBase(Enum):
+    """base state of a Slurm node"""
+
+    ALLOCATED = 1
+    DOWN = 2
+    ERROR = 3
+    FUTURE = 4
+    IDLE = 5
+    MIXED = 6
+    UNKNOWN = 7
+
+
+class NodeFlag(IntFlag):
+    """state flags of a Slurm node. Flags not listed here are left out of
+    the bitmask, they are still in SlurmNode.flags.
+    """
+
+    BLOCKED = 1 << 0
+    CLOUD = 1 << 1
+    COMPLETING = 1 << 2
+    DRAIN = 1 << 3
+    DYNAMIC_FUTURE = 1 << 4
+    DYNAMIC_NORM = 1 << 5
+    FAIL = 1 << 6
+    INVALID_REG = 1 << 7
+    MAINTENANCE = 1 << 8
+    NOT_RESPONDING = 1 << 9
+    PERFCTRS = 1 << 10
+    PLANNED = 1 << 11
+    POWER_DOWN = 1 << 12
+    POWER_UP = 1 << 13
+    POWERED_DOWN = 1 << 14
+    POWERING_DOWN = 1 << 15
+    POWERING_UP = 1 << 16
+    REBOOT_ISSUED = 1 << 17
+    REBOOT_REQUESTED = 1 << 18
+    RESERVED = 1 << 19
+
+    # any of the power save flags
+    POWER = POWER_DOWN | POWERING_UP | POWERING_DOWN | POWERED_DOWN
+
+
+@lru_cache(maxsize=None)
+def parse_node_state(state):
+    """Split a scontrol node state, like IDLE+CLOUD+POWERED_DOWN, into
+    (base, flags, NodeBase, NodeFlag). Nodes share a handful of states, so
+    the results are cached and shared between nodes.
+    """
+    base, *flags = state.split("+")
+    base_state = NodeBase.__members__.get(base, NodeBase.UNKNOWN)
+    state_flags = NodeFlag(0)
+    for flag in flags:
+        state_flags |= NodeFlag.__members__.get(flag, 0)
+    return base, frozenset(flags), base_state, state_flags
+
+
+# a node from `scontrol show nodes`. base is the state, like IDLE, and
+# flags the state flags, like CLOUD and POWERED_DOWN. base_state and
+# state_flags are the same state as NodeBase and NodeFlag, for bitmask tests.
+SlurmNode = namedtuple(
+    "SlurmNode",
+    "name,base,flags,base_state,state_flags,reason,features,address,hostname,last_busy",
+)
+
+
+_scontrol_next_field = re.compile(r" [A-Za-z_]+=")
+
+
+def _scontrol_field(line, key):
+    """value of a space free key=value field of a scontrol --oneliner line"""
+    i = line.find(key)
+    if i < 0:
+        return None
+    i += len(key)
+    j = line.find(" ", i)
+    return line[i:j] if j >= 0 else line[i:]
+
+
+def _scontrol_time(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        # None or Unknown
+        return None
+
+
+def parse_slurm_nodes(lines):
+    """Generate SlurmNode records from `scontrol show nodes --oneliner`
+    output, which has a line of key=value fields per node. Only the fields of
+    SlurmNode are looked up, so parsing does not depend on field order.
+    """
+    scontrol_null = ("(null)", "N/A", "")
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line.startswith("NodeName="):
+            continue
+        name = _scontrol_field(line, "NodeName=")
+        state = _scontrol_field(line, " State=") or "UNKNOWN"
+        base, flags, base_state, state_flags = parse_node_state(state)
+        features = _scontrol_field(line, " AvailableFeatures=")
+        if features in scontrol_null:
+            features = None
+        address = _scontrol_field(line, " NodeAddr=")
+        hostname = _scontrol_field(line, " NodeHostName=")
+        # reason has spaces, it runs until the next field
+        reason = None
+        i = line.find(" Reason=")
+        if i >= 0:
+            i += len(" Reason=")
+            m = _scontrol_next_field.search(line, i)
+            reason = line[i : m.start()] if m else line[i:]
+        yield SlurmNode(
+            name=name,
+            base=base,
+            flags=flags,
+            base_state=base_state,
+            state_flags=state_flags,
+            reason=reason or None,
+            features=tuple(features.split(",")) if features else (),
+            address=address if address not in scontrol_null else None,
+            hostname=hostname if hostname not in scontrol_null else None,
+            last_busy=_scontrol_time(_scontrol_field(line, " LastBusyTime=")),
+        )
+
+
+# parts of a node name, <cluster>-<nodeset>-<index> or, for a range of nodes,
+# <cluster>-<nodeset>-[<ranges>]
+NodeDesc = namedtuple("NodeDesc", "prefix,cluster,nodeset,node,index,range")
+
+_node_range_chars = frozenset("0123456789,-")
+
+
+def parse_node_name(node_name):
+    """Split a node name into a NodeDesc with string splits instead of a
+    regex, as it is done for every node many times over.
+    """
+    if node_name.endswith("]"):
+        i = node_name.rfind("-[")
+        prefix, node = node_name[:i], node_name[i + 1 :]
+        valid = i > 0 and _node_range_chars.issuperset(node[1:-1]) and node != "[]"
+        index, node_range = None, node
+    else:
+        prefix, _, node = node_name.rpartition("-")
+        valid = node.isdecimal()
+        index, node_range = node, None
+    cluster, _, nodeset = prefix.partition("-")
+    # no whitespace, without going through the name char by char
+    valid = valid and cluster and nodeset and prefix.isprintable()
+    if not valid or " " in prefix:
+        raise Exception(f"node name {node_name} is not valid")
+    return NodeDesc(prefix, cluster, nodeset, node, index, node_range)
+
+
+# what the node_* accessors of Lookup need of a nodeset
+NodesetInfo = namedtuple("NodesetInfo", "nodeset,template,region,tpu")
+
+
+class Lookup:
+    """Wrapper class for cached data access"""
 
     def __init__(self, cfg=None):
         self._cfg = cfg or NSDict()
-        self.template_cache_path = Path(__file__).parent / "template_info.cache"
+        self.template_cache_dir = Path(__file__).parent / "template_info"
+        self.machine_type_cache_path = Path(__file__).parent / "machine_types.cache"
+        self.inventory_dir = Path(__file__).parent
 
     @property
     def cfg(self):
@@ -1354,7 +2895,7 @@ class Lookup:
 
     @property
     def project(self):
-        return self.cfg.project or auth_project
+        return self.cfg.project or default_credentials()[1]
 
     @property
     def control_addr(self):
@@ -1432,15 +2973,38 @@ class Lookup:
     def enable_job_exclusive(self):
         return bool(self.cfg.enable_job_exclusive or self.cfg.enable_placement)
 
-    @lru_cache(maxsize=None)
     def _node_desc(self, node_name):
         """Get parts from node name"""
-        if not node_name:
-            node_name = self.hostname
-        m = self.node_desc_regex.match(node_name)
-        if not m:
-            raise Exception(f"node name {node_name} is not valid")
-        return NSDict(m.groupdict())
+        return parse_node_name(node_name or self.hostname)
+
+    @lru_cache(maxsize=1)
+    def nodeset_table(self):
+        """NodesetInfo by nodeset name, so node_* lookups are a split of the
+        node name and a dict lookup
+        """
+        table = {}
+        for tpu, nodesets in ((True, self.cfg.nodeset_tpu), (False, self.cfg.nodeset)):
+            for name, nodeset in nodesets.items():
+                # a nodeset takes precedence over a TPU nodeset of the same
+                # name, but it is still a TPU node
+                table[name] = NodesetInfo(
+                    nodeset=nodeset,
+                    template=nodeset.instance_template,
+                    region=(
+                        parse_self_link(nodeset.subnetwork).region
+                        if nodeset.subnetwork
+                        else None
+                    ),
+                    tpu=tpu or name in self.cfg.nodeset_tpu,
+                )
+        return table
+
+    def _nodeset_info(self, node_name):
+        nodeset_name = self._node_desc(node_name).nodeset
+        info = self.nodeset_table().get(nodeset_name)
+        if info is None:
+            raise Exception(f"nodeset {nodeset_name} not found")
+        return info
 
     def node_prefix(self, node_name=None):
         return self._node_desc(node_name).prefix
@@ -1455,15 +3019,12 @@ class Lookup:
         return int(self._node_desc(node_name).index)
 
     def node_nodeset(self, node_name=None):
-        nodeset_name = self.node_nodeset_name(node_name)
-        ns = self.cfg.nodeset.get(nodeset_name)
-        if ns:
-            return ns
-        return self.cfg.nodeset_tpu.get(nodeset_name)
+        info = self.nodeset_table().get(self.node_nodeset_name(node_name))
+        return info.nodeset if info is not None else None
 
     def node_is_tpu(self, node_name=None):
-        nodeset_name = self.node_nodeset_name(node_name)
-        return self.cfg.nodeset_tpu.get(nodeset_name) is not None
+        info = self.nodeset_table().get(self.node_nodeset_name(node_name))
+        return info is not None and info.tpu
 
     def chunk_tpu_nodes(self, tpu_nodes):
         model = tpu_nodes[0]
@@ -1471,17 +3032,16 @@ class Lookup:
         return chunked(tpu_nodes, n=tpu.vmcount)
 
     def node_template(self, node_name=None):
-        return self.node_nodeset(node_name).instance_template
+        return self._nodeset_info(node_name).template
 
     def node_template_info(self, node_name=None):
         return self.template_info(self.node_template(node_name))
 
     def node_region(self, node_name=None):
-        nodeset = self.node_nodeset(node_name)
-        return parse_self_link(nodeset.subnetwork).region
+        return self._nodeset_info(node_name).region
 
     def node_is_static(self, node_name=None):
-        nodeset = self.node_nodeset(node_name)
+        nodeset = self._nodeset_info(node_name).nodeset
         return self.node_index(node_name) < nodeset.node_count_static
 
     def nodeset_prefix(self, nodeset_name):
@@ -1510,69 +3070,79 @@ class Lookup:
 
     @lru_cache(maxsize=1)
     def static_nodelist(self):
-        static_nodesets = (
-            self.nodeset_lists(ns)[0]
-            for ns in chain(self.cfg.nodeset.values(), self.cfg.nodeset_tpu.values())
-        )
+        static_nodesets = (self.nodeset_lists(ns)[0] for ns in self._nodesets())
         return [static for static in static_nodesets if static is not None]
 
     @lru_cache(maxsize=None)
     def slurm_nodes(self):
-        StateTuple = namedtuple("StateTuple", "base,flags")
-
-        def make_node_tuple(node_line):
-            """turn node,state line to (node, StateTuple(state))"""
-            # state flags include: CLOUD, COMPLETING, DRAIN, FAIL, POWERED_DOWN,
-            #   POWERING_DOWN
-            node, fullstate = node_line.split(",")
-            state = fullstate.split("+")
-            state_tuple = StateTuple(state[0], set(state[1:]))
-            return (node, state_tuple)
-
-        cmd = (
-            f"{self.scontrol} show nodes | "
-            r"grep -oP '^NodeName=\K(\S+)|State=\K(\S+)' | "
-            r"paste -sd',\n'"
-        )
-        node_lines = run(cmd, shell=True).stdout.rstrip().splitlines()
-        nodes = {
-            node: state
-            for node, state in map(make_node_tuple, node_lines)
-            if "CLOUD" in state.flags or "DYNAMIC_NORM" in state.flags
-        }
+        """Slurm's cloud and dynamic nodes as SlurmNode records by name"""
+        cmd = [str(self.scontrol), "show", "nodes", "--oneliner"]
+        log_subproc.debug(f"run: {cmd}")
+        # stdout is parsed as it is read, stderr goes to a file so scontrol
+        # cannot block on a full stderr pipe meanwhile
+        with tempfile.TemporaryFile(mode="w+") as err, subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=err,
+            universal_newlines=True,
+        ) as proc:
+            nodes = {
+                node.name: node
+                for node in parse_slurm_nodes(proc.stdout)
+                if node.state_flags & (NodeFlag.CLOUD | NodeFlag.DYNAMIC_NORM)
+            }
+            proc.wait()
+            err.seek(0)
+            stderr = err.read()
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
         return nodes
 
     def slurm_node(self, nodename):
         return self.slurm_nodes().get(nodename)
 
-    def cloud_nodes(self):
-        static_nodes = []
-        dynamic_nodes = []
+    def nodeset_ranges(self, nodeset):
+        """Return static and dynamic nodes of a nodeset as HostRangeSets"""
+        prefix = f"{self.nodeset_prefix(nodeset.nodeset_name)}-"
+        static_count = nodeset.node_count_static or 0
+        dynamic_count = nodeset.node_count_dynamic_max or 0
+        static = HostRangeSet.from_ranges(prefix, [(0, static_count - 1)])
+        dynamic = HostRangeSet.from_ranges(
+            prefix, [(static_count, static_count + dynamic_count - 1)]
+        )
+        return static, dynamic
 
-        for nodeset in self.cfg.nodeset.values():
-            static, dynamic = self.nodeset_lists(nodeset)
-            if static is not None:
-                static_nodes.extend(to_hostnames(static))
-            if dynamic is not None:
-                dynamic_nodes.extend(to_hostnames(dynamic))
-        for nodeset in self.cfg.nodeset_tpu.values():
-            static, dynamic = self.nodeset_lists(nodeset)
-            if static is not None:
-                static_nodes.extend(to_hostnames(static))
-            if dynamic is not None:
-                dynamic_nodes.extend(to_hostnames(dynamic))
-        return static_nodes, dynamic_nodes
+    def _nodesets(self):
+        return chain(self.cfg.nodeset.values(), self.cfg.nodeset_tpu.values())
 
-    def filter_nodes(self, nodes):
-        static_nodes, dynamic_nodes = lkp.cloud_nodes()
+    @lru_cache(maxsize=1)
+    def static_nodeset(self):
+        """HostRangeSet of all static nodes"""
+        return reduce(
+            HostRangeSet.union,
+            (self.nodeset_ranges(ns)[0] for ns in self._nodesets()),
+            HostRangeSet(),
+        )
 
-        all_cloud_nodes = []
-        all_cloud_nodes.extend(static_nodes)
-        all_cloud_nodes.extend(dynamic_nodes)
+    @lru_cache(maxsize=1)
+    def cloud_nodes(self):
+        """HostRangeSets of all static and dynamic nodes"""
+        static_nodes = HostRangeSet()
+        dynamic_nodes = HostRangeSet()
+        for nodeset in self._nodesets():
+            static, dynamic = self.nodeset_ranges(nodeset)
+            static_nodes |= static
+            dynamic_nodes |= dynamic
+        return static_nodes, dynamic_nodes
 
-        cloud_nodes = list(set(nodes).intersection(all_cloud_nodes))
-        local_nodes = list(set(nodes).difference(all_cloud_nodes))
+    def filter_nodes(self, nodes):
+        """split nodes into cloud and local nodes, without expanding nodesets"""
+        static_nodes, dynamic_nodes = self.cloud_nodes()
+        all_cloud_nodes = static_nodes | dynamic_nodes
 
+        local_nodes, cloud_nodes = separate(
+            all_cloud_nodes.__contains__, list(dict.fromkeys(nodes))
+        )
         return cloud_nodes, local_nodes
 
     def tpu_instances(self):
@@ -1582,44 +3152,13 @@ class Lookup:
             res.extend(tpuobj.list_node_names())
         return res
 
-    @lru_cache(maxsize=1)
-    def instances(self, project=None, slurm_cluster_name=None):
-        slurm_cluster_name = slurm_cluster_name or self.cfg.slurm_cluster_name
-        project = project or self.project
-        instance_information_fields = [
-            "advancedMachineFeatures",
-            "cpuPlatform",
-            "creationTimestamp",
-            "disks",
-            "disks",
-            "fingerprint",
-            "guestAccelerators",
-            "hostname",
-            "id",
-            "kind",
-            "labelFingerprint",
-            "labels",
-            "lastStartTimestamp",
-            "lastStopTimestamp",
-            "lastSuspendedTimestamp",
-            "machineType",
-            "metadata",
-            "name",
-            "networkInterfaces",
-            "resourceStatus",
-            "scheduling",
-            "selfLink",
-            "serviceAccounts",
-            "shieldedInstanceConfig",
-            "shieldedInstanceIntegrityPolicy",
-            "sourceMachineImage",
-            "status",
-            "statusMessage",
-            "tags",
-            "zone",
-            # "deletionProtection",
-            # "startRestricted",
-        ]
+    def instance_fields(self, project=None, slurm_cluster_name=None, profile="full"):
+        """instance fields fetched by instances() for a field profile, with
+        the fields added by plugins
+        """
+        if profile not in INSTANCE_FIELD_PROFILES:
+            raise Exception(f"unknown instance field profile: {profile}")
+        instance_information_fields = list(INSTANCE_FIELD_PROFILES[profile])
         if lkp.cfg.enable_slurm_gcp_plugins:
             slurm_gcp_plugins.register_instance_information_fields(
                 lkp=lkp,
@@ -1627,54 +3166,293 @@ class Lookup:
                 slurm_cluster_name=slurm_cluster_name,
                 instance_information_fields=instance_information_fields,
             )
-        instance_information_fields = sorted(set(instance_information_fields))
-        instance_fields = ",".join(instance_information_fields)
-        fields = f"items.zones.instances({instance_fields}),nextPageToken"
+        return sorted(set(instance_information_fields))
+
+    @lru_cache(maxsize=1)
+    def cluster_zones(self):
+        """Zones the cluster's instances can be created in, from the nodesets'
+        zone_policy_allow, or None if that is not known for every nodeset.
+        """
+        if self.cfg.nodeset_dyn or not self.cfg.nodeset:
+            return None
+        zones = set()
+        for nodeset in self.cfg.nodeset.values():
+            if not nodeset.zone_policy_allow:
+                return None
+            zones.update(nodeset.zone_policy_allow)
+        return sorted(zones)
+
+    def instance_zones_path(self):
+        return self.inventory_dir / "instance_zones.cache"
+
+    def instance_zones(self, project, slurm_cluster_name):
+        """Zones to list the cluster's instances in: the nodesets' zones and
+        the zones the last aggregatedList found instances in, like the
+        controller's, login nodes' and zones removed from the nodesets. None
+        if the nodesets' zones are not known, or the last aggregatedList is
+        older than INSTANCE_ZONES_MAX_AGE.
+        """
+        zones = self.cluster_zones()
+        if zones is None:
+            return None
+        try:
+            found = json.loads(self.instance_zones_path().read_text())
+        except (OSError, ValueError):
+            return None
+        if (
+            found.get("project"),
+            found.get("slurm_cluster_name"),
+        ) != (
+            project,
+            slurm_cluster_name,
+        ) or time() - found.get("timestamp", 0) > INSTANCE_ZONES_MAX_AGE:
+            return None
+        return sorted(set(zones) | set(found["zones"]))
+
+    def save_instance_zones(self, project, slurm_cluster_name, instances, timestamp):
+        zones = {trim_self_link(inst["zone"]) for inst in instances if "zone" in inst}
+        content = {
+            "project": project,
+            "slurm_cluster_name": slurm_cluster_name,
+            "timestamp": timestamp,
+            "zones": sorted(zones),
+        }
+        try:
+            write_atomic(self.instance_zones_path(), json.dumps(content))
+        except OSError as e:
+            log.debug(f"failed to save instance zones: {e}")
+
+    def _list_instances(self, project, slurm_cluster_name, fields):
+        """List the cluster's instances, with only fields. If the zones the
+        cluster's instances are in are known, see instance_zones, they are
+        listed in parallel instead of using aggregatedList, which goes
+        through every zone of the project.
+        """
+        instance_fields = ",".join(fields)
         flt = f"labels.slurm_cluster_name={slurm_cluster_name} AND name:{slurm_cluster_name}-*"
         act = self.compute.instances()
-        op = act.aggregatedList(project=project, fields=fields, filter=flt)
+        zones = None
+        if project == self.project:
+            zones = self.instance_zones(project, slurm_cluster_name)
+
+        if zones is None:
+            timestamp = time()
+            fields = f"items.zones.instances({instance_fields}),nextPageToken"
+            op = act.aggregatedList(project=project, fields=fields, filter=flt)
+            instances = {}
+            while op is not None:
+                result = ensure_execute(op)
+                instances.update(
+                    (inst["name"], inst)
+                    for inst in chain.from_iterable(
+                        m["instances"] for m in result.get("items", {}).values()
+                    )
+                )
+                op = act.aggregatedList_next(op, result)
+            if project == self.project and self.cluster_zones() is not None:
+                self.save_instance_zones(
+                    project, slurm_cluster_name, instances.values(), timestamp
+                )
+            return instances
 
-        def properties(inst):
-            """change instance properties to a preferred format"""
-            inst["zoneLink"] = inst["zone"]
-            inst["zone"] = trim_self_link(inst["zone"])
-            inst["machineTypeLink"] = inst["machineType"]
-            inst["machineType"] = trim_self_link(inst["machineType"])
-            # metadata is fetched as a dict of dicts like:
-            # {'key': key, 'value': value}, kinda silly
-            metadata = {i["key"]: i["value"] for i in inst["metadata"].get("items", [])}
-            if "slurm_instance_role" not in metadata:
-                return None
-            inst["role"] = metadata["slurm_instance_role"]
-            inst["metadata"] = metadata
-            # del inst["metadata"]  # no need to store all the metadata
-            return NSDict(inst)
+        fields = f"items({instance_fields}),nextPageToken"
+
+        def list_zone(zone):
+            op = act.list(project=project, zone=zone, fields=fields, filter=flt)
+            zone_instances = []
+            while op is not None:
+                result = ensure_execute(op)
+                zone_instances.extend(result.get("items", []))
+                op = act.list_next(op, result)
+            return zone_instances
+
+        with ThreadPoolExecutor() as exe:
+            return {
+                inst["name"]: inst
+                for inst in chain.from_iterable(exe.map(list_zone, zones))
+            }
 
+    def inventory_path(self, profile, large_metadata=False):
+        if large_metadata:
+            return self.inventory_dir / f"instances.{profile}.large.cache"
+        return self.inventory_dir / f"instances.{profile}.cache"
+
+    def load_inventory(
+        self, project, slurm_cluster_name, fields, profile, large_metadata=False
+    ):
+        """the instance inventory snapshot of a field profile, if it was made
+        for the same project, cluster, fields and zones
+        """
+        path = self.inventory_path(profile, large_metadata)
+        try:
+            snapshot = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+        key = (
+            INVENTORY_VERSION,
+            project,
+            slurm_cluster_name,
+            fields,
+            self.cluster_zones(),
+        )
+        if (
+            snapshot.get("version"),
+            snapshot.get("project"),
+            snapshot.get("slurm_cluster_name"),
+            snapshot.get("fields"),
+            snapshot.get("zones"),
+        ) != key:
+            log.debug(f"discarding instance inventory {path}")
+            return None
+        return snapshot
+
+    def save_inventory(self, snapshot, profile, large_metadata=False):
+        """Save the snapshot, without large metadata values unless
+        large_metadata is set, so loading it stays cheap
+        """
+        if not large_metadata:
+            snapshot["instances"] = {
+                name: drop_large_metadata(inst)
+                for name, inst in snapshot["instances"].items()
+            }
+        try:
+            write_atomic(
+                self.inventory_path(profile, large_metadata), json.dumps(snapshot)
+            )
+        except OSError as e:
+            log.debug(f"failed to save instance inventory: {e}")
+
+    def refresh_inventory(self, snapshot, project, slurm_cluster_name, fields):
+        """Update the snapshot's instances. Only the fields that change when
+        an instance is created, started, stopped or relabeled are listed, and
+        just the instances that changed are fetched again.
+        """
+        timestamp = time()
+        current = self._list_instances(project, slurm_cluster_name, INVENTORY_FIELDS)
         instances = {}
-        while op is not None:
-            result = ensure_execute(op)
-            instance_iter = (
-                (inst["name"], properties(inst))
-                for inst in chain.from_iterable(
-                    m["instances"] for m in result.get("items", {}).values()
+        changed = []
+        for name, inst in current.items():
+            old = snapshot["instances"].get(name)
+            if old is not None and inventory_version(old) == inventory_version(inst):
+                instances[name] = old
+            else:
+                changed.append(inst)
+
+        if len(changed) > INVENTORY_MAX_CHANGED:
+            log.debug(f"{len(changed)} instances changed, listing all instances")
+            instances = self._list_instances(project, slurm_cluster_name, fields)
+        elif changed:
+            requests = {
+                inst["name"]: self.compute.instances().get(
+                    project=project,
+                    zone=trim_self_link(inst["zone"]),
+                    instance=inst["name"],
+                    fields=",".join(fields),
                 )
+                for inst in changed
+            }
+            done, failed = batch_execute(requests, compute=self.compute)
+            instances.update(done)
+            # not found are gone since they were listed
+            errors = [
+                exc
+                for _, exc in failed.values()
+                if getattr(getattr(exc, "resp", None), "status", None) != 404
+            ]
+            if errors:
+                log.debug(
+                    f"failed to get {len(errors)} changed instances, listing all instances: {errors[0]}"
+                )
+                instances = self._list_instances(project, slurm_cluster_name, fields)
+        log.debug(
+            f"refreshed instance inventory: {len(instances)} instances, {len(changed)} changed"
+        )
+        snapshot["instances"] = instances
+        snapshot["timestamp"] = timestamp
+        return snapshot
+
+    def instances(
+        self,
+        project=None,
+        slurm_cluster_name=None,
+        max_age=None,
+        profile="full",
+        large_metadata=False,
+    ):
+        """Instances of the cluster by name, with the fields of a profile in
+        INSTANCE_FIELD_PROFILES, from an inventory snapshot shared by all
+        scripts. The snapshot is refreshed if it is older than max_age seconds,
+        by default cfg.instance_inventory_max_age or 0. Large metadata values
+        are only kept with large_metadata.
+        """
+        # same cache entry however the arguments are given
+        return self._instances(
+            project or self.project,
+            slurm_cluster_name or self.cfg.slurm_cluster_name,
+            max_age,
+            profile,
+            large_metadata,
+        )
+
+    def clear_instances_cache(self):
+        self._instances.cache_clear()
+
+    @lru_cache(maxsize=8)
+    def _instances(self, project, slurm_cluster_name, max_age, profile, large_metadata):
+        if max_age is None:
+            max_age = self.cfg.get("instance_inventory_max_age", 0)
+        fields = self.instance_fields(project, slurm_cluster_name, profile)
+
+        snapshot = self.load_inventory(
+            project, slurm_cluster_name, fields, profile, large_metadata
+        )
+        stale = snapshot is not None and time() - snapshot["timestamp"] > max_age
+        if stale and profile in INVENTORY_INCREMENTAL_PROFILES:
+            snapshot = self.refresh_inventory(
+                snapshot, project, slurm_cluster_name, fields
             )
-            instances.update(
-                {name: props for name, props in instance_iter if props is not None}
-            )
-            op = act.aggregatedList_next(op, result)
-        return instances
+            self.save_inventory(snapshot, profile, large_metadata)
+        elif snapshot is None or stale:
+            timestamp = time()
+            snapshot = {
+                "version": INVENTORY_VERSION,
+                "project": project,
+                "slurm_cluster_name": slurm_cluster_name,
+                "fields": fields,
+                "zones": self.cluster_zones(),
+                "timestamp": timestamp,
+                "instances": self._list_instances(project, slurm_cluster_name, fields),
+            }
+            self.save_inventory(snapshot, profile, large_metadata)
 
-    def instance(self, instance_name, project=None, slurm_cluster_name=None):
+        instance_iter = (
+            (name, Instance.from_api(inst, large_metadata))
+            for name, inst in snapshot["instances"].items()
+        )
+        return {name: inst for name, inst in instance_iter if inst is not None}
+
+    def instance(
+        self,
+        instance_name,
+        project=None,
+        slurm_cluster_name=None,
+        max_age=None,
+        profile="full",
+        large_metadata=False,
+    ):
         instances = self.instances(
-            project=project, slurm_cluster_name=slurm_cluster_name
+            project=project,
+            slurm_cluster_name=slurm_cluster_name,
+            max_age=max_age,
+            profile=profile,
+            large_metadata=large_metadata,
         )
         return instances.get(instance_name)
 
     def describe_instance(self, instance_name, project=None, zone=None):
         project = project or self.project
         if zone is None:
-            self.instances.cache_clear()
+            self.clear_instances_cache()
             inst = self.instance(instance_name, project=project)
             if inst is None:
                 raise Exception(f"instance {instance_name} not found")
@@ -1686,55 +3464,143 @@ class Lookup:
         return NSDict(info)
 
     @lru_cache(maxsize=1)
-    def machine_types(self, project=None):
-        project = project or self.project
-        field_names = "name,zone,guestCpus,memoryMb,accelerators"
-        fields = f"items.zones.machineTypes({field_names}),nextPageToken"
+    def cluster_regions(self):
+        """Regions of the nodesets' subnetworks and zones"""
+        regions = set()
+        for nodeset in chain(self.cfg.nodeset.values(), self.cfg.nodeset_dyn.values()):
+            if nodeset.subnetwork:
+                regions.add(parse_self_link(nodeset.subnetwork).region)
+            regions.update(
+                zone.rsplit("-", 1)[0] for zone in nodeset.zone_policy_allow or []
+            )
+        return regions
+
+    def load_machine_types(self):
+        """The machine type catalog as {project: {name: {zone: entry}}},
+        without entries older than the TTL.
+        """
+        try:
+            catalog = json.loads(self.machine_type_cache_path.read_text())
+        except (OSError, ValueError):
+            return {}
+        if catalog.get("version") != MACHINE_TYPE_CACHE_VERSION:
+            return {}
+        ttl = self.cfg.get("machine_type_cache_ttl", MACHINE_TYPE_CACHE_TTL)
+        expired = time() - ttl
+        return {
+            project: {
+                name: {
+                    zone: entry
+                    for zone, entry in zones.items()
+                    if entry["fetched"] > expired
+                }
+                for name, zones in machines.items()
+            }
+            for project, machines in catalog["machine_types"].items()
+        }
+
+    @lru_cache(maxsize=1)
+    def machine_type_catalog(self):
+        return self.load_machine_types()
+
+    def save_machine_types(self, project, machines):
+        """Add machine types to the catalog. The file is merged with the
+        latest version on disk and atomically replaced, so concurrent writers
+        at worst drop each other's new entries, which are fetched again.
+        """
+        fetched = time()
+        on_disk = self.load_machine_types()
+        for catalog in (self.machine_type_catalog(), on_disk):
+            for machine in machines:
+                zones = catalog.setdefault(project, {}).setdefault(machine["name"], {})
+                zones[trim_self_link(machine["zone"])] = {
+                    "fetched": fetched,
+                    "machine": machine,
+                }
+        content = {"version": MACHINE_TYPE_CACHE_VERSION, "machine_types": on_disk}
+        try:
+            write_atomic(self.machine_type_cache_path, json.dumps(content))
+        except OSError as e:
+            log.warning(f"failed to save machine type catalog: {e}")
+
+    def fetch_machine_type(self, machine_type, project, zone=None):
+        """Get a machine type in zone, or else in the cluster's zones. If
+        those are unknown, list the machine type in all zones and keep the
+        zones in the cluster's regions.
+        """
+        from googleapiclient.errors import HttpError
 
-        machines = defaultdict(dict)
+        zones = [zone] if zone else self.cluster_zones() or []
+        for zone in zones:
+            try:
+                machine = ensure_execute(
+                    self.compute.machineTypes().get(
+                        project=project,
+                        zone=zone,
+                        machineType=machine_type,
+                        fields=MACHINE_TYPE_FIELDS,
+                    )
+                )
+                return [machine]
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+        if zones:
+            return []
+
+        machines = []
         act = self.compute.machineTypes()
-        op = act.aggregatedList(project=project, fields=fields)
+        op = act.aggregatedList(
+            project=project,
+            filter=f"name={machine_type}",
+            fields=f"items.zones.machineTypes({MACHINE_TYPE_FIELDS}),nextPageToken",
+        )
         while op is not None:
             result = ensure_execute(op)
-            machine_iter = chain.from_iterable(
-                m["machineTypes"]
-                for m in result["items"].values()
-                if "machineTypes" in m
+            machines.extend(
+                chain.from_iterable(
+                    m["machineTypes"]
+                    for m in result["items"].values()
+                    if "machineTypes" in m
+                )
             )
-            for machine in machine_iter:
-                name = machine["name"]
-                zone = machine["zone"]
-                machines[name][zone] = machine
-
             op = act.aggregatedList_next(op, result)
-        return machines
+        regions = self.cluster_regions()
+        local = [
+            machine
+            for machine in machines
+            if trim_self_link(machine["zone"]).rsplit("-", 1)[0] in regions
+        ]
+        return local or machines[:1]
 
     def machine_type(self, machine_type, project=None, zone=None):
-        """ """
+        """Machine type info from the catalog, filled by targeted gets"""
         custom_patt = re.compile(
             r"((?P<family>\w+)-)?custom-(?P<cpus>\d+)-(?P<mem>\d+)"
         )
         custom_match = custom_patt.match(machine_type)
-        if zone:
-            project = project or self.project
-            machine_info = ensure_execute(
-                self.compute.machineTypes().get(
-                    project=project, zone=zone, machineType=machine_type
-                )
-            )
-        elif custom_match is not None:
+        if not zone and custom_match is not None:
             groups = custom_match.groupdict()
             cpus, mem = (groups[k] for k in ["cpus", "mem"])
             machine_info = {
                 "guestCpus": int(cpus),
                 "memoryMb": int(mem),
             }
+            return NSDict(machine_info)
+
+        project = project or self.project
+        zones = self.machine_type_catalog().get(project, {}).get(machine_type, {})
+        if zone:
+            entry = zones.get(zone)
         else:
-            machines = self.machine_types(project=project)
-            machine_info = next(iter(machines[machine_type].values()), None)
-            if machine_info is None:
+            entry = next(iter(zones.values()), None)
+        if entry is None:
+            machines = self.fetch_machine_type(machine_type, project, zone=zone)
+            if not machines:
                 raise Exception(f"machine type {machine_type} not found")
-        return NSDict(machine_info)
+            self.save_machine_types(project, machines)
+            entry = {"machine": machines[0]}
+        return NSDict(entry["machine"])
 
     def template_machine_conf(self, template_link, project=None, zone=None):
         template = self.template_info(template_link)
@@ -1761,46 +3627,88 @@ class Lookup:
         machine_conf.memory = machine.memoryMb - (400 + (30 * gb))
         return machine_conf
 
-    @contextmanager
-    def template_cache(self, writeback=False):
-        flag = "c" if writeback else "r"
-        err = None
-        for wait in backoff_delay(0.125, timeout=60, count=20):
+    def template_cache_path(self, template_link):
+        # *.cache files are not committed or shipped in the devel zip
+        return self.template_cache_dir / f"{trim_self_link(template_link)}.cache"
+
+    def template_version(self, template_name, project):
+        """id and creation time of a template, which change if the template
+        is replaced by one with the same name
+        """
+        template = ensure_execute(
+            self.compute.instanceTemplates().get(
+                project=project,
+                instanceTemplate=template_name,
+                fields="id,creationTimestamp",
+            )
+        )
+        return template.get("id"), template.get("creationTimestamp")
+
+    def load_template_info(self, template_link, project):
+        """Template info from the cache, if it was saved for the same version
+        of the template. The version is checked at most once per check
+        interval, the file mtime is the time of the last check.
+        """
+        path = self.template_cache_path(template_link)
+        try:
+            entry = json.loads(path.read_text())
+            checked = path.stat().st_mtime
+        except (OSError, ValueError):
+            return None
+        if (
+            entry.get("cache_version") != TEMPLATE_CACHE_VERSION
+            or entry.get("link") != template_link
+        ):
+            return None
+        interval = self.cfg.get(
+            "template_cache_check_interval", TEMPLATE_CACHE_CHECK_INTERVAL
+        )
+        if time() - checked > interval:
+            version = self.template_version(trim_self_link(template_link), project)
+            if list(version) != entry.get("version"):
+                log.info(f"instance template {template_link} changed")
+                return None
             try:
-                cache = shelve.open(
-                    str(self.template_cache_path), flag=flag, writeback=writeback
-                )
-                break
-            except OSError as e:
-                err = e
-                log.debug(f"Failed to access template info cache: {e}")
-                sleep(wait)
-                continue
-        else:
-            # reached max_count of waits
-            raise Exception(f"Failed to access cache file. latest error: {err}")
+                os.utime(path)
+            except OSError:
+                # owned by another user, check again next time
+                pass
+        return NSDict(entry["info"])
+
+    def save_template_info(self, template_link, version, template):
+        """Atomically replace the cached template info, so readers never wait
+        on a lock or see a partial entry.
+        """
+        entry = {
+            "cache_version": TEMPLATE_CACHE_VERSION,
+            "link": template_link,
+            "version": list(version),
+            "info": template.to_dict(),
+        }
         try:
-            yield cache
-        finally:
-            cache.close()
+            if not self.template_cache_dir.exists():
+                self.template_cache_dir.mkdirp()
+                # cache should be owned by slurm
+                chown_slurm(self.template_cache_dir)
+            write_atomic(self.template_cache_path(template_link), json.dumps(entry))
+        except OSError as e:
+            log.warning(f"failed to save template info cache: {e}")
 
     @lru_cache(maxsize=None)
     def template_info(self, template_link, project=None):
         project = project or self.project
         template_name = trim_self_link(template_link)
-        # split read and write access to minimize write-lock. This might be a
-        # bit slower? TODO measure
-        if self.template_cache_path.exists():
-            with self.template_cache() as cache:
-                if template_name in cache:
-                    return NSDict(cache[template_name])
+        template = self.load_template_info(template_link, project)
+        if template is not None:
+            return template
 
         template = ensure_execute(
             self.compute.instanceTemplates().get(
                 project=project, instanceTemplate=template_name
             )
-        ).get("properties")
-        template = NSDict(template)
+        )
+        version = (template.get("id"), template.get("creationTimestamp"))
+        template = NSDict(template.get("properties"))
         # name and link are not in properties, so stick them in
         template.name = template_name
         template.link = template_link
@@ -1819,17 +3727,12 @@ class Lookup:
             template.gpu_type = None
             template.gpu_count = 0
 
-        # keep write access open for minimum time
-        with self.template_cache(writeback=True) as cache:
-            cache[template_name] = template.to_dict()
-        # cache should be owned by slurm
-        chown_slurm(self.template_cache_path)
-
+        self.save_template_info(template_link, version, template)
         return template
 
     def clear_template_info_cache(self):
-        with self.template_cache(writeback=True) as cache:
-            cache.clear()
+        for path in self.template_cache_dir.glob("*.cache"):
+            path.unlink(missing_ok=True)
         self.template_info.cache_clear()
 
     def nodeset_map(self, hostnames: list):
@@ -107,6 +107,13 @@ module "slurm_files" {
   enable_hybrid                      = var.enable_hybrid
   enable_slurm_gcp_plugins           = var.enable_slurm_gcp_plugins
   enable_bigquery_load               = var.enable_bigquery_load
+  enable_powerd                      = var.enable_powerd
+  resume_coalesce_window             = var.resume_coalesce_window
+  api_rate_limits                    = var.api_rate_limits
+  instance_inventory_max_age         = var.instance_inventory_max_age
+  template_cache_check_interval      = var.template_cache_check_interval
+  machine_type_cache_ttl             = var.machine_type_cache_ttl
+  placement_pool_size                = var.placement_pool_size
   epilog_scripts                     = var.epilog_scripts
   login_network_storage              = var.login_network_storage
   login_startup_scripts              = var.login_startup_scripts
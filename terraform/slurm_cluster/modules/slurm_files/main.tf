@@ -41,15 +41,22 @@ resource "random_uuid" "cluster_id" {
 
 locals {
   config = {
-    enable_slurm_gcp_plugins = var.enable_slurm_gcp_plugins
-    enable_bigquery_load     = var.enable_bigquery_load
-    cloudsql_secret          = var.cloudsql_secret
-    cluster_id               = random_uuid.cluster_id.result
-    project                  = var.project_id
-    slurm_cluster_name       = var.slurm_cluster_name
-    bucket_path              = local.bucket_path
-    enable_debug_logging     = var.enable_debug_logging
-    extra_logging_flags      = var.extra_logging_flags
+    enable_slurm_gcp_plugins      = var.enable_slurm_gcp_plugins
+    enable_bigquery_load          = var.enable_bigquery_load
+    enable_powerd                 = var.enable_powerd
+    resume_coalesce_window        = var.resume_coalesce_window
+    api_rate_limits               = var.api_rate_limits
+    instance_inventory_max_age    = var.instance_inventory_max_age
+    template_cache_check_interval = var.template_cache_check_interval
+    machine_type_cache_ttl        = var.machine_type_cache_ttl
+    placement_pool_size           = var.placement_pool_size
+    cloudsql_secret               = var.cloudsql_secret
+    cluster_id                    = random_uuid.cluster_id.result
+    project                       = var.project_id
+    slurm_cluster_name            = var.slurm_cluster_name
+    bucket_path                   = local.bucket_path
+    enable_debug_logging          = var.enable_debug_logging
+    extra_logging_flags           = var.extra_logging_flags
 
     # storage
     disable_default_mounts = var.disable_default_mounts
@@ -147,7 +154,7 @@ data "archive_file" "slurm_gcp_devel_zip" {
     "Pipfile",
     fileset(local.scripts_dir, "__pycache__/*"),
     fileset(local.scripts_dir, "*.log"),
-    fileset(local.scripts_dir, "*.cache"),
+    fileset(local.scripts_dir, "**/*.cache"),
     fileset(local.scripts_dir, "*.lock"),
   ])
 }
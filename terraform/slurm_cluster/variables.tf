@@ -453,6 +453,70 @@ EOD
   default     = false
 }
 
+variable "enable_powerd" {
+  description = <<EOD
+Enables slurm_powerd on the controller, a daemon that handles ResumeProgram and
+SuspendProgram requests, so API clients and caches are kept between them.
+EOD
+  type        = bool
+  default     = false
+}
+
+variable "resume_coalesce_window" {
+  description = <<EOD
+Seconds slurm_powerd waits for more resume requests to handle together with the
+first one. Requires enable_powerd.
+EOD
+  type        = number
+  default     = 0.5
+}
+
+variable "api_rate_limits" {
+  description = <<EOD
+Compute API requests per second by method group (read, mutate, operations),
+shared by all scripts on a host. Groups that are not set use the default rate.
+EOD
+  type        = map(number)
+  default     = {}
+}
+
+variable "instance_inventory_max_age" {
+  description = <<EOD
+Seconds a shared instance inventory snapshot is used before it is refreshed.
+0 refreshes it on every use.
+EOD
+  type        = number
+  default     = 0
+}
+
+variable "template_cache_check_interval" {
+  description = <<EOD
+Seconds a cached instance template is used before checking that it was not
+replaced.
+EOD
+  type        = number
+  default     = 300
+}
+
+variable "machine_type_cache_ttl" {
+  description = <<EOD
+Seconds the cached machine type catalog is used before machine types are
+fetched again.
+EOD
+  type        = number
+  default     = 86400
+}
+
+variable "placement_pool_size" {
+  description = <<EOD
+Number of free placement policies slurmsync keeps in each region with
+placement enabled nodesets, for resume to use instead of creating one per job.
+0 disables the pool.
+EOD
+  type        = number
+  default     = 0
+}
+
 variable "cloud_parameters" {
   description = "cloud.conf options."
   type = object({